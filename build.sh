@@ -9,6 +9,11 @@ pip install -r requirements.txt
 # Convert static asset files
 python manage.py collectstatic --no-input
 
+# Pre-generate the OpenAPI schema served at /swagger.json and /swagger.yaml
+mkdir -p schema
+python manage.py generate_swagger schema/swagger.json --overwrite
+python manage.py generate_swagger schema/swagger.yaml --overwrite
+
 # Apply any outstanding database migrations
 python manage.py migrate
 
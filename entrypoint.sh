@@ -1,8 +1,17 @@
 #!/bin/bash
 
 python manage.py collectstatic --no-input
+echo "Generating API schema..."
+mkdir -p schema
+python manage.py generate_swagger schema/swagger.json --overwrite
+python manage.py generate_swagger schema/swagger.yaml --overwrite
 echo "Running migrations..."
 python manage.py migrate
 python manage.py auto_createsuperuser
 echo "Starting server..."
-python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
+if [ "$DEBUG" = "True" ]; then
+    python manage.py runserver 0.0.0.0:8000
+else
+    # Preloaded workers and connection settings: see gunicorn.conf.py
+    exec gunicorn online_poll_system_backend.wsgi:application
+fi
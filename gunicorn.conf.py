@@ -0,0 +1,50 @@
+"""
+Gunicorn settings for serving in production, read from the working directory:
+
+    gunicorn online_poll_system_backend.wsgi:application
+
+The app is loaded and warmed up once in the master, then workers are forked with
+it already in memory. Each worker serves GUNICORN_THREADS requests at a time and
+connects to the database after the fork (see DB_POOL_* in settings).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Requests mostly wait on Postgres and Redis, so threads keep a worker busy;
+# DB_POOL_MAX_SIZE should be at least this
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+preload_app = True
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = 30
+keepalive = 5
+# Replace workers now and then so slow memory growth can't build up; the jitter
+# keeps them from restarting all at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded and before any worker exists
+    from online_poll_system_backend.warmup import warm_up
+    warm_up()
+
+
+def post_fork(server, worker):
+    # Database connections and pools must never be shared with the master
+    from django.db import connections
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    from online_poll_system_backend.warmup import open_connections
+    open_connections()
+
+
+def worker_exit(server, worker):
+    # Also on max_requests recycling: trend scores are buffered per worker
+    from polls.trending import flush_at_exit
+    flush_at_exit()
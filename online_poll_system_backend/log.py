@@ -0,0 +1,118 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from django.utils.functional import SimpleLazyObject
+import atexit
+import json
+import logging
+import os
+import random
+import time
+
+# (request, start time) of the request being handled by the current thread/task
+current_request = ContextVar("current_request", default=None)
+
+# Attributes copied from the record into the JSON output when present
+CONTEXT_FIELDS = ("event", "request_id", "route", "method", "poll_id", "user_id", "latency_ms", "status")
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line.
+    """
+
+    def format(self, record):
+        payload = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Attach id, route, user and elapsed time of the current request to the record.
+    Runs on the request thread, before the record is queued.
+    """
+
+    def filter(self, record):
+        context = current_request.get()
+        if context is None:
+            return True
+
+        request, started = context
+        match = getattr(request, "resolver_match", None)
+        record.request_id = getattr(request, "request_id", None)
+        record.route = match.route if match else request.path
+        record.method = request.method
+        record.latency_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        # Don't force the lazy session user to load; DRF replaces it once authenticated
+        user = getattr(request, "user", None)
+        if user is not None and not isinstance(user, SimpleLazyObject) and user.is_authenticated:
+            record.user_id = str(user.pk)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of high-volume records, selected by their `event` extra.
+    Warnings and errors are never dropped.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates or {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "event", None))
+        return rate is None or random.random() < rate
+
+
+class QueueListenerHandler(QueueHandler):
+    """
+    Hand records to a background thread that runs the real (blocking) handlers.
+    """
+
+    def __init__(self, handlers, respect_handler_level=True):
+        super().__init__(SimpleQueue())
+        # Index access makes dictConfig resolve the cfg:// handler references
+        handlers = [handlers[i] for i in range(len(handlers))]
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=respect_handler_level)
+        self.listener.start()
+        atexit.register(self.close)
+        # Threads don't survive a fork: workers forked from a preloaded gunicorn
+        # master would queue records that nothing ever writes
+        os.register_at_fork(after_in_child=self._restart_listener)
+
+    def _restart_listener(self):
+        if self.listener is None:
+            return
+        # Records still queued in the parent are the parent's to write
+        self.queue = SimpleQueue()
+        self.listener = QueueListener(self.queue, *self.listener.handlers,
+                                      respect_handler_level=self.listener.respect_handler_level)
+        self.listener.start()
+
+    def prepare(self, record):
+        # The listener runs in this process, so the record is queued as is and
+        # the message is only formatted on the listener thread
+        return record
+
+    def close(self):
+        # Writes out what is still queued before the handlers are closed
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
@@ -0,0 +1,23 @@
+from .log import current_request
+import time
+import uuid
+
+
+class RequestContextMiddleware:
+    """
+    Expose the current request to logging filters for the duration of the request.
+    Each request gets an id, logged with its records and sent in `X-Request-ID`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.request_id = uuid.uuid4().hex
+        token = current_request.set((request, time.perf_counter()))
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        response["X-Request-ID"] = request.request_id
+        return response
@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import condition, require_safe
+from rest_framework import permissions
+from drf_yasg.views import get_schema_view
+from drf_yasg import openapi
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+api_info = openapi.Info(
+   title="Online Poll System API",
+   default_version='v1',
+   description="APIs for managing poll creation, voting, and real-time result computation for an Online Poll System app.",
+   terms_of_service="https://www.google.com/policies/terms/",
+   contact=openapi.Contact(email="kabgnestor@gmail.com"),
+   license=openapi.License(name="KGN License"),
+)
+
+schema_view = get_schema_view(
+   api_info,
+   public=True,
+   permission_classes=(permissions.AllowAny,),
+)
+
+# Runtime generation, only used when DEBUG is on and no schema file exists
+schema_fallback_view = schema_view.without_ui(cache_timeout=0)
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "yaml": "application/yaml",
+}
+
+# Loaded schema files keyed by path: (mtime, content, etag)
+_schema_files = {}
+
+
+def schema_file_path(format):
+    return os.path.join(settings.OPENAPI_SCHEMA_DIR, f"swagger.{format}")
+
+
+def load_schema_file(format):
+    """
+    Return (content, etag) for the pre-generated schema, or None if it is missing.
+    The file is read once and only re-read when its mtime changes.
+    """
+    path = schema_file_path(format)
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+    cached = _schema_files.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, "rb") as schema_file:
+            content = schema_file.read()
+        cached = (mtime, content, hashlib.md5(content).hexdigest())
+        _schema_files[path] = cached
+    return cached[1], cached[2]
+
+
+def _schema_etag(request, format):
+    schema = load_schema_file(format.lstrip("."))
+    return schema[1] if schema else None
+
+
+@require_safe
+@condition(etag_func=_schema_etag)
+def schema_file_view(request, format):
+    """
+    Serve the schema generated at build time by `generate_swagger`.
+    Falls back to generating it per request only when DEBUG is on.
+    """
+    extension = format.lstrip(".")
+    if extension not in CONTENT_TYPES:
+        raise Http404("Unsupported schema format.")
+
+    schema = load_schema_file(extension)
+    if schema is None:
+        if settings.DEBUG:
+            return schema_fallback_view(request, format=format)
+        logger.error("OpenAPI schema file %s not found, run generate_swagger.", schema_file_path(extension))
+        raise Http404("API schema has not been generated.")
+
+    response = HttpResponse(schema[0], content_type=CONTENT_TYPES[extension])
+    response["Cache-Control"] = "public, max-age=300"
+    return response
@@ -0,0 +1,75 @@
+"""
+Helpers shared by the apps' test suites.
+"""
+from contextlib import contextmanager
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from polls.models import Poll, Vote
+from polls.sharding import group_by_shard
+
+User = get_user_model()
+
+TEST_PASSWORD = "correct-horse-battery"
+
+# Fast hashing for seeded accounts; the budgets count queries, not CPU
+FAST_PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
+
+
+def seed_data(users=40, polls=30, votes_per_poll=25):
+    """
+    Create a realistically sized data set: every poll has `votes_per_poll` votes
+    from distinct users, spread over its options. Returns (users, polls).
+    """
+    accounts = [User(email=f"user{i}@example.com", first_name=f"User{i}") for i in range(users)]
+    for account in accounts:
+        account.set_password(TEST_PASSWORD)
+    accounts = User.objects.bulk_create(accounts)
+
+    created = []
+    for i in range(polls):
+        created.append(Poll.objects.create(
+            owner=accounts[i % users],
+            title=f"Poll {i}",
+            options=["red", "green", "blue", "yellow"],
+        ))
+
+    for alias, polls_on_shard in group_by_shard(created).items():
+        Vote.objects.using(alias).bulk_create([
+            Vote(poll=poll, voter=voter, option=poll.options[n % len(poll.options)])
+            for poll in polls_on_shard
+            for n, voter in enumerate(accounts[:votes_per_poll])
+        ])
+    return accounts, created
+
+
+class QueryBudgetMixin:
+    """
+    `with self.assertQueryBudget(queries, rows):` fails when the block runs more
+    SQL queries, or serializes more model instances, than budgeted. The failure
+    message lists every query that ran.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, max_rows=None):
+        rows = []
+        to_representation = serializers.ModelSerializer.to_representation
+
+        def counting_to_representation(serializer, instance):
+            rows.append(instance)
+            return to_representation(serializer, instance)
+
+        with CaptureQueriesContext(connection) as context, mock.patch.object(
+            serializers.ModelSerializer, "to_representation", counting_to_representation
+        ):
+            yield
+
+        if len(context) > max_queries:
+            queries = "\n".join(
+                f"{number}. {query['sql']}" for number, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(f"{len(context)} queries executed, budget is {max_queries}:\n{queries}")
+        if max_rows is not None and len(rows) > max_rows:
+            self.fail(f"{len(rows)} rows serialized, budget is {max_rows}.")
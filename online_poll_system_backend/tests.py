@@ -0,0 +1,182 @@
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from .log import JSONFormatter, QueueListenerHandler, RequestContextFilter, SamplingFilter
+from .middleware import RequestContextMiddleware
+from unittest import mock
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import uuid
+import warnings
+
+User = get_user_model()
+
+
+def make_record(level=logging.INFO, **extra):
+    logger = logging.getLogger("polls.views")
+    return logger.makeRecord(logger.name, level, __file__, 1, "Voted on %s", ("poll",), None, extra=extra)
+
+
+class JSONFormatterTests(SimpleTestCase):
+    def test_fields(self):
+        record = make_record(event="vote_cast", poll_id=uuid.UUID(int=1), status=None, colour="blue")
+
+        payload = json.loads(JSONFormatter().format(record))
+
+        self.assertEqual(set(payload), {"time", "level", "logger", "message", "event", "poll_id"})
+        self.assertEqual((payload["level"], payload["logger"], payload["message"]), ("INFO", "polls.views", "Voted on poll"))
+        # Non-JSON values are written as strings
+        self.assertEqual(payload["poll_id"], str(uuid.UUID(int=1)))
+
+    def test_exceptions_are_included(self):
+        try:
+            raise ValueError("broken")
+        except ValueError:
+            record = make_record(logging.ERROR)
+            record.exc_info = sys.exc_info()
+        payload = json.loads(JSONFormatter().format(record))
+        self.assertIn("ValueError: broken", payload["exc_info"])
+
+
+class SamplingFilterTests(SimpleTestCase):
+    def test_only_sampled_events_below_warning_are_dropped(self):
+        sampling = SamplingFilter({"vote_cast": 0.25})
+        with mock.patch("online_poll_system_backend.log.random.random", side_effect=[0.2, 0.3]):
+            self.assertTrue(sampling.filter(make_record(event="vote_cast")))
+            self.assertFalse(sampling.filter(make_record(event="vote_cast")))
+        with mock.patch("online_poll_system_backend.log.random.random", return_value=0.99):
+            self.assertTrue(sampling.filter(make_record(logging.WARNING, event="vote_cast")))
+            self.assertTrue(sampling.filter(make_record(event="poll_deleted")))
+            self.assertTrue(sampling.filter(make_record()))
+
+    def test_rate_is_kept_on_average(self):
+        sampling = SamplingFilter({"vote_cast": 0.1})
+        with mock.patch("online_poll_system_backend.log.random", random.Random(0)):
+            kept = sum(sampling.filter(make_record(event="vote_cast")) for _ in range(10000))
+        self.assertAlmostEqual(kept / 10000, 0.1, delta=0.01)
+
+
+class RequestContextFilterTests(SimpleTestCase):
+    def test_records_carry_the_current_request(self):
+        user = User(user_id=uuid.UUID(int=7), email="user@example.com")
+        records = []
+
+        def view(request):
+            request.user = user
+            records.append(make_record())
+            RequestContextFilter().filter(records[-1])
+            return HttpResponse()
+
+        request = RequestFactory().post("/api/polls/")
+        response = RequestContextMiddleware(view)(request)
+
+        [record] = records
+        self.assertEqual(record.request_id, response["X-Request-ID"])
+        self.assertEqual(len(record.request_id), 32)
+        self.assertEqual((record.route, record.method, record.user_id), ("/api/polls/", "POST", str(user.pk)))
+        self.assertGreaterEqual(record.latency_ms, 0)
+
+        # Nothing is attached once the response is out
+        after = make_record()
+        RequestContextFilter().filter(after)
+        for field in ("request_id", "route", "user_id", "latency_ms"):
+            self.assertFalse(hasattr(after, field))
+
+    def test_anonymous_requests_have_no_user(self):
+        def view(request):
+            records.append(make_record())
+            RequestContextFilter().filter(records[-1])
+            return HttpResponse()
+
+        records = []
+        RequestContextMiddleware(view)(RequestFactory().get("/api/stats/"))
+        self.assertFalse(hasattr(records[0], "user_id"))
+        self.assertIsNotNone(records[0].request_id)
+
+
+class QueueListenerHandlerTests(SimpleTestCase):
+    def test_forked_children_write_their_records(self):
+        with tempfile.TemporaryFile(mode="w+") as output:
+            handler = QueueListenerHandler([logging.StreamHandler(output)])
+            self.addCleanup(handler.close)
+            with warnings.catch_warnings():
+                # Forking with the listener thread running is the point
+                warnings.simplefilter("ignore", DeprecationWarning)
+                pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    if not handler.listener._thread.is_alive():
+                        raise AssertionError("No listener thread in the child")
+                    handler.handle(logging.makeLogRecord({"msg": "from the child", "levelno": logging.INFO}))
+                    handler.close()
+                    status = 0
+                finally:
+                    os._exit(status)
+
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+            handler.handle(logging.makeLogRecord({"msg": "from the parent", "levelno": logging.INFO}))
+            handler.close()
+            output.seek(0)
+            self.assertEqual(sorted(output.read().splitlines()), ["from the child", "from the parent"])
+
+
+class SchemaFileTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.schema_dir = directory.name
+        settings_override = override_settings(OPENAPI_SCHEMA_DIR=self.schema_dir, DEBUG=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.url = reverse("schema-json", kwargs={"format": ".json"})
+
+    def write_schema(self, content):
+        path = os.path.join(self.schema_dir, "swagger.json")
+        with open(path, "w") as schema_file:
+            schema_file.write(content)
+        # A distinct mtime per write, as two writes can share a timestamp
+        self.mtime = getattr(self, "mtime", 0) + 1
+        os.utime(path, (self.mtime, self.mtime))
+
+    def test_serves_the_file_with_an_etag(self):
+        self.write_schema('{"swagger": "2.0"}')
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response["Cache-Control"], "public, max-age=300")
+        self.assertEqual(response.content, b'{"swagger": "2.0"}')
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        self.write_schema('{"swagger": "2.0", "info": {}}')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_missing_file_is_not_found(self):
+        with self.assertLogs("online_poll_system_backend.schema", "ERROR") as logs:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+        self.assertIn(os.path.join(self.schema_dir, "swagger.json"), logs.records[0].getMessage())
+
+    def test_missing_file_is_generated_with_debug(self):
+        with self.settings(DEBUG=True):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("/polls/", json.loads(response.content)["paths"])
+        self.assertNotIn("ETag", response)
+
+    def test_unsupported_format_is_not_found(self):
+        self.assertEqual(self.client.get(reverse("schema-json", kwargs={"format": ".xml"})).status_code, 404)
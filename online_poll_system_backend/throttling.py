@@ -0,0 +1,158 @@
+"""
+Token-bucket rate limits kept in the shared cache.
+
+A bucket holds up to `burst` tokens and refills at `rate`; a request takes one.
+On Redis every check is a single script call, so all the buckets of a request
+are read, refilled and charged atomically in one round trip. Other cache
+backends fall back to a per-process lock, which is only exact for locmem.
+"""
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+import hashlib
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# KEYS are the buckets; ARGV is now, cost, then the rate and burst of each bucket.
+# Tokens are only taken when every bucket has enough, so a refused request costs nothing.
+# Returns the seconds until the request would be allowed, "0" when it was.
+TOKEN_BUCKET_LUA = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local need = math.max(cost, 1)
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[1 + 2 * i])
+    local burst = tonumber(ARGV[2 + 2 * i])
+    local state = redis.call('HMGET', key, 'tokens', 'at')
+    local level = tonumber(state[1]) or burst
+    local at = tonumber(state[2]) or now
+    level = math.min(burst, level + math.max(0, now - at) * rate)
+    if level < need then
+        wait = math.max(wait, (need - level) / rate)
+    end
+    levels[i] = level
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[1 + 2 * i])
+    local burst = tonumber(ARGV[2 + 2 * i])
+    local level = levels[i]
+    if wait == 0 then
+        level = level - cost
+    end
+    redis.call('HSET', key, 'tokens', level, 'at', now)
+    redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+end
+return tostring(wait)
+"""
+
+_lock = threading.Lock()
+_script = None
+
+
+def parse_rate(rate):
+    """
+    Tokens per second for a rate like "30/min", "10/hour" or "5/s".
+    """
+    count, period = rate.split("/")
+    return int(count) / UNITS[period[0]]
+
+
+def _take_redis(cache, buckets, cost, now):
+    global _script
+    keys = [cache.make_and_validate_key(key) for key, _, _ in buckets]
+    client = cache._cache.get_client(keys[0], write=True)
+    if _script is None:
+        _script = client.register_script(TOKEN_BUCKET_LUA)
+    args = [now, cost] + [value for _, rate, burst in buckets for value in (rate, burst)]
+    return float(_script(keys=keys, args=args, client=client))
+
+
+def _take_local(cache, buckets, cost, now):
+    need = max(cost, 1)
+    with _lock:
+        levels = []
+        wait = 0
+        for key, rate, burst in buckets:
+            level, at = cache.get(key) or (burst, now)
+            level = min(burst, level + max(0, now - at) * rate)
+            if level < need:
+                wait = max(wait, (need - level) / rate)
+            levels.append(level)
+        for (key, rate, burst), level in zip(buckets, levels):
+            if wait == 0:
+                level -= cost
+            cache.set(key, (level, now), timeout=math.ceil(burst / rate) + 1)
+    return wait
+
+
+def take(buckets, cost=1):
+    """
+    Take `cost` tokens from every (key, rate, burst) bucket, or none if any of them
+    is short. A cost of 0 only checks that a token is left. Returns the seconds
+    to wait before retrying, 0 when allowed.
+    """
+    if not buckets:
+        return 0
+    buckets = [(key, parse_rate(rate), burst) for key, rate, burst in buckets]
+    now = time.time()
+    # The backend itself: django.core.cache.cache is a proxy to it
+    cache = caches[DEFAULT_CACHE_ALIAS]
+    if isinstance(cache, RedisCache):
+        return _take_redis(cache, buckets, cost, now)
+    return _take_local(cache, buckets, cost, now)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Limits write requests to views with a `throttle_scope` listed in THROTTLE_BUCKETS,
+    per user ("user" bucket, authenticated requests) and per client IP ("ip" bucket).
+    """
+
+    def allow_request(self, request, view):
+        self.wait_seconds = 0
+        scope = getattr(view, "throttle_scope", None)
+        limits = settings.THROTTLE_BUCKETS.get(scope)
+        if not limits or request.method in SAFE_METHODS:
+            return True
+
+        buckets = []
+        if "user" in limits and request.user.is_authenticated:
+            buckets.append((f"throttle:{scope}:user:{request.user.pk}", *limits["user"]))
+        if "ip" in limits:
+            buckets.append((f"throttle:{scope}:ip:{self.get_ident(request)}", *limits["ip"]))
+
+        self.wait_seconds = take(buckets)
+        if self.wait_seconds:
+            logger.warning("Throttled %s %s from %s", request.method, request.path, self.get_ident(request),
+                           extra={"event": "throttled"})
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def _login_failure_bucket(email):
+    # Emails can hold characters cache keys can't
+    digest = hashlib.md5(email.lower().encode()).hexdigest()
+    return [(f"throttle:login-failures:{digest}", *settings.LOGIN_FAILURE_BUCKET)]
+
+
+def login_failure_wait(email):
+    """
+    Seconds until `email` may try to log in again, 0 while it has attempts left.
+    """
+    return take(_login_failure_bucket(email), cost=0)
+
+
+def record_login_failure(email):
+    take(_login_failure_bucket(email))
@@ -17,29 +17,15 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.views.generic.base import RedirectView
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
-
-schema_view = get_schema_view(
-   openapi.Info(
-      title="Online Poll System API",
-      default_version='v1',
-      description="APIs for managing poll creation, voting, and real-time result computation for an Online Poll System app.",
-      terms_of_service="https://www.google.com/policies/terms/",
-      contact=openapi.Contact(email="kabgnestor@gmail.com"),
-      license=openapi.License(name="KGN License"),
-   ),
-   public=True,
-   permission_classes=(permissions.AllowAny,),
-)
+from .schema import schema_view, schema_file_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', RedirectView.as_view(pattern_name='schema-swagger-ui', permanent=False)),
     path('api/', include("polls.urls")),
     path('api/auth/', include("users.urls")),
-    path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
+    path('api/stats/', include("stats.urls")),
+    path('swagger<format>/', schema_file_view, name='schema-json'),
     path('api/docs/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
@@ -0,0 +1,54 @@
+"""
+Start-up work a process would otherwise do lazily on its first requests.
+"""
+from django.db import connections
+from django.urls import URLPattern, URLResolver, get_resolver
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _views(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _views(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield getattr(pattern.callback, "cls", None)
+
+
+def warm_up():
+    """
+    Import every URLconf, view and serializer and build the URL resolver, DRF and
+    simplejwt settings and serializer fields. Doesn't touch the database, so it
+    is safe in a gunicorn master before workers are forked.
+    """
+    started = time.perf_counter()
+    resolver = get_resolver()
+    resolver.reverse_dict  # Imports all urls and views modules and builds the reverse lookup
+
+    # DRF and simplejwt import the classes named in their settings on first access
+    for name in ("DEFAULT_AUTHENTICATION_CLASSES", "DEFAULT_PERMISSION_CLASSES", "DEFAULT_THROTTLE_CLASSES",
+                 "DEFAULT_RENDERER_CLASSES", "DEFAULT_PARSER_CLASSES", "DEFAULT_CONTENT_NEGOTIATION_CLASS"):
+        getattr(api_settings, name)
+    jwt_settings.AUTH_TOKEN_CLASSES
+
+    # ModelSerializer fields are built from the models the first time they're used
+    serializers = {getattr(view, "serializer_class", None) for view in _views(resolver.url_patterns)}
+    for serializer_class in serializers - {None}:
+        serializer_class().fields
+
+    logger.info("Warm-up done in %.0f ms", (time.perf_counter() - started) * 1000, extra={"event": "warm_up"})
+
+
+def open_connections():
+    """
+    Connect this process to every database, filling the connection pools up to
+    their minimum size, so the first requests don't wait for it.
+    """
+    for connection in connections.all():
+        connection.ensure_connection()
+        # Hands pooled connections back; persistent ones stay open
+        connection.close_if_unusable_or_obsolete()
@@ -1,7 +1,187 @@
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.auth import get_user_model
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 from .models import Poll, Vote
+from .sharding import db_for_poll, shard_aliases
+from urllib.parse import parse_qsl
+import json
+import uuid
 
-class PollAdmin(admin.ModelAdmin):
+User = get_user_model()
+
+SHARD_VAR = "shard"
+
+
+def requested_shard(request):
+    """
+    The shard a changelist shows, `?shard=<alias>`, or the first one.
+    """
+    alias = request.GET.get(SHARD_VAR)
+    return alias if alias in shard_aliases() else shard_aliases()[0]
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Use the planner's row estimate instead of an exact COUNT(*) for big result sets.
+    Exact counts are only run when the estimate is below `threshold`.
+    """
+    threshold = 100_000
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+        if connection.vendor == "postgresql":
+            sql, params = query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = plan[0]["Plan"]["Plan Rows"]
+            if estimate >= self.threshold:
+                return estimate
+        return super().count
+
+class InputFilter(admin.ListFilter):
+    """
+    Filter on a value typed into the sidebar. A regular related or choice filter
+    lists every distinct value, which takes a scan of the whole table.
+    """
+    template = "admin/polls/input_filter.html"
+    parameter_name = None
+    lookup = None
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        if self.parameter_name in params:
+            self.used_parameters[self.parameter_name] = params.pop(self.parameter_name)[-1].strip()
+
+    def value(self):
+        return self.used_parameters.get(self.parameter_name)
+
+    def clean(self, value):
+        return value
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.parameter_name]
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            return queryset.filter(**{self.lookup: self.clean(self.value())})
+        except (ValueError, ValidationError) as exc:
+            raise IncorrectLookupParameters(exc)
+
+    def choices(self, changelist):
+        others = changelist.get_query_string(remove=[self.parameter_name, PAGE_VAR])
+        yield {
+            "value": self.value() or "",
+            "parameter_name": self.parameter_name,
+            # The other filters, search and ordering, kept as hidden fields
+            "query_parts": parse_qsl(others.lstrip("?")),
+            "clear_query_string": others,
+        }
+
+class ShardFilter(admin.SimpleListFilter):
+    """
+    Picks the shard a changelist reads (see ShardedModelAdmin.get_queryset).
+    """
+    title = "shard"
+    parameter_name = SHARD_VAR
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in shard_aliases()]
+
+    def has_output(self):
+        return len(self.lookup_choices) > 1
+
+    def queryset(self, request, queryset):
+        return queryset
+
+    def choices(self, changelist):
+        current = self.value() if self.value() in shard_aliases() else shard_aliases()[0]
+        for alias, title in self.lookup_choices:
+            yield {
+                "selected": alias == current,
+                "query_string": changelist.get_query_string({self.parameter_name: alias}, [PAGE_VAR]),
+                "display": title,
+            }
+
+class OwnerFilter(InputFilter):
+    title = "owner email"
+    parameter_name = "owner"
+    lookup = "owner__in"
+
+    def clean(self, value):
+        # Users are only on `default`; polls on other shards can't join them
+        return list(User.objects.filter(email=value).values_list("pk", flat=True))
+
+class PollIdFilter(InputFilter):
+    title = "poll ID"
+    parameter_name = "poll"
+    lookup = "poll_id"
+
+    def clean(self, value):
+        return uuid.UUID(value)
+
+class OptionFilter(InputFilter):
+    title = "option"
+    parameter_name = "option"
+    lookup = "option"
+
+class ShardedModelAdmin(admin.ModelAdmin):
+    """
+    Changelists read one shard at a time, picked in the sidebar. Users live on
+    `default` only, so elsewhere `user_fields` are prefetched from there instead
+    of joined. Change and delete views look the object up on its own shard.
+    """
+    user_fields = ()
+
+    def get_list_filter(self, request):
+        return (ShardFilter, *super().get_list_filter(request))
+
+    def get_queryset(self, request):
+        alias = requested_shard(request)
+        queryset = super().get_queryset(request).using(alias)
+        if alias != "default" and self.user_fields:
+            queryset = queryset.prefetch_related(*self.user_fields)
+        return queryset
+
+    def get_list_select_related(self, request):
+        select_related = super().get_list_select_related(request)
+        if requested_shard(request) == "default":
+            return select_related
+        return tuple(field for field in select_related if field not in self.user_fields)
+
+    def get_object_shards(self, object_id):
+        return shard_aliases()
+
+    def get_object(self, request, object_id, from_field=None):
+        # Links from a changelist don't carry the shard
+        queryset = self.get_queryset(request)
+        field = self.model._meta.pk if from_field is None else self.model._meta.get_field(from_field)
+        try:
+            object_id = field.to_python(object_id)
+        except ValidationError:
+            return None
+        for alias in self.get_object_shards(object_id):
+            obj = queryset.using(alias).filter(**{field.name: object_id}).first()
+            if obj is not None:
+                return obj
+        return None
+
+class PollAdmin(ShardedModelAdmin):
     list_display = (
         "title",
         "owner",
@@ -10,25 +190,52 @@ class PollAdmin(admin.ModelAdmin):
         "is_expired",
         "total_votes",
     )
-    list_filter = ("created_at", "expires_at", "owner")
+    list_filter = ("created_at", "expires_at", OwnerFilter)
+    list_select_related = ("owner",)
+    autocomplete_fields = ("owner",)
     search_fields = ("title", "description")
     ordering = ("-created_at",)
     readonly_fields = ("total_votes", "is_expired")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    user_fields = ("owner",)
+
+    def get_object_shards(self, object_id):
+        return [db_for_poll(object_id)]
+
+    def get_queryset(self, request):
+        # Correlated subquery so votes are only counted for the polls on the page
+        vote_count = (
+            Vote.objects.filter(poll=OuterRef("pk"))
+            .order_by()
+            .values("poll")
+            .annotate(count=Count("*"))
+            .values("count")
+        )
+        return super().get_queryset(request).annotate(_total_votes=Coalesce(Subquery(vote_count), 0))
 
     def total_votes(self, obj):
-        return obj.votes.count()
+        if hasattr(obj, "_total_votes"):
+            return obj._total_votes
+        return obj.votes.count() if obj.pk else 0
     total_votes.short_description = "Votes"
+    total_votes.admin_order_field = "_total_votes"
 
-class VoteAdmin(admin.ModelAdmin):
+class VoteAdmin(ShardedModelAdmin):
     list_display = (
         "poll",
         "voter",
         "option",
         "created_at",
     )
-    list_filter = ("created_at", "option", "poll")
+    list_filter = ("created_at", OptionFilter, PollIdFilter)
+    list_select_related = ("poll", "voter")
+    autocomplete_fields = ("poll", "voter")
     search_fields = ("poll__title", "option")
     ordering = ("-created_at",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    user_fields = ("voter",)
 
 admin.site.register(Poll, PollAdmin)
-admin.site.register(Vote, VoteAdmin)
\ No newline at end of file
+admin.site.register(Vote, VoteAdmin)
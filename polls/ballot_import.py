@@ -0,0 +1,189 @@
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from online_poll_system_backend.uuids import UUID7_SQL
+from stats.counters import increment
+from .cache import invalidate_poll
+from .ledger import EVENT_TABLE
+from .models import Vote, VoteEvent
+from .sharding import db_for_poll
+from . import trending
+import csv
+import json
+
+User = get_user_model()
+
+STAGING_TABLE = "polls_ballot_import"
+VOTERS_TABLE = "polls_ballot_import_voters"
+
+# Emails looked up per query when matching voters to accounts
+VOTER_LOOKUP_BATCH = 1000
+
+# archive_votes refuses new votes for the polls it is moving with a CHECK constraint
+# until their archive partition is attached, usually within a minute
+CHECK_VIOLATION = "23514"
+ARCHIVING_RETRY_AFTER = 60
+
+
+class BallotImportError(Exception):
+    pass
+
+
+class PollArchivingError(BallotImportError):
+    """The poll's votes are being moved to an archive partition; retry later."""
+    retry_after = ARCHIVING_RETRY_AFTER
+
+
+def read_ballots(lines, jsonl=False):
+    """
+    Yield one dict per ballot from CSV (with a header row) or JSONL text lines.
+    Ballots have "voter" (the voter's email), "option" and an optional "timestamp".
+    """
+    if jsonl:
+        for line in lines:
+            if line.strip():
+                ballot = json.loads(line)
+                if not isinstance(ballot, dict):
+                    raise ValueError("Each JSONL line must be an object.")
+                yield ballot
+    else:
+        yield from csv.DictReader(lines)
+
+
+def _staged_rows(poll, ballots, rejected):
+    # Options and the voting window are checked here, once per file, in Python.
+    # JSONL values can be of any type; only strings are accepted.
+    now = timezone.now()
+    closes_at = min(poll.expires_at, now) if poll.expires_at else now
+
+    for ballot in ballots:
+        voter = ballot.get("voter")
+        voter = User.objects.normalize_email(voter.strip()) if isinstance(voter, str) else None
+        if not voter:
+            rejected["invalid_voter"] += 1
+            continue
+        # Matched like options sent to the vote API, and stored as the poll spells them
+        index = poll.option_index(ballot.get("option"))
+        if index is None:
+            rejected["invalid_option"] += 1
+            continue
+        option = poll.options[index]
+
+        timestamp = ballot.get("timestamp")
+        if isinstance(timestamp, str) and timestamp:
+            try:
+                cast_at = parse_datetime(timestamp)
+            except ValueError:
+                cast_at = None
+            if cast_at is not None and timezone.is_naive(cast_at):
+                cast_at = timezone.make_aware(cast_at)
+        elif timestamp:
+            cast_at = None
+        else:
+            cast_at = now
+        if cast_at is None or not poll.created_at <= cast_at <= closes_at:
+            rejected["invalid_timestamp"] += 1
+            continue
+
+        yield voter, option, cast_at
+
+
+def _voter_ids(emails):
+    """
+    {email: user_id} of the registered users among `emails`. Users live on
+    `default`, which need not be the poll's shard, so they can't be joined in SQL.
+    """
+    voters = {}
+    for start in range(0, len(emails), VOTER_LOOKUP_BATCH):
+        batch = emails[start:start + VOTER_LOOKUP_BATCH]
+        voters.update(User.objects.filter(email__in=batch).values_list("email", "pk"))
+    return voters
+
+
+def import_ballots(poll, ballots):
+    """
+    Load `ballots` (see read_ballots) into `poll` in a single transaction.
+
+    Rows are streamed with COPY into a temporary staging table on the poll's shard
+    and merged into polls_vote with one INSERT ... SELECT. Ballots from unknown voters, voters who
+    already voted and repeated voters (only their earliest ballot counts) are rejected.
+    Returns {"accepted": n, "rejected": n, "rejected_reasons": {...}}.
+    """
+    if poll.is_ranked:
+        raise BallotImportError("Ballot import only supports single-choice polls.")
+
+    rejected = {"invalid_voter": 0, "invalid_option": 0, "invalid_timestamp": 0, "unknown_voter": 0, "duplicate": 0}
+    vote_table = Vote._meta.db_table
+    alias = db_for_poll(poll.poll_id)
+
+    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {STAGING_TABLE} "
+            f"(voter text NOT NULL, option text NOT NULL, created_at timestamptz NOT NULL) ON COMMIT DROP"
+        )
+        staged = 0
+        with cursor.copy(f"COPY {STAGING_TABLE} (voter, option, created_at) FROM STDIN") as copy:
+            for row in _staged_rows(poll, ballots, rejected):
+                copy.write_row(row)
+                staged += 1
+
+        cursor.execute(f"SELECT DISTINCT voter FROM {STAGING_TABLE}")
+        voters = _voter_ids([email for email, in cursor.fetchall()])
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {VOTERS_TABLE} (email text PRIMARY KEY, user_id uuid NOT NULL) ON COMMIT DROP"
+        )
+        with cursor.copy(f"COPY {VOTERS_TABLE} (email, user_id) FROM STDIN") as copy:
+            for row in voters.items():
+                copy.write_row(row)
+
+        cursor.execute(
+            f"SELECT count(*) FROM {STAGING_TABLE} s "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {VOTERS_TABLE} u WHERE u.email = s.voter)"
+        )
+        rejected["unknown_voter"] = cursor.fetchone()[0]
+
+        # DISTINCT ON keeps each voter's earliest ballot; ON CONFLICT skips voters
+        # who already have a vote on this poll (uq_one_vote_per_user_per_poll).
+        # Each accepted vote gets its ledger event in the same statement.
+        try:
+            cursor.execute(
+                f"""
+                WITH inserted AS (
+                    INSERT INTO {vote_table} (vote_id, poll_id, voter_id, option, created_at)
+                    SELECT {UUID7_SQL}, %s, voter_id, option, created_at
+                    FROM (
+                        SELECT DISTINCT ON (u.user_id) u.user_id AS voter_id, s.option, s.created_at
+                        FROM {STAGING_TABLE} s JOIN {VOTERS_TABLE} u ON u.email = s.voter
+                        ORDER BY u.user_id, s.created_at
+                    ) ballots
+                    ON CONFLICT (voter_id, poll_id) DO NOTHING
+                    RETURNING voter_id, option, created_at
+                ), recorded AS (
+                    INSERT INTO {EVENT_TABLE} (event_id, kind, poll_id, voter_id, option, at)
+                    SELECT {UUID7_SQL}, %s, %s, voter_id, array_position(%s::text[], option::text) - 1, created_at
+                    FROM inserted
+                )
+                SELECT created_at FROM inserted
+                """,
+                [poll.poll_id, VoteEvent.VOTE_CAST, poll.poll_id, poll.options],
+            )
+        except IntegrityError as error:
+            if getattr(error.__cause__, "sqlstate", None) != CHECK_VIOLATION:
+                raise
+            raise PollArchivingError(
+                "The poll's votes are being archived; try the import again in a minute."
+            ) from error
+        accepted = [created_at for created_at, in cursor.fetchall()]
+        rejected["duplicate"] = staged - rejected["unknown_voter"] - len(accepted)
+
+        # Raw inserts send no post_save signals, so the tallies are updated here
+        increment(votes=len(accepted))
+        invalidate_poll(poll.poll_id)
+
+    trending.record_votes(poll.poll_id, accepted)
+    return {
+        "accepted": len(accepted),
+        "rejected": sum(rejected.values()),
+        "rejected_reasons": rejected,
+    }
@@ -0,0 +1,186 @@
+from collections import OrderedDict, deque
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.http import HttpResponse, JsonResponse
+import hashlib
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Opens when too many of the last BREAKER_WINDOW requests failed with a database
+    error or spent more than BREAKER_SLOW_SECONDS in queries. While open, requests
+    are not sent to the database. After BREAKER_OPEN_SECONDS one request at a time
+    is let through as a probe; it closes the breaker or opens it again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.state = CLOSED
+            self.outcomes = deque(maxlen=settings.BREAKER_WINDOW)  # True for a failed or slow request
+            self.opened_at = None
+            self.probing = False
+
+    def retry_after(self):
+        """
+        Seconds until the next probe may be let through.
+        """
+        if self.opened_at is None:
+            return 0
+        return max(0, math.ceil(self.opened_at + settings.BREAKER_OPEN_SECONDS - time.monotonic()))
+
+    def allow_request(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.probing or self.retry_after() > 0:
+                return False
+            self.state = HALF_OPEN
+            self.probing = True
+            return True
+
+    def record(self, failed):
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.probing = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self.opened_at = None
+                    self.outcomes.clear()
+                    logger.warning("Database circuit breaker closed", extra={"event": "breaker_closed"})
+                return
+
+            self.outcomes.append(failed)
+            if (
+                self.state == CLOSED
+                and len(self.outcomes) >= settings.BREAKER_MIN_REQUESTS
+                and sum(self.outcomes) / len(self.outcomes) >= settings.BREAKER_FAILURE_RATE
+            ):
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+        logger.warning("Database circuit breaker opened", extra={"event": "breaker_opened"})
+
+
+class StaleResponseStore:
+    """
+    Last good GET responses of this process, least recently used evicted first.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, content, content_type):
+        with self.lock:
+            self.entries[key] = (content, content_type, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.BREAKER_STALE_ENTRIES:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+breaker = CircuitBreaker()
+stale_responses = StaleResponseStore()
+
+
+def stale_key(request):
+    # Responses can depend on the user, so the credentials are part of the key
+    credentials = request.META.get("HTTP_AUTHORIZATION", "")
+    return hashlib.md5(f"{request.get_full_path()}|{credentials}".encode()).hexdigest()
+
+
+def unavailable_response():
+    response = JsonResponse(
+        {"message": "The service is temporarily overloaded, please retry shortly."}, status=503
+    )
+    response["Retry-After"] = str(max(1, breaker.retry_after()))
+    return response
+
+
+def stale_response(key):
+    entry = stale_responses.get(key)
+    if entry is None:
+        return None
+    content, content_type, stored_at = entry
+    response = HttpResponse(content, content_type=content_type)
+    response["X-Stale"] = "true"
+    response["Age"] = str(int(time.time() - stored_at))
+    return response
+
+
+class DatabaseTimer:
+    """
+    connection.execute_wrapper that adds up the time spent in queries, on every database.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+class CircuitBreakerMixin:
+    """
+    Guard a view's database work with the breaker. While it's open, GET requests
+    are answered with the last good response (marked `X-Stale` with its `Age`) and
+    other requests with 503 and `Retry-After`.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        is_read = request.method == "GET"
+        key = stale_key(request) if is_read else None
+
+        if not breaker.allow_request():
+            return (is_read and stale_response(key)) or unavailable_response()
+
+        timer = DatabaseTimer()
+        try:
+            with ExitStack() as wrappers:
+                for connection in connections.all():
+                    wrappers.enter_context(connection.execute_wrapper(timer))
+                response = super().dispatch(request, *args, **kwargs)
+        except OperationalError:
+            logger.exception("Database error on %s %s", request.method, request.path)
+            breaker.record(failed=True)
+            return (is_read and stale_response(key)) or unavailable_response()
+
+        breaker.record(failed=timer.seconds > settings.BREAKER_SLOW_SECONDS)
+        if is_read and response.status_code == 200:
+            response.render()
+            stale_responses.set(key, response.content, response["Content-Type"])
+        return response
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import NotAcceptable
+import hashlib
+
+# Cached responses embed a version number in their key; bumping the version
+# makes every older entry for that poll (or for the poll lists) unreachable.
+LIST_SCOPE = "list"
+
+
+def _version_key(scope):
+    return f"response-version:{scope}"
+
+
+def _get_version(scope):
+    return cache.get_or_set(_version_key(scope), 1, timeout=None)
+
+
+def _bump_version(scope):
+    try:
+        cache.incr(_version_key(scope))
+    except ValueError:
+        cache.set(_version_key(scope), 2, timeout=None)
+
+
+def invalidate_poll(poll_id, using=None):
+    """
+    Drop cached responses of one poll (detail and votes) once the current transaction commits.
+    """
+    transaction.on_commit(lambda: _bump_version(str(poll_id)), using=using)
+
+
+def invalidate_poll_list(using=None):
+    transaction.on_commit(lambda: _bump_version(LIST_SCOPE), using=using)
+
+
+def is_cacheable(request):
+    # Only anonymous reads share responses; JWT requests carry an Authorization header
+    return request.method == "GET" and "HTTP_AUTHORIZATION" not in request.META
+
+
+class AnonymousResponseCacheMixin:
+    """
+    Serve anonymous GET requests from the shared cache.
+
+    Views define `get_cache_scope(**kwargs)`, returning a poll_id for pages of a
+    single poll or LIST_SCOPE for list pages, which are microcached. Scopes must
+    match what invalidate_poll is called with; None leaves the response uncached.
+    """
+
+    def get_cache_scope(self, **kwargs):
+        raise NotImplementedError
+
+    def get_cache_format(self, request, *args, **kwargs):
+        """
+        The renderer format (json, api) dispatch will negotiate, None when nothing is acceptable.
+        """
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        try:
+            renderer, _ = self.perform_content_negotiation(self.initialize_request(request, *args, **kwargs))
+        except NotAcceptable:
+            return None
+        return renderer.format
+
+    def dispatch(self, request, *args, **kwargs):
+        scope = self.get_cache_scope(**kwargs) if is_cacheable(request) else None
+        renderer_format = self.get_cache_format(request, *args, **kwargs) if scope is not None else None
+        if renderer_format is None:
+            response = super().dispatch(request, *args, **kwargs)
+            patch_vary_headers(response, ["Authorization"])
+            return response
+
+        scope = str(scope)
+        path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        # Browsers negotiate the HTML browsable API on the same URL
+        key = f"response:{scope}:{_get_version(scope)}:{renderer_format}:{path_hash}"
+
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            response["X-Cache"] = "HIT"
+            patch_vary_headers(response, ["Accept"])
+        else:
+            response = super().dispatch(request, *args, **kwargs)
+            # Stale copies served by the circuit breaker are never shared; for the rest,
+            # self.request is the DRF request, authenticated by now
+            if response.status_code == 200 and "X-Stale" not in response and not self.request.user.is_authenticated:
+                response.render()
+                timeout = (
+                    settings.RESPONSE_CACHE_LIST_TIMEOUT if scope == LIST_SCOPE
+                    else settings.RESPONSE_CACHE_TIMEOUT
+                )
+                cache.set(key, (response.content, response["Content-Type"]), timeout)
+            response["X-Cache"] = "MISS"
+
+        patch_vary_headers(response, ["Authorization"])
+        return response
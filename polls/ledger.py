@@ -0,0 +1,337 @@
+"""
+The vote event ledger (VoteEvent): appending events, and folding them back into
+the polls and votes they describe.
+
+Folding keeps the last poll event of each poll and the last vote event of each
+voter on a poll. Polls whose last event is a delete are gone with their votes.
+The fold runs in SQL on the poll's shard, one range of poll IDs at a time, so
+ranges can be replayed or verified in parallel.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+from online_poll_system_backend.uuids import UUID7_SQL, uuid7_floor
+from .models import Poll, PollTrend, Vote, VoteEvent
+from . import trending
+import uuid
+
+EVENT_TABLE = VoteEvent._meta.db_table
+POLLS_TABLE = "polls_ledger_polls"
+VOTES_TABLE = "polls_ledger_votes"
+TRENDS_TABLE = "polls_ledger_trends"
+
+# Sorts before and after every event, for replaying an empty ledger and folding all of it
+NO_EVENTS = uuid.UUID(int=0)
+ALL_EVENTS = uuid.UUID(int=2 ** 128 - 1)
+
+# A range replayed while trends are flushed to it is tried again from a new snapshot
+REPLAY_ATTEMPTS = 5
+SERIALIZATION_FAILURE = "40001"
+
+# Trend scores are log-space floats summed in a different order than the live updates
+TREND_TOLERANCE = 1e-6
+
+
+def record_poll(poll, kind, using):
+    VoteEvent.objects.using(using).create(
+        kind=kind,
+        poll_id=poll.poll_id,
+        open_ended=None if kind == VoteEvent.POLL_DELETED else poll.expires_at is None,
+        at=timezone.now(),
+    )
+
+
+def record_vote(vote, using):
+    options = vote.poll.options
+    VoteEvent.objects.using(using).create(
+        kind=VoteEvent.VOTE_CAST,
+        poll_id=vote.poll_id,
+        voter_id=vote.voter_id,
+        option=options.index(vote.option) if vote.option in options else None,
+        ranking=vote.ranking,
+        at=vote.created_at,
+    )
+
+
+def record_deleted_votes(cursor, table, where, params=()):
+    """
+    Append a "vote deleted" event for every row of `table` (polls_vote, or a
+    table with its columns) matching `where`, in the cursor's transaction.
+    Returns the IDs of the polls that lost votes.
+    """
+    cursor.execute(
+        f"WITH recorded AS ("
+        f"INSERT INTO {EVENT_TABLE} (event_id, kind, poll_id, voter_id, at) "
+        f"SELECT {UUID7_SQL}, %s, poll_id, voter_id, now() FROM {table} WHERE {where} "
+        f"RETURNING poll_id"
+        f") SELECT DISTINCT poll_id FROM recorded",
+        [VoteEvent.VOTE_DELETED, *params],
+    )
+    return [poll_id for poll_id, in cursor.fetchall()]
+
+
+def latest_event(alias):
+    return VoteEvent.objects.using(alias).order_by("-event_id").values_list("event_id", flat=True).first()
+
+
+def _range_sql(start, end, watermark=None):
+    conditions, params = ["TRUE"], []
+    if start is not None:
+        conditions.append("poll_id >= %s")
+        params.append(start)
+    if end is not None:
+        conditions.append("poll_id < %s")
+        params.append(end)
+    if watermark is not None:
+        conditions.append("event_id <= %s")
+        params.append(watermark)
+    return " AND ".join(conditions), params
+
+
+def plan_ranges(alias, count, watermark=None):
+    """
+    Split the polls on `alias` into at most `count` [start, end) ranges of poll
+    IDs holding about as many ledger events each. None bounds are open.
+    """
+    where, params = _range_sql(None, None, watermark)
+    fractions = [i / count for i in range(1, count)]
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            f"SELECT percentile_disc(%s::float8[]) WITHIN GROUP (ORDER BY poll_id) FROM {EVENT_TABLE} WHERE {where}",
+            [fractions, *params],
+        )
+        bounds = sorted(set(cursor.fetchone()[0] or []))
+    return list(zip([None, *bounds], [*bounds, None]))
+
+
+def fold(cursor, start=None, end=None, watermark=None, settled_before=ALL_EVENTS):
+    """
+    Fold the events of the polls in [start, end), up to `watermark` if given,
+    into two temporary tables dropped at commit: polls_ledger_polls (poll_id,
+    open_ended, votes, score, settled_score) with the live polls, their vote
+    count and trend score (NULL without votes), the latter also counting only
+    votes recorded before the event ID `settled_before`, and polls_ledger_votes
+    (poll_id, voter_id, event_id, option, ranking, at) with their votes.
+    """
+    where, params = _range_sql(start, end, watermark)
+    # Still there if an outer transaction spans several ranges
+    cursor.execute(f"DROP TABLE IF EXISTS {VOTES_TABLE}, {POLLS_TABLE}")
+    cursor.execute(
+        f"""
+        CREATE TEMPORARY TABLE {VOTES_TABLE} ON COMMIT DROP AS
+        SELECT poll_id, voter_id, event_id, option, ranking, at FROM (
+            SELECT DISTINCT ON (poll_id, voter_id) poll_id, voter_id, event_id, kind, option, ranking, at
+            FROM {EVENT_TABLE} WHERE kind IN (%s, %s) AND {where}
+            ORDER BY poll_id, voter_id, event_id DESC
+        ) latest
+        WHERE kind = %s
+        """,
+        [VoteEvent.VOTE_CAST, VoteEvent.VOTE_DELETED, *params, VoteEvent.VOTE_CAST],
+    )
+    # Same log-sum-exp of vote weights as polls.trending, summed per poll, with
+    # the same clamp against exp() underflow
+    cursor.execute(
+        f"""
+        CREATE TEMPORARY TABLE {POLLS_TABLE} ON COMMIT DROP AS
+        SELECT p.poll_id, p.open_ended, count(v.w) AS votes,
+               max(v.top) + ln(sum(exp(greatest(v.w - v.top, %s)))) AS score,
+               max(v.top) + ln(sum(exp(greatest(v.w - v.top, %s))) FILTER (WHERE v.event_id < %s)) AS settled_score
+        FROM (
+            SELECT DISTINCT ON (poll_id) poll_id, kind, open_ended
+            FROM {EVENT_TABLE} WHERE kind IN (%s, %s, %s) AND {where}
+            ORDER BY poll_id, event_id DESC
+        ) p
+        LEFT JOIN (
+            SELECT poll_id, event_id, w, max(w) OVER (PARTITION BY poll_id) AS top
+            FROM (
+                SELECT poll_id, event_id, %s * (extract(epoch FROM at)::float8 - %s) AS w FROM {VOTES_TABLE}
+            ) weights
+        ) v USING (poll_id)
+        WHERE p.kind <> %s
+        GROUP BY p.poll_id, p.open_ended
+        """,
+        [trending.MIN_EXPONENT, trending.MIN_EXPONENT, settled_before,
+         VoteEvent.POLL_CREATED, VoteEvent.POLL_UPDATED, VoteEvent.POLL_DELETED, *params,
+         trending.decay_rate(), trending.EPOCH.timestamp(), VoteEvent.POLL_DELETED],
+    )
+    cursor.execute(
+        f"DELETE FROM {VOTES_TABLE} v WHERE NOT EXISTS (SELECT 1 FROM {POLLS_TABLE} p WHERE p.poll_id = v.poll_id)"
+    )
+    # Temporary tables are never analyzed automatically
+    cursor.execute(f"ANALYZE {POLLS_TABLE}, {VOTES_TABLE}")
+
+
+def unflushed_for():
+    """
+    How long votes can stay buffered in a process before their trends are
+    flushed (polls.trending), with a margin for the flush itself.
+    """
+    return timedelta(seconds=2 * settings.TRENDING_FLUSH_INTERVAL)
+
+
+def _live_counts(cursor):
+    cursor.execute(f"SELECT count(*), count(*) FILTER (WHERE open_ended), coalesce(sum(votes), 0) FROM {POLLS_TABLE}")
+    polls, open_ended_polls, votes = cursor.fetchone()
+    return {"polls": polls, "open_ended_polls": open_ended_polls, "votes": int(votes)}
+
+
+def replay_range(alias, start, end, watermark):
+    """
+    Rebuild the trends of the polls in [start, end) on `alias`, and return
+    their live poll, open-ended poll and vote counts, from the ledger up to
+    `watermark`. Votes cast after the watermark stay in the trends, and votes
+    other processes still buffer are dropped when they flush (polls.trending).
+    """
+    connection = connections[alias]
+    outermost = not connection.in_atomic_block
+    for attempt in range(1, REPLAY_ATTEMPTS + 1):
+        try:
+            return _replay_range(connection, start, end, watermark, outermost)
+        except OperationalError as exc:
+            retry = outermost and getattr(exc.__cause__, "sqlstate", None) == SERIALIZATION_FAILURE
+            if not retry or attempt == REPLAY_ATTEMPTS:
+                raise
+
+
+def _replay_range(connection, start, end, watermark, outermost):
+    where, params = _range_sql(start, end)
+    trend_table, poll_table = PollTrend._meta.db_table, Poll._meta.db_table
+    # Before the snapshot: every vote buffered before this committed before it
+    replayed_at = timezone.now()
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        if outermost:
+            # The fold, the later votes and the trends written all come from one
+            # snapshot; a trend flushed after it fails the replay of the range
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        # Flushes wait until the new scores and replayed_at are committed
+        cursor.execute(f"SELECT 1 FROM {trend_table} WHERE {where} FOR UPDATE", params)
+        fold(cursor, start, end, watermark)
+        # Votes cast since the watermark are in the live trends, which don't
+        # subtract deleted votes either
+        cursor.execute(f"DROP TABLE IF EXISTS {TRENDS_TABLE}")
+        cursor.execute(
+            f"""
+            CREATE TEMPORARY TABLE {TRENDS_TABLE} ON COMMIT DROP AS
+            SELECT poll_id, max(top) + ln(sum(exp(greatest(w - top, %s)))) AS score
+            FROM (
+                SELECT poll_id, w, max(w) OVER (PARTITION BY poll_id) AS top FROM (
+                    SELECT poll_id, score AS w FROM {POLLS_TABLE} WHERE score IS NOT NULL
+                    UNION ALL
+                    SELECT poll_id, %s * (extract(epoch FROM at)::float8 - %s) FROM {EVENT_TABLE}
+                    WHERE kind = %s AND event_id > %s AND {where}
+                ) weights
+            ) ranked
+            GROUP BY poll_id
+            """,
+            [trending.MIN_EXPONENT, trending.decay_rate(), trending.EPOCH.timestamp(), VoteEvent.VOTE_CAST,
+             watermark, *params],
+        )
+        cursor.execute(
+            f"DELETE FROM {trend_table} t WHERE {where} AND NOT EXISTS "
+            f"(SELECT 1 FROM {TRENDS_TABLE} l WHERE l.poll_id = t.poll_id)",
+            params,
+        )
+        # Only polls still in the database can have a trend
+        cursor.execute(
+            f"INSERT INTO {trend_table} (poll_id, score, replayed_at, updated_at) "
+            f"SELECT l.poll_id, l.score, %s, now() FROM {TRENDS_TABLE} l JOIN {poll_table} USING (poll_id) "
+            f"ON CONFLICT (poll_id) DO UPDATE SET score = EXCLUDED.score, replayed_at = EXCLUDED.replayed_at, "
+            f"updated_at = EXCLUDED.updated_at",
+            [replayed_at],
+        )
+        return _live_counts(cursor)
+
+
+def _checks(where, params):
+    poll_table, vote_table, trend_table = Poll._meta.db_table, Vote._meta.db_table, PollTrend._meta.db_table
+    return {
+        "missing_polls": (
+            f"SELECT l.poll_id FROM {POLLS_TABLE} l "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {poll_table} p WHERE p.poll_id = l.poll_id)",
+            [],
+        ),
+        "unrecorded_polls": (
+            f"SELECT p.poll_id FROM {poll_table} p "
+            f"WHERE {where} AND NOT EXISTS (SELECT 1 FROM {POLLS_TABLE} l WHERE l.poll_id = p.poll_id)",
+            params,
+        ),
+        "changed_polls": (
+            f"SELECT poll_id FROM {POLLS_TABLE} l JOIN {poll_table} p USING (poll_id) "
+            f"WHERE l.open_ended IS DISTINCT FROM (p.expires_at IS NULL)",
+            [],
+        ),
+        "missing_votes": (
+            f"SELECT l.poll_id, l.voter_id FROM {VOTES_TABLE} l WHERE NOT EXISTS "
+            f"(SELECT 1 FROM {vote_table} v WHERE v.poll_id = l.poll_id AND v.voter_id = l.voter_id)",
+            [],
+        ),
+        "unrecorded_votes": (
+            f"SELECT v.poll_id, v.voter_id FROM {vote_table} v WHERE {where} AND NOT EXISTS "
+            f"(SELECT 1 FROM {VOTES_TABLE} l WHERE l.poll_id = v.poll_id AND l.voter_id = v.voter_id)",
+            params,
+        ),
+        "changed_votes": (
+            f"SELECT poll_id, voter_id FROM {VOTES_TABLE} l "
+            f"JOIN {vote_table} v USING (poll_id, voter_id) JOIN {poll_table} p USING (poll_id) "
+            f"WHERE p.options[l.option + 1] IS DISTINCT FROM v.option OR l.ranking IS DISTINCT FROM v.ranking",
+            [],
+        ),
+        # Recent votes may still be buffered, so trends only have to count the settled ones
+        "trends": (
+            f"SELECT poll_id FROM "
+            f"(SELECT l.poll_id, l.score, l.settled_score FROM {POLLS_TABLE} l JOIN {poll_table} USING (poll_id) "
+            f"WHERE l.score IS NOT NULL) l "
+            f"FULL JOIN (SELECT poll_id, score FROM {trend_table} WHERE {where}) t USING (poll_id) "
+            f"WHERE l.score IS NULL OR (t.score IS NULL AND l.settled_score IS NOT NULL) "
+            f"OR t.score < l.settled_score - {TREND_TOLERANCE} OR t.score > l.score + {TREND_TOLERANCE}",
+            params,
+        ),
+    }
+
+
+def verify_range(alias, start, end, limit=10):
+    """
+    Compare the ledger of the polls in [start, end) on `alias` with their polls,
+    votes and trends. Returns the live counts and {check: (total, first rows)}
+    for every check that found discrepancies.
+    """
+    where, params = _range_sql(start, end)
+    connection = connections[alias]
+    outermost = not connection.in_atomic_block
+    with transaction.atomic(using=alias), connection.cursor() as cursor:
+        if outermost:
+            # One snapshot for the ledger and the tables; votes commit with their events
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        fold(cursor, start, end, settled_before=uuid7_floor(timezone.now() - unflushed_for()))
+        found = {}
+        for name, (query, query_params) in _checks(where, params).items():
+            cursor.execute(f"SELECT count(*) OVER (), * FROM ({query}) found LIMIT %s", [*query_params, limit])
+            rows = cursor.fetchall()
+            if rows:
+                found[name] = (rows[0][0], [row[1:] for row in rows])
+        return _live_counts(cursor), found
+
+
+def _in_thread(function, *args):
+    try:
+        return function(*args)
+    finally:
+        # Each worker thread opened its own connections
+        connections.close_all()
+
+
+def run_parallel(function, tasks, workers):
+    """
+    Yield function(*task) for each task, in order, running `workers` at a time
+    on threads. With one worker everything runs on the calling thread.
+    """
+    if workers == 1:
+        for task in tasks:
+            yield function(*task)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_in_thread, function, *task) for task in tasks]
+        for future in futures:
+            yield future.result()
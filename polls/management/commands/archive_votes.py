@@ -0,0 +1,241 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.utils import timezone
+from polls.ledger import record_deleted_votes
+from polls.models import Poll, Vote
+from polls.ranked import forget_polls
+from polls.sharding import shard_aliases
+from stats.counters import increment
+
+# polls_vote is partitioned by LIST (poll_id), see migration 0006
+HOT_PARTITION = "polls_vote_hot"
+ARCHIVE_PREFIX = "polls_vote_archive_"
+
+# ATTACH/DETACH wait for locks held by running queries; give up rather than queue reads behind them
+LOCK_TIMEOUT = "5s"
+
+# A partition's bound values are stored inline in its pg_class row, which must fit
+# in one 8 kB page: about 190 UUIDs. Polls archived together share a partition.
+MAX_BATCH_SIZE = 150
+
+# Archive partitions can't be merged (their combined poll list wouldn't fit that row),
+# and every attached one is planned, and scanned by queries not filtered by poll_id.
+# Beyond this many, the partitions of the longest-expired polls are detached first.
+MAX_ARCHIVE_PARTITIONS = 100
+
+
+class Command(BaseCommand):
+    help = ('Moves votes of long-expired polls out of the hot partition of polls_vote into archive '
+            'partitions, and optionally detaches old archive partitions from the table.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expired-days', type=int, default=30,
+                            help='Archive votes of polls that expired at least this many days ago.')
+        parser.add_argument('--batch-size', type=int, default=MAX_BATCH_SIZE,
+                            help=f'Polls moved per archive partition, at most {MAX_BATCH_SIZE}.')
+        parser.add_argument('--partial', action='store_true',
+                            help='Also archive a last batch smaller than --batch-size. By default those polls '
+                                 'wait for a later run, so archive partitions stay few and full.')
+        parser.add_argument('--detach-days', type=int, default=None,
+                            help='Also detach archive partitions whose polls all expired at least this many '
+                                 'days ago. Detached votes are no longer served or counted; the detached '
+                                 'tables are kept for pg_dump.')
+        parser.add_argument('--max-partitions', type=int, default=MAX_ARCHIVE_PARTITIONS,
+                            help='Archive partitions kept attached. Before another one is added, the partitions '
+                                 'of the longest-expired polls are detached to stay within this limit.')
+
+    def handle(self, *args, **options):
+        if not 1 <= options['batch_size'] <= MAX_BATCH_SIZE:
+            raise CommandError(f"--batch-size must be between 1 and {MAX_BATCH_SIZE}.")
+        if options['max_partitions'] < 1:
+            raise CommandError("--max-partitions must be at least 1.")
+        if any(connections[alias].vendor != "postgresql" for alias in shard_aliases()):
+            raise CommandError("Vote partitioning requires PostgreSQL.")
+
+        now = timezone.now()
+        self.columns = ", ".join(field.column for field in Vote._meta.concrete_fields)
+        # Every shard partitions its own polls_vote
+        for alias in shard_aliases():
+            self.alias = alias
+            self.connection = connections[alias]
+            self._archive_shard(now, options)
+
+    def _archive_shard(self, now, options):
+        shard = f" on {self.alias}" if len(shard_aliases()) > 1 else ""
+        cutoff = now - timedelta(days=options['expired_days'])
+        prefix = f"{ARCHIVE_PREFIX}{now:%Y%m%d%H%M%S%f}_"
+        archived_polls = 0
+        batch_number = 0
+        while True:
+            poll_ids = self._cold_poll_ids(cutoff, options['batch_size'])
+            if not poll_ids:
+                break
+            if len(poll_ids) < options['batch_size'] and not options['partial']:
+                self.stdout.write(f"Left {len(poll_ids)} polls for a later run, fewer than --batch-size{shard}.")
+                break
+            self._make_room(options['max_partitions'] - 1, shard)
+            batch_number += 1
+            rows = self._archive(poll_ids, f"{prefix}{batch_number}")
+            archived_polls += len(poll_ids)
+            self.stdout.write(f"Moved {rows} votes of {len(poll_ids)} polls to {prefix}{batch_number}{shard}.")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived the votes of {archived_polls} polls expired before {cutoff:%Y-%m-%d %H:%M}{shard}."
+        ))
+
+        if options['detach_days'] is not None:
+            detach_cutoff = now - timedelta(days=options['detach_days'])
+            for name in self._archive_partitions():
+                last_expiry = self._last_expiry(name)
+                if last_expiry is None or last_expiry < detach_cutoff:
+                    rows = self._detach(name)
+                    self.stdout.write(self.style.SUCCESS(f"Detached {name}{shard} ({rows} votes)."))
+
+    def _make_room(self, keep, shard):
+        partitions = self._archive_partitions()
+        if len(partitions) <= keep:
+            return
+        expiries = {name: self._last_expiry(name) for name in partitions}
+        # Partitions of only deleted polls have no expiry; they go first
+        by_expiry = sorted(partitions, key=lambda name: (expiries[name] is not None, expiries[name]))
+        for name in by_expiry[:len(partitions) - keep]:
+            rows = self._detach(name)
+            self.stdout.write(self.style.SUCCESS(
+                f"Detached {name}{shard} ({rows} votes), over --max-partitions."
+            ))
+
+    def _cold_poll_ids(self, cutoff, limit):
+        # Expired polls that still have votes in the hot partition, oldest first
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT p.poll_id FROM {Poll._meta.db_table} p "
+                f"WHERE p.expires_at < %s AND EXISTS (SELECT 1 FROM {HOT_PARTITION} v WHERE v.poll_id = p.poll_id) "
+                f"ORDER BY p.expires_at LIMIT %s",
+                [cutoff, limit],
+            )
+            return [poll_id for poll_id, in cursor.fetchall()]
+
+    def _archive(self, poll_ids, name):
+        """
+        Copy the polls' votes into a new table, then swap it in as a partition.
+
+        Attaching next to the DEFAULT partition scans both tables under an ACCESS
+        EXCLUSIVE lock to check the new bounds, unless CHECK constraints already
+        prove them. Those are validated first, while reads and writes go on, so
+        the swap only holds its locks for the catch-up, the delete and the attach.
+        """
+        # Values of a partition bound can't be query parameters; these are UUIDs read from the database
+        values = ", ".join(f"'{poll_id}'" for poll_id in poll_ids)
+        bound, excluded = f"{name}_bound", f"{name}_excluded"
+        moved = False
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"CREATE TABLE {name} (LIKE polls_vote INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            try:
+                cursor.execute(
+                    f"INSERT INTO {name} ({self.columns}) SELECT {self.columns} FROM {HOT_PARTITION} "
+                    f"WHERE poll_id = ANY(%s)",
+                    [poll_ids],
+                )
+                # Index and reference the archive before the swap so ATTACH has nothing to build
+                self._copy_indexes_and_foreign_keys(cursor, name)
+                cursor.execute(
+                    f"ALTER TABLE {name} ADD CONSTRAINT {bound} CHECK (poll_id IS NOT NULL AND poll_id IN ({values}))"
+                )
+
+                with transaction.atomic(using=self.alias):
+                    cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+                    cursor.execute(f"LOCK TABLE {HOT_PARTITION} IN EXCLUSIVE MODE")
+                    # Ballots imported into these polls while copying
+                    cursor.execute(
+                        f"INSERT INTO {name} ({self.columns}) SELECT {self.columns} FROM {HOT_PARTITION} h "
+                        f"WHERE h.poll_id = ANY(%s) AND NOT EXISTS (SELECT 1 FROM {name} a WHERE a.vote_id = h.vote_id)",
+                        [poll_ids],
+                    )
+                    cursor.execute(f"DELETE FROM {HOT_PARTITION} WHERE poll_id = ANY(%s)", [poll_ids])
+                    rows = cursor.rowcount
+                    # Not checked against existing rows yet; until the attach, ballots
+                    # imported into these polls are refused
+                    cursor.execute(
+                        f"ALTER TABLE {HOT_PARTITION} ADD CONSTRAINT {excluded} "
+                        f"CHECK (poll_id NOT IN ({values})) NOT VALID"
+                    )
+                moved = True
+
+                # One pass over the hot partition, without blocking reads or writes
+                cursor.execute(f"ALTER TABLE {HOT_PARTITION} VALIDATE CONSTRAINT {excluded}")
+
+                with transaction.atomic(using=self.alias):
+                    cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+                    cursor.execute(f"ALTER TABLE polls_vote ATTACH PARTITION {name} FOR VALUES IN ({values})")
+                    # The partition bounds enforce both from here on
+                    cursor.execute(f"ALTER TABLE {HOT_PARTITION} DROP CONSTRAINT {excluded}")
+                    cursor.execute(f"ALTER TABLE {name} DROP CONSTRAINT {bound}")
+            except Exception:
+                with transaction.atomic(using=self.alias):
+                    cursor.execute(f"ALTER TABLE {HOT_PARTITION} DROP CONSTRAINT IF EXISTS {excluded}")
+                    if moved:
+                        # The votes were already deleted from the hot partition
+                        cursor.execute(
+                            f"INSERT INTO {HOT_PARTITION} ({self.columns}) SELECT {self.columns} FROM {name}"
+                        )
+                    cursor.execute(f"DROP TABLE IF EXISTS {name}")
+                raise
+        return rows
+
+    def _copy_indexes_and_foreign_keys(self, cursor, name):
+        cursor.execute(
+            "SELECT pg_get_indexdef(i.indexrelid), c.conname, c.contype "
+            "FROM pg_index i LEFT JOIN pg_constraint c ON c.conindid = i.indexrelid AND c.conrelid = i.indrelid "
+            "WHERE i.indrelid = 'polls_vote'::regclass"
+        )
+        for definition, constraint, kind in cursor.fetchall():
+            columns = definition[definition.index("("):]
+            if kind == "p":
+                cursor.execute(f"ALTER TABLE {name} ADD PRIMARY KEY {columns}")
+            elif kind == "u":
+                cursor.execute(f"ALTER TABLE {name} ADD UNIQUE {columns}")
+            else:
+                cursor.execute(f"CREATE INDEX ON {name} {columns}")
+
+        cursor.execute(
+            "SELECT pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = 'polls_vote'::regclass AND contype = 'f'"
+        )
+        for definition, in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {name} ADD {definition}")
+
+    def _archive_partitions(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = 'polls_vote'::regclass AND c.relname LIKE %s ORDER BY c.relname",
+                [f"{ARCHIVE_PREFIX}%"],
+            )
+            return [name for name, in cursor.fetchall()]
+
+    def _last_expiry(self, name):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT max(p.expires_at) FROM {Poll._meta.db_table} p "
+                f"WHERE p.poll_id IN (SELECT DISTINCT poll_id FROM {name})"
+            )
+            return cursor.fetchone()[0]
+
+    def _detach(self, name):
+        # DETACH ... CONCURRENTLY isn't allowed while a default partition exists
+        with transaction.atomic(using=self.alias), self.connection.cursor() as cursor:
+            cursor.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+            cursor.execute(f"ALTER TABLE polls_vote DETACH PARTITION {name}")
+            cursor.execute(f"SELECT count(*) FROM {name}")
+            rows = cursor.fetchone()[0]
+            # The archive no longer follows deletes of its polls and voters
+            cursor.execute(
+                "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'", [name]
+            )
+            for constraint, in cursor.fetchall():
+                cursor.execute(f'ALTER TABLE {name} DROP CONSTRAINT "{constraint}"')
+            # Detached votes stop counting in the ledger and the ranked results as well
+            forget_polls(record_deleted_votes(cursor, name, "TRUE"), self.alias)
+            increment(votes=-rows)
+        return rows
@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import load_backend
+from online_poll_system_backend.warmup import warm_up
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# What a worker does when it isn't forked from a preloaded master
+COLD_START = """
+import time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+from online_poll_system_backend.warmup import warm_up
+warm_up()
+print(time.perf_counter() - started)
+"""
+
+
+class Command(BaseCommand):
+    help = ('Compares worker start-up (cold import vs. fork of a preloaded process) and the database '
+            'connection cost per request: a new connection each time, a persistent connection, and a '
+            'psycopg pool, all with health checks as configured for production.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Simulated requests per connection mode.')
+        parser.add_argument('--starts', type=int, default=3, help='Worker start-ups measured per mode.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['starts'] < 1:
+            raise CommandError("--requests and --starts must be positive integers.")
+
+        cold = statistics.median(self._cold_start() for _ in range(options['starts']))
+        warm_up()
+        forked = statistics.median(self._forked_start() for _ in range(options['starts']))
+        self.stdout.write(f"Worker start-up: cold import {cold * 1000:.0f} ms, "
+                          f"forked from a preloaded master {forked * 1000:.1f} ms")
+
+        pool = {'min_size': 1, 'max_size': 1}
+        modes = [
+            ("new connection per request", {'CONN_MAX_AGE': 0}),
+            ("persistent connection", {'CONN_MAX_AGE': 600}),
+            ("connection pool", {'CONN_MAX_AGE': 0, 'OPTIONS': {**self._settings()['OPTIONS'], 'pool': pool}}),
+        ]
+        baseline = None
+        for number, (label, overrides) in enumerate(modes):
+            per_request = self._connection_overhead(f"benchmark_{number}", overrides, options['requests'])
+            baseline = baseline or per_request
+            self.stdout.write(f"{label}: {per_request * 1000:.2f} ms per request "
+                              f"({baseline / per_request:.1f}x)")
+
+    def _settings(self):
+        return connections.settings[DEFAULT_DB_ALIAS]
+
+    def _cold_start(self):
+        result = subprocess.run([sys.executable, "-c", COLD_START], capture_output=True, text=True,
+                                env={**os.environ, "DJANGO_LOG_LEVEL": "WARNING"})
+        if result.returncode:
+            raise CommandError(result.stderr)
+        return float(result.stdout.split()[-1])
+
+    def _forked_start(self):
+        # The child has everything loaded already; it only reports that it's ready
+        read_end, write_end = os.pipe()
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.write(write_end, b"1")
+            os._exit(0)
+        os.read(read_end, 1)
+        elapsed = time.perf_counter() - started
+        os.waitpid(pid, 0)
+        os.close(read_end)
+        os.close(write_end)
+        return elapsed
+
+    def _connection_overhead(self, alias, overrides, requests):
+        settings_dict = {**self._settings(), **overrides, 'CONN_HEALTH_CHECKS': True}
+        connection = load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, alias)
+        try:
+            started = time.perf_counter()
+            for _ in range(requests):
+                # What Django does around every request (request_started/request_finished)
+                connection.close_if_unusable_or_obsolete()
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                connection.close_if_unusable_or_obsolete()
+            return (time.perf_counter() - started) / requests
+        finally:
+            connection.close()
+            if connection.pool is not None:
+                connection.close_pool()
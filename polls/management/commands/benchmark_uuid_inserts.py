@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from online_poll_system_backend.uuids import uuid7
+import time
+import uuid
+
+GENERATORS = {"uuid4": uuid.uuid4, "uuid7": uuid7}
+
+
+class Command(BaseCommand):
+    help = ('Compares insert throughput and primary key index size of random (v4) and '
+            'time-ordered (v7) UUID keys, using scratch tables shaped like polls_vote.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200_000, help='Rows inserted per key type.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT, one transaction each.')
+
+    def handle(self, *args, **options):
+        rows, batch_size = options['rows'], options['batch_size']
+        if rows < 1 or batch_size < 1:
+            raise CommandError("--rows and --batch-size must be positive integers.")
+        if connection.vendor != "postgresql":
+            raise CommandError("The benchmark requires PostgreSQL.")
+
+        poll_id = uuid.uuid4()
+        for kind, generate in GENERATORS.items():
+            table = f"benchmark_uuid_{kind}"
+            # Keys are generated up front so only the database work is timed
+            keys = [generate() for _ in range(rows)]
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+                cursor.execute(
+                    f"CREATE TABLE {table} (id uuid PRIMARY KEY, poll_id uuid NOT NULL, "
+                    f"option varchar(255) NOT NULL, created_at timestamptz NOT NULL)"
+                )
+                try:
+                    elapsed = self._insert(cursor, table, keys, poll_id, batch_size)
+                    cursor.execute(f"SELECT pg_relation_size('{table}_pkey')")
+                    index_size = cursor.fetchone()[0]
+                finally:
+                    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+            self.stdout.write(
+                f"{kind}: {rows / elapsed:,.0f} rows/s ({elapsed:.2f}s), "
+                f"primary key index {index_size / 1024 / 1024:.1f} MiB"
+            )
+
+    def _insert(self, cursor, table, keys, poll_id, batch_size):
+        now = timezone.now()
+        started = time.perf_counter()
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(batch))
+            params = [value for key in batch for value in (key, poll_id, "option", now)]
+            with transaction.atomic():
+                cursor.execute(f"INSERT INTO {table} (id, poll_id, option, created_at) VALUES {placeholders}", params)
+        return time.perf_counter() - started
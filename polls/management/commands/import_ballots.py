@@ -0,0 +1,45 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from polls.ballot_import import BallotImportError, import_ballots, read_ballots
+from polls.models import Poll
+from polls.sharding import db_for_poll
+from pathlib import Path
+import csv
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = 'Imports ballots collected offline into a poll, loading them with COPY.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('poll_id', help='ID of the poll the ballots belong to.')
+        parser.add_argument('path', help='CSV or JSONL file with "voter" (email), "option" and "timestamp" columns.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"File '{path}' does not exist.")
+
+        try:
+            poll = Poll.objects.using(db_for_poll(options['poll_id'])).get(poll_id=options['poll_id'])
+        except (Poll.DoesNotExist, ValidationError):
+            raise CommandError(f"Poll '{options['poll_id']}' does not exist.")
+
+        started = time.monotonic()
+        jsonl = Path(path).suffix.lower() in (".jsonl", ".ndjson")
+        with open(path, newline="", encoding="utf-8") as source:
+            try:
+                result = import_ballots(poll, read_ballots(source, jsonl=jsonl))
+            except BallotImportError as error:
+                raise CommandError(str(error))
+            except (csv.Error, ValueError) as error:
+                # ValueError covers undecodable bytes and malformed JSON lines
+                raise CommandError(f"The ballot file could not be read: {error}")
+
+        elapsed = time.monotonic() - started
+        reasons = ", ".join(f"{count} {reason}" for reason, count in result["rejected_reasons"].items() if count)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['accepted']} ballots into '{poll.title}' in {elapsed:.1f}s. "
+            f"Rejected {result['rejected']}" + (f" ({reasons})." if reasons else ".")
+        ))
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from polls.models import Poll, PollTrend, Vote, VoteEvent
+from polls.sharding import db_for_poll, shard_aliases
+
+# Tables moved with a poll, parents first; each has a poll_id column
+MOVED_MODELS = [Poll, Vote, PollTrend, VoteEvent]
+
+# Rows read from the source per round trip
+FETCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = ('Moves polls, with their votes, trend and ledger events, to the database POLL_SHARDS (or --shards) '
+            'places them on. When adding a shard: migrate it, run this with the new ring while the app still '
+            'uses the old one, switch POLL_SHARDS, then run it again with --prune to copy the votes cast '
+            'in between and delete the polls from their old databases.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', default=None,
+                            help='Comma-separated database aliases of the new ring. Defaults to POLL_SHARDS.')
+        parser.add_argument('--prune', action='store_true',
+                            help='Delete moved polls from their old database after a final copy.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Polls read per batch.')
+
+    def handle(self, *args, **options):
+        ring = options['shards'].split(",") if options['shards'] else shard_aliases()
+        unknown = [alias for alias in ring if alias not in settings.DATABASES]
+        if unknown:
+            raise CommandError(f"Unknown database aliases: {', '.join(unknown)}.")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+
+        # Any configured database may still hold polls from an earlier ring
+        moved = 0
+        for source in settings.DATABASES:
+            moved += self._rebalance(source, ring, options['batch_size'], options['prune'])
+
+        action = "Moved" if options['prune'] else "Copied"
+        self.stdout.write(self.style.SUCCESS(f"{action} {moved} polls to their shards in {', '.join(ring)}."))
+
+    def _rebalance(self, source, ring, batch_size, prune):
+        moved = 0
+        last = None
+        while True:
+            polls = Poll.objects.using(source).order_by("poll_id")
+            if last is not None:
+                polls = polls.filter(poll_id__gt=last)
+            poll_ids = list(polls.values_list("poll_id", flat=True)[:batch_size])
+            if not poll_ids:
+                return moved
+            last = poll_ids[-1]
+
+            misplaced = {}
+            for poll_id in poll_ids:
+                target = db_for_poll(poll_id, ring)
+                if target != source:
+                    misplaced.setdefault(target, []).append(poll_id)
+
+            for target, ids in misplaced.items():
+                votes = self._move(source, target, ids) if prune else self._copy(source, target, ids)
+                moved += len(ids)
+                self.stdout.write(
+                    f"{'Moved' if prune else 'Copied'} {len(ids)} polls ({votes} votes) from {source} to {target}."
+                )
+
+    def _copy(self, source, target, poll_ids):
+        """
+        Insert the polls' rows into `target`, skipping rows already copied.
+        Returns the number of votes read.
+        """
+        votes = 0
+        with transaction.atomic(using=target), connections[source].cursor() as reader, \
+                connections[target].cursor() as writer:
+            for model in MOVED_MODELS:
+                table = model._meta.db_table
+                columns = ", ".join(field.column for field in model._meta.concrete_fields)
+                placeholders = ", ".join(["%s"] * len(model._meta.concrete_fields))
+                reader.execute(f"SELECT {columns} FROM {table} WHERE poll_id = ANY(%s)", [poll_ids])
+                while rows := reader.fetchmany(FETCH_SIZE):
+                    writer.executemany(
+                        f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) ON CONFLICT DO NOTHING", rows
+                    )
+                    if model is Vote:
+                        votes += len(rows)
+        return votes
+
+    def _move(self, source, target, poll_ids):
+        # Locking the polls blocks new votes on them (the foreign key check waits)
+        # until they're gone, so nothing is cast between the final copy and the delete.
+        # Raw deletes send no signals: the site counters don't change with a move.
+        with transaction.atomic(using=source), connections[source].cursor() as cursor:
+            cursor.execute(
+                f"SELECT poll_id FROM {Poll._meta.db_table} WHERE poll_id = ANY(%s) FOR UPDATE", [poll_ids]
+            )
+            votes = self._copy(source, target, poll_ids)
+            for model in reversed(MOVED_MODELS):
+                cursor.execute(f"DELETE FROM {model._meta.db_table} WHERE poll_id = ANY(%s)", [poll_ids])
+        return votes
@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from polls import trending
+from polls.ledger import NO_EVENTS, latest_event, plan_ranges, replay_range, run_parallel
+from polls.models import LedgerCheckpoint, LedgerReplay
+from polls.sharding import shard_aliases
+from stats.counters import lock_totals, overwrite
+from stats.models import SiteCounter
+
+# Counters derived from the ledger; users aren't in it
+REPLAYED_COUNTERS = [SiteCounter.POLLS, SiteCounter.OPEN_ENDED_POLLS, SiteCounter.VOTES]
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds poll trends and the poll and vote site counters from the vote event ledger. Each shard '
+            'is split into ranges of poll IDs, replayed in parallel up to the last event recorded when the '
+            'replay started. Finished ranges are checkpointed, so --resume continues an interrupted replay.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ranges', type=int, default=16, help='Poll ID ranges per shard.')
+        parser.add_argument('--workers', type=int, default=4, help='Ranges replayed at the same time.')
+        parser.add_argument('--resume', action='store_true', help='Continue the last unfinished replay.')
+
+    def handle(self, *args, **options):
+        if options['ranges'] < 1 or options['workers'] < 1:
+            raise CommandError("--ranges and --workers must be positive integers.")
+
+        # Votes buffered by this process belong in the trends being replaced
+        trending.flush()
+        if options['resume']:
+            replay = LedgerReplay.objects.filter(finished_at__isnull=True).order_by('-started_at').first()
+            if replay is None:
+                raise CommandError("There is no unfinished replay to resume.")
+        else:
+            replay = self._start(options['ranges'])
+
+        pending = list(replay.checkpoints.filter(finished_at__isnull=True).order_by('pk'))
+        self.stdout.write(f"Replaying {len(pending)} of {replay.checkpoints.count()} ranges.")
+        for checkpoint in run_parallel(self._replay_range, [(checkpoint,) for checkpoint in pending],
+                                       options['workers']):
+            self.stdout.write(f"Replayed {checkpoint}: {checkpoint.polls} polls, {checkpoint.votes} votes.")
+
+        self._finish(replay)
+        self.stdout.write(self.style.SUCCESS('Trends and site counters rebuilt from the ledger.'))
+
+    def _start(self, ranges):
+        with transaction.atomic():
+            # Counter updates wait on the slot locks while the watermarks are taken
+            counters = lock_totals()
+            watermarks = {alias: latest_event(alias) for alias in shard_aliases()}
+
+        with transaction.atomic():
+            replay = LedgerReplay.objects.create(counters=counters)
+            LedgerCheckpoint.objects.bulk_create([
+                LedgerCheckpoint(replay=replay, shard=alias, range_start=start, range_end=end, watermark=watermark)
+                for alias, watermark in watermarks.items()
+                for start, end in plan_ranges(alias, ranges, watermark)
+            ])
+        return replay
+
+    def _replay_range(self, checkpoint):
+        counts = replay_range(checkpoint.shard, checkpoint.range_start, checkpoint.range_end,
+                              checkpoint.watermark or NO_EVENTS)
+        for name, value in counts.items():
+            setattr(checkpoint, name, value)
+        checkpoint.finished_at = timezone.now()
+        checkpoint.save(update_fields=[*counts, 'finished_at'])
+        return checkpoint
+
+    def _finish(self, replay):
+        checkpoints = list(replay.checkpoints.all())
+        with transaction.atomic():
+            current = lock_totals()
+            values = {}
+            for name in REPLAYED_COUNTERS:
+                replayed = sum(getattr(checkpoint, name) for checkpoint in checkpoints)
+                # Changes made after the watermarks are already in the live counters
+                values[name] = replayed + current[name] - replay.counters[name]
+                if values[name] != current[name]:
+                    self.stdout.write(self.style.WARNING(f"{name}: counter {current[name]}, ledger {values[name]}"))
+                else:
+                    self.stdout.write(f"{name}: {current[name]}")
+            overwrite(values)
+            replay.finished_at = timezone.now()
+            replay.save(update_fields=['finished_at'])
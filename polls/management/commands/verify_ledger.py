@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from polls import trending
+from polls.ledger import plan_ranges, run_parallel, verify_range
+from polls.sharding import shard_aliases
+from stats.counters import totals
+from stats.models import SiteCounter
+
+CHECKS = {
+    "missing_polls": "polls in the ledger are missing from the database",
+    "unrecorded_polls": "polls are not in the ledger",
+    "changed_polls": "polls have a different expiry than in the ledger",
+    "missing_votes": "votes in the ledger are missing from the database",
+    "unrecorded_votes": "votes are not in the ledger",
+    "changed_votes": "votes have a different option than in the ledger",
+    "trends": "trend scores differ from the ledger",
+}
+
+
+class Command(BaseCommand):
+    help = ('Folds the vote event ledger and compares it with the polls, votes, trends and site counters, '
+            'ranges of poll IDs in parallel. Lists every discrepancy and fails if there are any. Trends and '
+            'counters can be rebuilt with replay_ledger.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ranges', type=int, default=16, help='Poll ID ranges per shard.')
+        parser.add_argument('--workers', type=int, default=4, help='Ranges verified at the same time.')
+        parser.add_argument('--show', type=int, default=10, help='Examples listed per check and range.')
+
+    def handle(self, *args, **options):
+        if options['ranges'] < 1 or options['workers'] < 1 or options['show'] < 1:
+            raise CommandError("--ranges, --workers and --show must be positive integers.")
+
+        trending.flush()
+        tasks = [
+            (alias, start, end, options['show'])
+            for alias in shard_aliases()
+            for start, end in plan_ranges(alias, options['ranges'])
+        ]
+        discrepancies = 0
+        ledger = dict.fromkeys(["polls", "open_ended_polls", "votes"], 0)
+        for (alias, *_), (counts, found) in zip(tasks, run_parallel(verify_range, tasks, options['workers'])):
+            for name, value in counts.items():
+                ledger[name] += value
+            for check, (total, rows) in found.items():
+                discrepancies += total
+                examples = ", ".join("/".join(str(value) for value in row) for row in rows)
+                more = ", ..." if total > len(rows) else ""
+                self.stdout.write(self.style.WARNING(f"{alias}: {total} {CHECKS[check]}: {examples}{more}"))
+
+        current = totals()
+        for name in [SiteCounter.POLLS, SiteCounter.OPEN_ENDED_POLLS, SiteCounter.VOTES]:
+            if current[name] != ledger[name]:
+                discrepancies += 1
+                self.stdout.write(self.style.WARNING(f"Site counter {name} is {current[name]}, ledger {ledger[name]}"))
+
+        if discrepancies:
+            raise CommandError(f"Found {discrepancies} discrepancies between the ledger and the database.")
+        self.stdout.write(self.style.SUCCESS(
+            f"The ledger matches the database: {ledger['polls']} polls, {ledger['votes']} votes."
+        ))
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0002_poll_edited_poll_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollTrend',
+            fields=[
+                ('poll', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='polls.poll')),
+                ('score', models.FloatField(db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
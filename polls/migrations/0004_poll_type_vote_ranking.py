@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:30
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0003_polltrend'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poll',
+            name='poll_type',
+            field=models.CharField(choices=[('single', 'Single choice'), ('ranked', 'Ranked choice')], default='single', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='vote',
+            name='ranking',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveSmallIntegerField(), blank=True, null=True, size=10),
+        ),
+    ]
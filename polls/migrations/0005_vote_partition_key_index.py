@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('polls', '0004_poll_type_vote_ranking'),
+    ]
+
+    operations = [
+        # Becomes the primary key of the hot partition in 0006; built without
+        # blocking writes so the switch itself doesn't have to build anything
+        migrations.RunSQL(
+            sql="CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS polls_vote_vote_id_poll_id_uniq "
+                "ON polls_vote (vote_id, poll_id);",
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS polls_vote_vote_id_poll_id_uniq;",
+        ),
+    ]
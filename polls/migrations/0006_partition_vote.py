@@ -0,0 +1,62 @@
+from django.db import migrations
+
+# polls_vote becomes a table partitioned by LIST (poll_id). The existing table is
+# attached, as is, as its DEFAULT partition polls_vote_hot, so no rows are copied:
+# its indexes and constraints are renamed and matched by the parent's equivalents.
+# `manage.py archive_votes` later moves votes of expired polls to archive partitions.
+#
+# Unique constraints of a partitioned table must contain the partition key, so the
+# primary key becomes (vote_id, poll_id); uq_one_vote_per_user_per_poll and the
+# (poll, created_at) index already include poll_id and keep their names.
+PARTITION_SQL = """
+ALTER TABLE polls_vote RENAME TO polls_vote_hot;
+ALTER TABLE polls_vote_hot DROP CONSTRAINT polls_vote_pkey;
+ALTER TABLE polls_vote_hot ADD CONSTRAINT polls_vote_hot_pkey PRIMARY KEY USING INDEX polls_vote_vote_id_poll_id_uniq;
+ALTER TABLE polls_vote_hot RENAME CONSTRAINT uq_one_vote_per_user_per_poll TO polls_vote_hot_voter_id_poll_id_key;
+ALTER INDEX polls_vote_poll_id_579149_idx RENAME TO polls_vote_hot_poll_id_created_at_idx;
+ALTER INDEX polls_vote_poll_id_482e29e3 RENAME TO polls_vote_hot_poll_id_idx;
+ALTER INDEX polls_vote_voter_id_ef4603fe RENAME TO polls_vote_hot_voter_id_idx;
+
+CREATE TABLE polls_vote (LIKE polls_vote_hot INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY LIST (poll_id);
+ALTER TABLE polls_vote ADD CONSTRAINT polls_vote_pkey PRIMARY KEY (vote_id, poll_id);
+ALTER TABLE polls_vote ADD CONSTRAINT uq_one_vote_per_user_per_poll UNIQUE (voter_id, poll_id);
+CREATE INDEX polls_vote_poll_id_579149_idx ON polls_vote (poll_id, created_at);
+CREATE INDEX polls_vote_poll_id_482e29e3 ON polls_vote (poll_id);
+CREATE INDEX polls_vote_voter_id_ef4603fe ON polls_vote (voter_id);
+ALTER TABLE polls_vote ADD CONSTRAINT polls_vote_poll_id_482e29e3_fk_polls_poll_poll_id
+    FOREIGN KEY (poll_id) REFERENCES polls_poll (poll_id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE polls_vote ADD CONSTRAINT polls_vote_voter_id_ef4603fe_fk_users_customuser_user_id
+    FOREIGN KEY (voter_id) REFERENCES users_customuser (user_id) DEFERRABLE INITIALLY DEFERRED;
+
+ALTER TABLE polls_vote ATTACH PARTITION polls_vote_hot DEFAULT;
+"""
+
+UNPARTITION_SQL = """
+DO $$
+BEGIN
+    IF (SELECT count(*) FROM pg_inherits WHERE inhparent = 'polls_vote'::regclass) > 1 THEN
+        RAISE EXCEPTION 'polls_vote has archive partitions; detach and merge them back first';
+    END IF;
+END $$;
+
+ALTER TABLE polls_vote DETACH PARTITION polls_vote_hot;
+DROP TABLE polls_vote;
+ALTER TABLE polls_vote_hot RENAME TO polls_vote;
+ALTER TABLE polls_vote RENAME CONSTRAINT polls_vote_hot_voter_id_poll_id_key TO uq_one_vote_per_user_per_poll;
+ALTER INDEX polls_vote_hot_poll_id_created_at_idx RENAME TO polls_vote_poll_id_579149_idx;
+ALTER INDEX polls_vote_hot_poll_id_idx RENAME TO polls_vote_poll_id_482e29e3;
+ALTER INDEX polls_vote_hot_voter_id_idx RENAME TO polls_vote_voter_id_ef4603fe;
+ALTER TABLE polls_vote DROP CONSTRAINT polls_vote_hot_pkey;
+ALTER TABLE polls_vote ADD CONSTRAINT polls_vote_pkey PRIMARY KEY (vote_id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0005_vote_partition_key_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=PARTITION_SQL, reverse_sql=UNPARTITION_SQL),
+    ]
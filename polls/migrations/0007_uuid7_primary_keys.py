@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:44
+
+import online_poll_system_backend.uuids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0006_partition_vote'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='poll',
+            name='poll_id',
+            field=models.UUIDField(default=online_poll_system_backend.uuids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='vote_id',
+            field=models.UUIDField(default=online_poll_system_backend.uuids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.3 on 2026-10-19 02:08
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+import online_poll_system_backend.uuids
+from django.db import migrations, models
+from online_poll_system_backend.uuids import UUID7_SQL
+
+
+def record_existing(apps, schema_editor):
+    # Every poll and vote already on this database becomes a "created" / "cast" event
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO polls_voteevent (event_id, kind, poll_id, open_ended, at) "
+            f"SELECT {UUID7_SQL}, 1, poll_id, expires_at IS NULL, created_at FROM polls_poll"
+        )
+        cursor.execute(
+            f"INSERT INTO polls_voteevent (event_id, kind, poll_id, voter_id, option, ranking, at) "
+            f"SELECT {UUID7_SQL}, 4, v.poll_id, v.voter_id, array_position(p.options, v.option) - 1, v.ranking, "
+            f"v.created_at FROM polls_vote v JOIN polls_poll p USING (poll_id)"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0008_shard_foreign_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerReplay',
+            fields=[
+                ('replay_id', models.UUIDField(default=online_poll_system_backend.uuids.uuid7, editable=False, primary_key=True, serialize=False)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('counters', models.JSONField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.CharField(max_length=100)),
+                ('range_start', models.UUIDField(blank=True, null=True)),
+                ('range_end', models.UUIDField(blank=True, null=True)),
+                ('watermark', models.UUIDField(blank=True, null=True)),
+                ('polls', models.BigIntegerField(blank=True, null=True)),
+                ('open_ended_polls', models.BigIntegerField(blank=True, null=True)),
+                ('votes', models.BigIntegerField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('replay', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='polls.ledgerreplay')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VoteEvent',
+            fields=[
+                ('event_id', models.UUIDField(default=online_poll_system_backend.uuids.uuid7, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Poll created'), (2, 'Poll updated'), (3, 'Poll deleted'), (4, 'Vote cast'), (5, 'Vote deleted')])),
+                ('poll_id', models.UUIDField()),
+                ('voter_id', models.UUIDField(blank=True, null=True)),
+                ('option', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('ranking', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveSmallIntegerField(), blank=True, null=True, size=10)),
+                ('open_ended', models.BooleanField(blank=True, null=True)),
+                ('at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['poll_id', 'event_id'], name='polls_votee_poll_id_a9e2f2_idx')],
+            },
+        ),
+        migrations.RunPython(record_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 02:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0009_vote_event_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='polltrend',
+            name='replayed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,16 +1,26 @@
 from django.db import models
-import uuid
 from django.contrib.postgres.fields import ArrayField
 from django.db.models import UniqueConstraint, Index
 from django.utils import timezone
+from online_poll_system_backend.uuids import uuid7
+from .sharding import RoutedQuerySet
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 
 User = get_user_model()  # Custom user
 
 class Poll(models.Model):
-    poll_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='polls')
+    SINGLE_CHOICE = 'single'
+    RANKED_CHOICE = 'ranked'
+    POLL_TYPES = [
+        (SINGLE_CHOICE, 'Single choice'),
+        (RANKED_CHOICE, 'Ranked choice'),
+    ]
+
+    poll_id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    # Users live on `default` only, so there is no database-level constraint to
+    # them from other shards; deletes still cascade (see polls.signals)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='polls', db_constraint=False)
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     options = ArrayField(
@@ -22,6 +32,9 @@ class Poll(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     edited = models.BooleanField(default=False)
     expires_at = models.DateTimeField(null=True, blank=True)
+    poll_type = models.CharField(max_length=10, choices=POLL_TYPES, default=SINGLE_CHOICE)
+
+    objects = RoutedQuerySet.as_manager()
 
     class Meta:
         indexes = [
@@ -33,17 +46,43 @@ class Poll(models.Model):
     @property
     def is_expired(self):
         return bool(self.expires_at and self.expires_at <= timezone.now())
+
+    @property
+    def is_ranked(self):
+        return self.poll_type == self.RANKED_CHOICE
+
+    def option_index(self, value):
+        """
+        Index in `options` of the option named `value`, ignoring case; None if
+        there is none or `value` isn't a string.
+        """
+        if not isinstance(value, str):
+            return None
+        positions = {item.lower(): index for index, item in enumerate(self.options)}
+        return positions.get(value.lower())
     
     def __str__(self):
         return self.title
 
 class Vote(models.Model):
-    vote_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    vote_id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='votes')
-    voter = models.ForeignKey(User, on_delete=models.CASCADE, related_name='votes')
-    option = models.CharField(max_length=255)
+    voter = models.ForeignKey(User, on_delete=models.CASCADE, related_name='votes', db_constraint=False)
+    option = models.CharField(max_length=255)  # First preference on ranked-choice polls
+    # Option indexes in order of preference, only set on ranked-choice polls
+    ranking = ArrayField(
+        base_field=models.PositiveSmallIntegerField(),
+        size=10,
+        null=True,
+        blank=True,
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = RoutedQuerySet.as_manager()
+
+    # The table is partitioned by LIST (poll_id) in migration 0006: votes of live polls
+    # sit in the default partition, `manage.py archive_votes` moves expired polls out.
+    # The primary key in the database is (vote_id, poll_id).
     class Meta:
         constraints = [
             UniqueConstraint(fields=['voter', 'poll'], name='uq_one_vote_per_user_per_poll'),
@@ -54,4 +93,104 @@ class Vote(models.Model):
         ]
 
     def __str__(self):
-        return f'Voted on - {self.option}'
\ No newline at end of file
+        return f'Voted on - {self.option}'
+
+class PollTrend(models.Model):
+    """
+    Exponentially decayed vote velocity of a poll, maintained by polls.trending.
+    `score` is stored in log space relative to a fixed epoch, so ordering by it
+    matches ordering by the current decayed score without ever re-decaying rows.
+    `replayed_at` is when replay_ledger last rebuilt the score; votes buffered
+    before then are already in it.
+    """
+    poll = models.OneToOneField(Poll, on_delete=models.CASCADE, primary_key=True, related_name='trend')
+    score = models.FloatField(db_index=True)
+    replayed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = RoutedQuerySet.as_manager()
+
+    def __str__(self):
+        return f'Trend of {self.poll}'
+
+class VoteEvent(models.Model):
+    """
+    Append-only ledger of poll and vote changes, stored with the poll. Rows are
+    only ever inserted (rebalancing moves them with their poll), so trends and
+    site counters can be rebuilt from it with `manage.py replay_ledger` and
+    checked against it with `manage.py verify_ledger`.
+    """
+    POLL_CREATED = 1
+    POLL_UPDATED = 2
+    POLL_DELETED = 3
+    VOTE_CAST = 4
+    VOTE_DELETED = 5
+    KINDS = [
+        (POLL_CREATED, 'Poll created'),
+        (POLL_UPDATED, 'Poll updated'),
+        (POLL_DELETED, 'Poll deleted'),
+        (VOTE_CAST, 'Vote cast'),
+        (VOTE_DELETED, 'Vote deleted'),
+    ]
+
+    # Time-ordered: replaying in event_id order replays in the order things happened
+    event_id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    kind = models.PositiveSmallIntegerField(choices=KINDS)
+    # Plain UUIDs, not foreign keys: events outlive their poll and voter
+    poll_id = models.UUIDField()
+    voter_id = models.UUIDField(null=True, blank=True)
+    # Vote cast: index of the chosen option (the first preference on ranked-choice polls)
+    option = models.PositiveSmallIntegerField(null=True, blank=True)
+    ranking = ArrayField(
+        base_field=models.PositiveSmallIntegerField(),
+        size=10,
+        null=True,
+        blank=True,
+    )
+    # Poll created or updated: whether the poll has no expiry date
+    open_ended = models.BooleanField(null=True, blank=True)
+    at = models.DateTimeField()  # When the vote was cast or the poll changed
+
+    objects = RoutedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            Index(fields=['poll_id', 'event_id']),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} on {self.poll_id}'
+
+class LedgerReplay(models.Model):
+    """
+    A run of `manage.py replay_ledger`. `counters` holds the site counter totals
+    when the ledger watermarks were taken, so changes made while the replay runs
+    can be carried over.
+    """
+    replay_id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    counters = models.JSONField()
+
+    def __str__(self):
+        return f'Ledger replay {self.replay_id}'
+
+class LedgerCheckpoint(models.Model):
+    """
+    One range of poll IDs on one shard, replayed up to `watermark` (the last
+    event on the shard when the replay started). Finished ranges are skipped
+    when an interrupted replay is resumed.
+    """
+    replay = models.ForeignKey(LedgerReplay, on_delete=models.CASCADE, related_name='checkpoints')
+    shard = models.CharField(max_length=100)
+    # Poll IDs from range_start (inclusive) to range_end (exclusive); None is unbounded
+    range_start = models.UUIDField(null=True, blank=True)
+    range_end = models.UUIDField(null=True, blank=True)
+    watermark = models.UUIDField(null=True, blank=True)  # None when the shard's ledger was empty
+    polls = models.BigIntegerField(null=True, blank=True)
+    open_ended_polls = models.BigIntegerField(null=True, blank=True)
+    votes = models.BigIntegerField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.shard} [{self.range_start}, {self.range_end})'
@@ -14,6 +14,9 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         return request.user and request.user.is_authenticated
 
     def has_object_permission(self, request, view, obj):
+        if request.method in permissions.SAFE_METHODS:
+            return True
         if request.method in ["PUT", "PATCH"] and obj.is_expired:
             return False
-        return obj.owner == request.user
+        # Compare ids so the owner row isn't fetched again
+        return obj.owner_id == request.user.pk
@@ -0,0 +1,262 @@
+from collections import OrderedDict
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Count, F, Q, Value
+from django.utils import timezone
+from online_poll_system_backend.uuids import uuid7_floor
+from .models import Vote
+from .sharding import db_for_poll, group_by_shard
+import numpy as np
+import threading
+import uuid
+
+# A ranking of up to 10 option indexes is packed into one int64: digit k (base 11)
+# holds the k-th preference + 1, and 0 marks the end of the ranking.
+BASE = 11
+MAX_RANKS = 10
+
+# Ballots are read incrementally by vote_id (uuid7, generated when the vote is
+# saved, before it commits). Keys from this window before each read are read
+# again, so ballots whose transaction commits up to this long after the key was
+# generated are still counted; ballot imports stamp keys inside their INSERT.
+REREAD_WINDOW = timedelta(seconds=30)
+
+# Ballot boxes kept per process; the least recently used are dropped beyond this
+MAX_BALLOT_BOXES = 1000
+
+
+def encode_ranking(ranking):
+    code = 0
+    for position, index in enumerate(ranking):
+        code += (index + 1) * BASE ** position
+    return code
+
+
+def decode_rankings(codes, width=MAX_RANKS):
+    """
+    Unpack int64 codes into a (len(codes), width) matrix of option indexes, -1 padded.
+    """
+    powers = BASE ** np.arange(width, dtype=np.int64)
+    return (codes[:, None] // powers) % BASE - 1
+
+
+def instant_runoff(codes, weights, n_options):
+    """
+    Run instant-runoff rounds over packed ballots.
+
+    `codes` are distinct packed rankings and `weights` how many ballots carry each.
+    After the first round only the ballots whose current choice was just eliminated
+    are moved to their next preference, so a round costs one pass over the choices.
+    Returns (rounds, winner index or None); each round holds the per-option counts
+    (None once eliminated), exhausted ballots and the eliminated option.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.int64)
+    # Padding (-1) maps to an extra slot that stands for "exhausted"
+    exhausted_slot = n_options
+    eliminated = np.zeros(n_options + 1, dtype=bool)
+    eliminated[exhausted_slot] = True
+    choice = codes % BASE - 1
+    choice[choice < 0] = exhausted_slot
+
+    rounds = []
+    winner = None
+    while True:
+        counts = np.bincount(choice, weights=weights, minlength=n_options + 1)
+        standing = np.flatnonzero(~eliminated[:n_options])
+        standing_counts = counts[standing]
+        active_total = standing_counts.sum()
+
+        round_result = {
+            "counts": [None if eliminated[i] else int(counts[i]) for i in range(n_options)],
+            "exhausted": int(counts[exhausted_slot]),
+            "eliminated": None,
+        }
+        rounds.append(round_result)
+
+        if not len(standing) or active_total == 0:
+            break
+        leader = standing[np.argmax(standing_counts)]
+        if counts[leader] * 2 > active_total or len(standing) == 1:
+            winner = int(leader)
+            break
+
+        # Lowest count goes; ties eliminate the option listed last
+        loser = int(standing[standing_counts == standing_counts.min()][-1])
+        eliminated[loser] = True
+        round_result["eliminated"] = loser
+
+        # Transfer the loser's ballots to their highest continuing preference
+        moved = np.flatnonzero(choice == loser)
+        if len(moved):
+            # Only these ballots need their full ranking unpacked
+            ballots = decode_rankings(codes[moved])
+            ballots[ballots < 0] = exhausted_slot
+            continuing = ~eliminated[ballots]
+            next_choice = ballots[np.arange(len(moved)), continuing.argmax(axis=1)]
+            next_choice[~continuing.any(axis=1)] = exhausted_slot
+            choice[moved] = next_choice
+
+    return rounds, winner
+
+
+class BallotBox:
+    """
+    Distinct packed rankings of one poll with their ballot counts.
+    `refresh` only reads ballots cast since the previous refresh; deleted
+    ballots are dropped by replacing the box (see forget_polls).
+    """
+
+    def __init__(self, generation=None):
+        self.generation = generation
+        self.counts = {}
+        self.settled = None  # Every ballot with a lower vote_id is counted
+        self.recent = set()  # vote_ids counted at or above `settled`
+        self.lock = threading.Lock()
+
+    def add(self, ranking, ballots=1):
+        code = encode_ranking(ranking)
+        self.counts[code] = self.counts.get(code, 0) + ballots
+
+    def ingest(self, grouped, ballots, settled):
+        """
+        Count what one read found: (ranking, count) pairs of the ballots below
+        `settled` if the box was empty, and (vote_id, ranking) rows of newer ones.
+        """
+        if self.settled is None:
+            for ranking, count in grouped:
+                self.add(ranking, count)
+            self.settled = settled
+        for vote_id, ranking in ballots:
+            if vote_id >= self.settled and vote_id not in self.recent:
+                self.add(ranking)
+                self.recent.add(vote_id)
+
+        # Ballots below the new mark are never read again
+        self.settled = max(self.settled, settled)
+        self.recent = {vote_id for vote_id in self.recent if vote_id >= self.settled}
+
+    def refresh(self, poll):
+        settled = _settled_mark()
+        rows = _read_ballots(db_for_poll(poll.poll_id), {poll.poll_id: self}, settled)
+        self.ingest(*rows.get(poll.poll_id, ([], [])), settled)
+
+    def tally(self, n_options):
+        if not self.counts:
+            return [], None
+        codes = np.fromiter(self.counts.keys(), dtype=np.int64, count=len(self.counts))
+        weights = np.fromiter(self.counts.values(), dtype=np.int64, count=len(self.counts))
+        return instant_runoff(codes, weights, n_options)
+
+
+def _settled_mark():
+    # Taken before reading, so the window is measured from the read's start
+    return uuid7_floor(timezone.now() - REREAD_WINDOW)
+
+
+def _read_ballots(alias, boxes, settled):
+    """
+    {poll_id: (grouped, ballots)} for BallotBox.ingest, in one query on `alias`.
+
+    Empty boxes get the ballots below `settled` counted per ranking by the
+    database; every box gets the rows of ballots above its own mark.
+    """
+    empty = [poll_id for poll_id, box in boxes.items() if box.settled is None]
+    condition = Q()
+    for poll_id, box in boxes.items():
+        condition |= Q(poll_id=poll_id, vote_id__gte=box.settled or settled)
+    ballots = Vote.objects.using(alias).filter(condition, ranking__isnull=False).annotate(
+        ballots=Value(None, output_field=models.IntegerField()), key=F("vote_id"),
+    ).values_list("poll_id", "ranking", "ballots", "key")
+    if empty:
+        grouped = Vote.objects.using(alias).filter(
+            poll_id__in=empty, vote_id__lt=settled, ranking__isnull=False
+        ).values("poll_id", "ranking").annotate(
+            ballots=Count("*"), key=Value(None, output_field=models.UUIDField()),
+        ).values_list("poll_id", "ranking", "ballots", "key")
+        ballots = grouped.union(ballots, all=True)
+
+    rows = {poll_id: ([], []) for poll_id in boxes}
+    for poll_id, ranking, count, vote_id in ballots:
+        if vote_id is None:
+            rows[poll_id][0].append((ranking, count))
+        else:
+            rows[poll_id][1].append((vote_id, ranking))
+    return rows
+
+
+# Ballots are deleted by other processes too (another worker deleting a user,
+# archive_votes detaching partitions), so a box is only reused while its poll's
+# generation in the shared cache is the one it was filled at.
+_boxes = OrderedDict()  # poll_id -> BallotBox, least recently used first
+_boxes_lock = threading.Lock()
+
+
+def _generation_key(poll_id):
+    return f"ballot-box:{poll_id}"
+
+
+def get_ballot_boxes(poll_ids):
+    """
+    {poll_id: BallotBox} for `poll_ids`, with empty boxes for polls new to this
+    process or forgotten since their box was filled. One cache round trip.
+    """
+    generations = cache.get_many([_generation_key(poll_id) for poll_id in poll_ids])
+    boxes = {}
+    with _boxes_lock:
+        for poll_id in poll_ids:
+            generation = generations.get(_generation_key(poll_id))
+            box = _boxes.get(poll_id)
+            if box is None or box.generation != generation:
+                box = _boxes[poll_id] = BallotBox(generation)
+            _boxes.move_to_end(poll_id)
+            boxes[poll_id] = box
+        while len(_boxes) > MAX_BALLOT_BOXES:
+            _boxes.popitem(last=False)
+    return boxes
+
+
+def get_ballot_box(poll):
+    return get_ballot_boxes([poll.poll_id])[poll.poll_id]
+
+
+def refresh_ballot_boxes(polls):
+    """
+    Bring the ballot boxes of several ranked polls up to date with one query per shard.
+    """
+    boxes = get_ballot_boxes([poll.poll_id for poll in polls])
+    if not boxes:
+        return boxes
+
+    settled = _settled_mark()
+    rows = {}
+    for alias, polls_on_shard in group_by_shard(polls).items():
+        rows.update(_read_ballots(alias, {poll.poll_id: boxes[poll.poll_id] for poll in polls_on_shard}, settled))
+
+    for poll_id, box in boxes.items():
+        with box.lock:
+            box.ingest(*rows.get(poll_id, ([], [])), settled)
+    return boxes
+
+
+def forget_polls(poll_ids, using):
+    """
+    Make every process rebuild the ballot boxes of `poll_ids`, once the transaction
+    on `using` commits. Called wherever votes are deleted or polls change.
+    """
+    poll_ids = set(poll_ids)
+    if not poll_ids:
+        return
+    with _boxes_lock:
+        for poll_id in poll_ids:
+            _boxes.pop(poll_id, None)
+    # A new token rather than a counter: an evicted key can't come back with an old value
+    transaction.on_commit(
+        lambda: cache.set_many({_generation_key(poll_id): uuid.uuid4().hex for poll_id in poll_ids}, timeout=None),
+        using=using,
+    )
+
+
+def forget_poll(poll_id):
+    forget_polls([poll_id], db_for_poll(poll_id))
@@ -35,20 +35,87 @@ class PollModelSerializer(serializers.ModelSerializer):
 
         return value
     
+    def validate_poll_type(self, value):
+        # Existing ballots can't be reinterpreted as another poll type
+        if self.instance and value != self.instance.poll_type and self.instance.votes.exists():
+            raise serializers.ValidationError("Poll type cannot be changed once votes have been cast.")
+        return value
+
     def get_is_expired(self, obj):
         return bool(obj.expires_at and obj.expires_at <= timezone.now())
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Precomputed by the view for ?include=results
+        results = self.context.get("results")
+        if results is not None:
+            data["results"] = results.get(instance.poll_id)
+        return data
+
+class OwnerPollSerializer(PollModelSerializer):
+    # Filled in by the annotations of PollModelViewSet.mine
+    total_votes = serializers.IntegerField(read_only=True)
+    leading_option = serializers.CharField(read_only=True, allow_null=True)
+
 class VoteModelSerializer(serializers.ModelSerializer):
     poll = serializers.PrimaryKeyRelatedField(read_only=True)
     voter = serializers.PrimaryKeyRelatedField(read_only=True)
+    option = serializers.CharField(max_length=255, required=False)
+    ranking = serializers.ListField(
+        child=serializers.CharField(), required=False, allow_empty=False, max_length=10
+    )
+
     class Meta:
         model = Vote
         fields = "__all__"
 
     def validate_option(self, value):
         poll = self.context.get("poll")
-        if poll and value.lower() not in [item.lower() for item in poll.options]:
-            logger.warning(f"Invalid vote option '{value}' for poll {poll.poll_id}")
+        if not poll:
+            return value
+        index = poll.option_index(value)
+        if index is None:
+            logger.warning("Invalid vote option '%s' for poll %s", value, poll.poll_id, extra={"poll_id": poll.poll_id})
             raise serializers.ValidationError("Invalid option for this poll.")
-        return value
+        # Stored as the poll spells it, so results and the ledger find it
+        return poll.options[index]
+
+    def validate_ranking(self, value):
+        """
+        Convert the ranked option names to their indexes in poll.options.
+        """
+        poll = self.context.get("poll")
+        if not poll:
+            return value
+
+        ranking = []
+        for item in value:
+            index = poll.option_index(item)
+            if index is None:
+                logger.warning("Invalid ranked option '%s' for poll %s", item, poll.poll_id, extra={"poll_id": poll.poll_id})
+                raise serializers.ValidationError("Invalid option for this poll.")
+            if index in ranking:
+                raise serializers.ValidationError("Each option can only be ranked once.")
+            ranking.append(index)
+        return ranking
+
+    def validate(self, attrs):
+        poll = self.context.get("poll")
+        if poll and poll.is_ranked:
+            if "ranking" not in attrs:
+                raise serializers.ValidationError({"ranking": "A ranking of options is required for ranked-choice polls."})
+            # Keep the first preference in `option` like a single-choice vote
+            attrs["option"] = poll.options[attrs["ranking"][0]]
+        else:
+            if "ranking" in attrs:
+                raise serializers.ValidationError({"ranking": "Only ranked-choice polls accept a ranking."})
+            if not attrs.get("option"):
+                raise serializers.ValidationError({"option": "This field is required."})
+        return attrs
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if instance.ranking is not None:
+            poll = self.context.get("poll") or instance.poll
+            data["ranking"] = [poll.options[index] for index in instance.ranking]
+        return data
@@ -0,0 +1,189 @@
+"""
+Polls and their votes live on one of the databases in POLL_SHARDS, chosen by
+consistent hashing of poll_id. Users, site counters and everything else stay on
+`default`. With a single shard every query goes to `default` as before.
+"""
+from bisect import bisect
+from django.conf import settings
+from django.db import models
+from functools import lru_cache
+from operator import attrgetter
+import hashlib
+import heapq
+import itertools
+import uuid
+
+# Models stored with their poll; the rest of the apps are not sharded
+SHARDED_MODELS = {("polls", "poll"), ("polls", "vote"), ("polls", "polltrend"), ("polls", "voteevent")}
+
+# Points per shard on the hash ring; more points spread polls more evenly
+VIRTUAL_NODES = 128
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value).digest()[:8], "big")
+
+
+@lru_cache(maxsize=8)
+def _ring(shards):
+    return sorted((_hash(f"{alias}:{point}".encode()), alias) for alias in shards for point in range(VIRTUAL_NODES))
+
+
+def shard_aliases():
+    return list(settings.POLL_SHARDS)
+
+
+def db_for_poll(poll_id, shards=None):
+    """
+    Database alias holding `poll_id`. Adding a shard only moves the polls whose
+    ring position now falls on one of the new shard's points.
+    """
+    shards = tuple(shards or settings.POLL_SHARDS)
+    if len(shards) == 1:
+        return shards[0]
+    try:
+        key = uuid.UUID(str(poll_id)).bytes
+    except ValueError:
+        return shards[0]  # Not a poll id; the lookup finds nothing on any shard
+    ring = _ring(shards)
+    index = bisect(ring, (_hash(key), "")) % len(ring)
+    return ring[index][1]
+
+
+def group_by_shard(polls):
+    """
+    {alias: [poll, ...]} for polls loaded from (or about to be saved on) their shards.
+    """
+    groups = {}
+    for poll in polls:
+        groups.setdefault(poll._state.db or db_for_poll(poll.poll_id), []).append(poll)
+    return groups
+
+
+def is_sharded(model):
+    return (model._meta.app_label, model._meta.model_name) in SHARDED_MODELS
+
+
+class PollShardRouter:
+    """
+    Places polls, votes, trends and ledger events with their poll. Queries
+    without an instance to route by go to `default`; code reading every shard
+    uses across_shards() or `.using(db_for_poll(...))`.
+    """
+
+    def _db_for_model(self, model, instance=None):
+        if not is_sharded(model):
+            return "default"
+        if instance is not None and is_sharded(type(instance)):
+            # Rows already loaded stay where they were read from. New ones are
+            # placed by poll_id: assigning the owner has set their database to
+            # the user's.
+            if instance._state.db and not instance._state.adding:
+                return instance._state.db
+            return db_for_poll(instance.poll_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for_model(model, hints.get("instance"))
+
+    def db_for_write(self, model, **hints):
+        return self._db_for_model(model, hints.get("instance"))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Polls and votes reference users on `default`
+        if is_sharded(type(obj1)) or is_sharded(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Shards get the full schema so migrations apply unchanged, but site
+        # counters (and their seed data) only exist on `default`
+        if app_label == "stats":
+            return db == "default"
+        return None
+
+
+class RoutedQuerySet(models.QuerySet):
+    """
+    QuerySet.create() picks its database before the object exists; build the
+    object first so the router can place it by poll_id.
+    """
+
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+class ScatterGather:
+    """
+    Read-only union of the same query on every shard, merged in the query's
+    ordering. Supports what list views and CursorPagination use: filter,
+    order_by, annotate, iteration, slicing and count.
+    """
+
+    def __init__(self, querysets):
+        self.querysets = querysets
+        self.model = querysets[0].model
+
+    def _chain(self, method, *args, **kwargs):
+        return ScatterGather([getattr(queryset, method)(*args, **kwargs) for queryset in self.querysets])
+
+    def all(self):
+        return self._chain("all")
+
+    def filter(self, *args, **kwargs):
+        return self._chain("filter", *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain("exclude", *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._chain("order_by", *fields)
+
+    def annotate(self, *args, **kwargs):
+        return self._chain("annotate", *args, **kwargs)
+
+    def select_related(self, *fields):
+        return self._chain("select_related", *fields)
+
+    def _merge(self, limit=None):
+        query = self.querysets[0].query
+        ordering = query.order_by or (self.model._meta.ordering if query.default_ordering else ())
+        # Each shard returns at most `limit` rows, already sorted
+        results = [queryset if limit is None else queryset[:limit] for queryset in self.querysets]
+        if not ordering:
+            return itertools.chain.from_iterable(results)
+        descending = {field.startswith("-") for field in ordering}
+        if len(descending) > 1:
+            raise ValueError("Shards can only be merged on a single sort direction.")
+        key = attrgetter(*[field.lstrip("-") for field in ordering])
+        return heapq.merge(*results, key=key, reverse=descending.pop())
+
+    def __iter__(self):
+        return iter(self._merge())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step is not None or (index.start or 0) < 0 or (index.stop is not None and index.stop < 0):
+                raise ValueError("ScatterGather only supports forward slices.")
+            return list(self._merge(index.stop))[index.start:index.stop]
+        return self[index:index + 1][0]
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self.querysets)
+
+
+def across_shards(queryset):
+    """
+    `queryset` on every shard, or on the only one.
+    """
+    shards = shard_aliases()
+    if len(shards) == 1:
+        return queryset.using(shards[0])
+    return ScatterGather([queryset.using(alias) for alias in shards])
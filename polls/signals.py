@@ -0,0 +1,64 @@
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from .cache import invalidate_poll, invalidate_poll_list
+from .models import Poll, Vote, VoteEvent
+from .ranked import forget_polls
+from .sharding import shard_aliases
+from . import ledger
+
+User = get_user_model()
+
+
+def _record_deleted_votes(user, alias):
+    with connections[alias].cursor() as cursor:
+        poll_ids = ledger.record_deleted_votes(cursor, Vote._meta.db_table, "voter_id = %s", [user.pk])
+    # Ranked and cached results counted these ballots
+    forget_polls(poll_ids, alias)
+    for poll_id in poll_ids:
+        invalidate_poll(poll_id, using=alias)
+
+
+@receiver(pre_delete, sender=User)
+def record_cascaded_votes(sender, instance, **kwargs):
+    # Runs in the deletion's transaction, before the cascade removes the votes
+    if instance._state.db in shard_aliases():
+        _record_deleted_votes(instance, instance._state.db)
+
+
+@receiver(post_delete, sender=User)
+def delete_sharded_rows(sender, instance, **kwargs):
+    # Deleting a user cascades on its own database only; polls and votes on the
+    # other shards reference it without a constraint
+    for alias in shard_aliases():
+        if alias != instance._state.db:
+            with transaction.atomic(using=alias):
+                _record_deleted_votes(instance, alias)
+                Poll.objects.using(alias).filter(owner_id=instance.pk).delete()
+                Vote.objects.using(alias).filter(voter_id=instance.pk).delete()
+
+
+# Ledger events are written on the poll's database, in the transaction of the
+# change. Votes are deleted without signals (see stats.signals), so their
+# events are appended in SQL by whatever deletes them.
+
+@receiver(post_save, sender=Poll)
+def record_poll_saved(sender, instance, created, raw=False, using=None, **kwargs):
+    if not raw:
+        ledger.record_poll(instance, VoteEvent.POLL_CREATED if created else VoteEvent.POLL_UPDATED, using)
+
+
+@receiver(post_delete, sender=Poll)
+def record_poll_deleted(sender, instance, using=None, **kwargs):
+    # Implies the deletion of the poll's votes
+    ledger.record_poll(instance, VoteEvent.POLL_DELETED, using)
+    # Deleted through the API or the admin, or with its owner
+    invalidate_poll(instance.poll_id, using=using)
+    invalidate_poll_list(using=using)
+
+
+@receiver(post_save, sender=Vote)
+def record_vote_cast(sender, instance, created, raw=False, using=None, **kwargs):
+    if created and not raw:
+        ledger.record_vote(instance, using)
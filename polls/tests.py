@@ -1,3 +1,1186 @@
-from django.test import TestCase
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from online_poll_system_backend.testing import FAST_PASSWORD_HASHERS, QueryBudgetMixin, seed_data
+from online_poll_system_backend.uuids import uuid7_floor
+from stats.counters import totals
+from stats.models import SiteCounter
+from .admin import EstimatedCountPaginator
+from .models import LedgerReplay, Poll, PollTrend, Vote, VoteEvent
+from .breaker import breaker, stale_responses
+from .ledger import latest_event, replay_range
+from .ranked import encode_ranking, forget_poll, get_ballot_boxes, instant_runoff, refresh_ballot_boxes
+from . import ranked
+from .sharding import db_for_poll
+from . import trending
+from unittest import mock, skipUnless
+import functools
+import io
+import tempfile
+import uuid
 
-# Create your tests here.
\ No newline at end of file
+User = get_user_model()
+
+
+class OwnerPollsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email="owner@example.com")
+        cls.other = User.objects.create(email="other@example.com")
+        voters = User.objects.bulk_create(
+            [User(email=f"voter{i}@example.com") for i in range(5)]
+        )
+
+        cls.polls = [
+            Poll.objects.create(owner=cls.owner, title=f"Poll {i}", options=["a", "b", "c"])
+            for i in range(12)
+        ]
+        Poll.objects.create(owner=cls.other, title="Not mine", options=["a", "b"])
+
+        # Poll i gets i % 5 votes, mostly for "b"
+        Vote.objects.bulk_create([
+            Vote(poll=poll, voter=voter, option="a" if n == 0 else "b")
+            for i, poll in enumerate(cls.polls)
+            for n, voter in enumerate(voters[:i % 5])
+        ])
+
+    def setUp(self):
+        self.client.force_authenticate(self.owner)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(reverse("list-polls-mine"))
+        self.assertEqual(response.status_code, 401)
+
+    def test_returns_only_own_polls_with_totals(self):
+        response = self.client.get(reverse("list-polls-mine"), {"page_size": 100})
+        self.assertEqual(response.status_code, 200)
+
+        results = response.data["results"]
+        self.assertEqual(len(results), 12)
+        self.assertEqual([item["title"] for item in results], [f"Poll {i}" for i in reversed(range(12))])
+
+        by_title = {item["title"]: item for item in results}
+        self.assertEqual(by_title["Poll 0"]["total_votes"], 0)
+        self.assertIsNone(by_title["Poll 0"]["leading_option"])
+        self.assertEqual(by_title["Poll 1"]["total_votes"], 1)
+        self.assertEqual(by_title["Poll 1"]["leading_option"], "a")
+        self.assertEqual(by_title["Poll 4"]["total_votes"], 4)
+        self.assertEqual(by_title["Poll 4"]["leading_option"], "b")
+
+    def test_cursor_pagination_walks_all_polls(self):
+        titles = []
+        url, params = reverse("list-polls-mine"), {"page_size": 5}
+        while url:
+            response = self.client.get(url, params)
+            titles += [item["title"] for item in response.data["results"]]
+            url, params = response.data["next"], None
+        self.assertEqual(titles, [f"Poll {i}" for i in reversed(range(12))])
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        for page_size in (1, 5, 12):
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse("list-polls-mine"), {"page_size": page_size})
+            self.assertEqual(len(response.data["results"]), page_size)
+
+
+def hold_trend_scores(test):
+    """
+    Drop the scores buffered by earlier tests, whose polls were rolled back, and
+    replace the flush timer with a mock so only the test flushes.
+    """
+    trending.stop_flush_timer()
+    trending._pending.clear()
+    patcher = mock.patch.object(trending.threading, "Timer")
+    test.flush_timer = patcher.start()
+    test.addCleanup(patcher.stop)
+    test.addCleanup(trending.stop_flush_timer)
+
+
+class TrendingTests(APITestCase):
+    def setUp(self):
+        hold_trend_scores(self)
+        self.owner = User.objects.create(email="owner@example.com")
+        self.poll = Poll.objects.create(owner=self.owner, title="Poll", options=["a", "b"])
+
+    def test_faster_voted_polls_rank_first(self):
+        now = timezone.now()
+        slow = Poll.objects.create(owner=self.owner, title="Slow", options=["a", "b"])
+        stale = Poll.objects.create(owner=self.owner, title="Stale", options=["a", "b"])
+        trending.record_votes(self.poll.poll_id, [now] * 3)
+        trending.record_votes(slow.poll_id, [now])
+        # Three votes two half-lives ago weigh 0.75 now
+        trending.record_votes(stale.poll_id, [now - settings.TRENDING_HALF_LIFE * 2] * 3)
+
+        top = trending.top_polls()
+
+        self.assertEqual([poll for poll, _ in top], [self.poll, slow, stale])
+        for (_, score), expected in zip(top, [3, 1, 0.75]):
+            self.assertAlmostEqual(score, expected, places=3)
+        self.assertEqual([poll for poll, _ in trending.top_polls(limit=2)], [self.poll, slow])
+
+    def test_expired_polls_drop_out(self):
+        trending.record_vote(self.poll.poll_id)
+        self.assertEqual([poll for poll, _ in trending.top_polls()], [self.poll])
+
+        Poll.objects.filter(pk=self.poll.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(trending.top_polls(), [])
+        self.assertTrue(PollTrend.objects.filter(poll=self.poll).exists())
+
+    def test_timer_flushes_without_further_votes(self):
+        trending.record_vote(self.poll.poll_id)
+        trending.record_vote(self.poll.poll_id)
+        # One timer per buffer, started by the first vote
+        self.flush_timer.assert_called_once_with(settings.TRENDING_FLUSH_INTERVAL, trending._flush_in_thread)
+        self.flush_timer.return_value.start.assert_called_once()
+        self.assertFalse(PollTrend.objects.exists())
+
+        # What the timer thread runs once the interval is up; it closes its own connections
+        with mock.patch.object(trending, "connections"):
+            trending._flush_in_thread()
+
+        score = PollTrend.objects.get(poll=self.poll).score
+        self.assertAlmostEqual(trending.current_score(score), 2, places=3)
+        trending.record_vote(self.poll.poll_id)
+        self.assertEqual(self.flush_timer.call_count, 2)
+
+    def test_buffer_is_flushed_at_exit(self):
+        trending.record_vote(self.poll.poll_id)
+        trending.flush_at_exit()
+        self.flush_timer.return_value.cancel.assert_called_once()
+        self.assertTrue(PollTrend.objects.filter(poll=self.poll).exists())
+
+    def test_votes_far_apart_add_up(self):
+        first = timezone.now()
+        trending.record_vote(self.poll.poll_id, first)
+        trending.flush()
+        # About 762 apart in log space, past where exp() underflows
+        later = first + settings.TRENDING_HALF_LIFE * 1100
+        trending.record_vote(self.poll.poll_id, later)
+        trending.flush()
+
+        score = PollTrend.objects.get(poll=self.poll).score
+        self.assertAlmostEqual(score, trending.log_weight(later))
+
+
+class RankedChoiceTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email="owner@example.com")
+        cls.voters = User.objects.bulk_create(
+            [User(email=f"voter{i}@example.com") for i in range(10)]
+        )
+        cls.poll = Poll.objects.create(
+            owner=cls.owner, title="Ranked", options=["A", "B", "C"], poll_type=Poll.RANKED_CHOICE
+        )
+
+    def setUp(self):
+        # Ballot boxes live in memory and outlast the rolled back test data
+        forget_poll(self.poll.poll_id)
+
+    def vote(self, voter, ranking):
+        self.client.force_authenticate(voter)
+        return self.client.post(
+            reverse("list-votes", args=[self.poll.poll_id]), {"ranking": ranking}, format="json"
+        )
+
+    def test_instant_runoff_transfers_eliminated_ballots(self):
+        codes = [encode_ranking(ranking) for ranking in ([0], [1, 2], [2, 1])]
+        rounds, winner = instant_runoff(codes, [4, 3, 2], 3)
+
+        self.assertEqual(winner, 1)
+        self.assertEqual(rounds[0], {"counts": [4, 3, 2], "exhausted": 0, "eliminated": 2})
+        self.assertEqual(rounds[1], {"counts": [4, 5, None], "exhausted": 0, "eliminated": None})
+
+    def test_exhausted_ballots_leave_the_count(self):
+        codes = [encode_ranking(ranking) for ranking in ([0], [1], [2])]
+        rounds, winner = instant_runoff(codes, [3, 2, 1], 3)
+
+        self.assertEqual(winner, 0)
+        self.assertEqual(rounds[-1]["exhausted"], 1)
+
+    def test_results_are_retallied_as_ballots_arrive(self):
+        for voter in self.voters[:4]:
+            self.vote(voter, ["A"])
+        for voter in self.voters[4:7]:
+            self.vote(voter, ["B", "C"])
+        for voter in self.voters[7:9]:
+            response = self.vote(voter, ["c", "b"])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["vote"]["option"], "C")
+        self.assertEqual(response.data["vote"]["ranking"], ["C", "B"])
+        results = response.data["real_time_results"]
+        self.assertEqual(results["winner"], "B")
+        self.assertEqual(results["total_votes"], 9)
+        self.assertEqual([r["eliminated"] for r in results["rounds"]], ["C", None])
+
+        response = self.vote(self.voters[9], ["A", "B"])
+        results = response.data["real_time_results"]
+        self.assertEqual(results["total_votes"], 10)
+        # A and B tie on 5 after C is out; the tie eliminates the option listed last
+        self.assertEqual([r["eliminated"] for r in results["rounds"]], ["C", "B", None])
+        self.assertEqual(results["winner"], "A")
+
+    def results(self):
+        return self.client.get(reverse("list-votes", args=[self.poll.poll_id])).data["real_time_results"]
+
+    def test_deleted_ballots_leave_the_count(self):
+        for voter in self.voters[:3]:
+            self.vote(voter, ["A"])
+        self.vote(self.voters[3], ["B"])
+        self.assertEqual(self.results()["total_votes"], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.voters[0].delete()
+        self.assertEqual(self.results()["total_votes"], 3)
+
+        # Deleted by another process, which only leaves a new generation in the cache
+        Vote.objects.filter(voter=self.voters[1]).delete()
+        cache.set(f"ballot-box:{self.poll.poll_id}", "elsewhere")
+        results = self.results()
+        self.assertEqual(results["total_votes"], 2)
+        self.assertEqual([result["count"] for result in results["results"]], [1, 1, 0])
+
+    def ballot(self, voter, ranking, age):
+        # A ballot whose key was generated `age` ago, i.e. saved then
+        return Vote.objects.create(poll=self.poll, voter=voter, option=self.poll.options[ranking[0]],
+                                   ranking=ranking, vote_id=uuid7_floor(timezone.now() - age))
+
+    def test_ballots_committed_late_are_counted(self):
+        for voter in self.voters[:3]:
+            self.vote(voter, ["A"])
+        self.assertEqual(self.results()["total_votes"], 3)
+
+        # Saved 20 seconds ago, committed only now, with a created_at far behind the newest ballot
+        vote = self.ballot(self.voters[3], [1], timedelta(seconds=20))
+        Vote.objects.filter(pk=vote.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.results()["total_votes"], 4)
+        self.assertEqual(self.results()["total_votes"], 4)
+
+    def test_empty_boxes_are_filled_by_ranking_in_sql(self):
+        for n, voter in enumerate(self.voters[:6]):
+            self.ballot(voter, [n % 2, 2], timedelta(hours=1, seconds=n))
+        self.ballot(self.voters[6], [2], timedelta(seconds=1))
+
+        with CaptureQueriesContext(connection) as queries:
+            box = refresh_ballot_boxes([self.poll])[self.poll.poll_id]
+        self.assertEqual(len(queries), 1)
+        self.assertIn("GROUP BY", queries[0]["sql"])
+        # Only the ballot inside the re-read window was read as a row
+        self.assertEqual(len(box.recent), 1)
+        self.assertEqual(box.counts, {encode_ranking([0, 2]): 3, encode_ranking([1, 2]): 3, encode_ranking([2]): 1})
+
+        refresh_ballot_boxes([self.poll])
+        self.assertEqual(sum(box.counts.values()), 7)
+
+    def test_least_recently_used_boxes_are_dropped(self):
+        poll_ids = [uuid.uuid4() for _ in range(3)]
+        with mock.patch.object(ranked, "MAX_BALLOT_BOXES", 2):
+            first = get_ballot_boxes(poll_ids[:1])[poll_ids[0]]
+            get_ballot_boxes(poll_ids[1:])
+            self.assertNotIn(poll_ids[0], ranked._boxes)
+            self.assertIsNot(get_ballot_boxes(poll_ids[:1])[poll_ids[0]], first)
+            self.assertNotIn(poll_ids[1], ranked._boxes)
+
+    def test_ranking_is_validated(self):
+        self.assertEqual(self.vote(self.voters[0], ["A", "a"]).status_code, 400)
+        self.assertEqual(self.vote(self.voters[0], ["Z"]).status_code, 400)
+        self.client.force_authenticate(self.voters[0])
+        response = self.client.post(
+            reverse("list-votes", args=[self.poll.poll_id]), {"option": "A"}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+# Measure the views themselves, not the anonymous response cache
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}})
+class EmbeddedResultsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email="owner@example.com")
+        cls.voters = User.objects.bulk_create(
+            [User(email=f"voter{i}@example.com") for i in range(4)]
+        )
+
+    def create_polls(self, count, poll_type=Poll.SINGLE_CHOICE):
+        polls = [
+            Poll.objects.create(owner=self.owner, title=f"Poll {i}", options=["a", "b"], poll_type=poll_type)
+            for i in range(count)
+        ]
+        Vote.objects.bulk_create([
+            Vote(poll=poll, voter=voter, option="b" if n % 2 else "a", ranking=[n % 2] if poll.is_ranked else None)
+            for poll in polls
+            for n, voter in enumerate(self.voters[:3])
+        ])
+        return polls
+
+    def test_list_embeds_results_when_requested(self):
+        self.create_polls(2)
+        response = self.client.get(reverse("list-polls-list"), {"include": "results"})
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data[0]["results"]
+        self.assertEqual(results["total_votes"], 3)
+        self.assertEqual(results["results"], [{"option": "a", "count": 2}, {"option": "b", "count": 1}])
+
+        response = self.client.get(reverse("list-polls-list"))
+        self.assertNotIn("results", response.data[0])
+
+    def test_list_query_count_does_not_depend_on_poll_count(self):
+        self.create_polls(2)
+        with self.assertNumQueries(2):
+            self.client.get(reverse("list-polls-list"), {"include": "results"})
+
+        self.create_polls(10)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("list-polls-list"), {"include": "results"})
+        self.assertEqual(len(response.data), 12)
+
+    def test_ranked_polls_share_one_ballot_query(self):
+        self.create_polls(2)
+        self.create_polls(5, poll_type=Poll.RANKED_CHOICE)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("list-polls-list"), {"include": "results"})
+
+        ranked = [poll for poll in response.data if poll["poll_type"] == Poll.RANKED_CHOICE]
+        self.assertEqual(len(ranked), 5)
+        self.assertEqual(ranked[0]["results"]["winner"], "a")
+        self.assertEqual(ranked[0]["results"]["total_votes"], 3)
+
+    def test_retrieve_embeds_results(self):
+        poll = self.create_polls(1)[0]
+        self.client.force_authenticate(self.owner)
+        response = self.client.get(reverse("list-polls-detail", args=[poll.poll_id]), {"include": "results"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"]["total_votes"], 3)
+
+
+class ResponseCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email="owner@example.com")
+        cls.voter = User.objects.create(email="voter@example.com")
+        cls.poll = Poll.objects.create(owner=cls.owner, title="Poll", options=["a", "b"])
+
+    def setUp(self):
+        cache.clear()
+
+    def get_votes(self, **extra):
+        return self.client.get(reverse("list-votes", args=[self.poll.poll_id]), **extra)
+
+    def test_anonymous_reads_are_cached(self):
+        first = self.get_votes()
+        self.assertEqual(first["X-Cache"], "MISS")
+        self.assertIn("Authorization", first["Vary"])
+
+        with self.assertNumQueries(0):
+            second = self.get_votes()
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.content, first.content)
+
+    def test_renderers_are_cached_apart(self):
+        html = self.get_votes(HTTP_ACCEPT="text/html")
+        self.assertTrue(html["Content-Type"].startswith("text/html"))
+
+        response = self.get_votes(HTTP_ACCEPT="application/json")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response["Content-Type"], "application/json")
+
+        response = self.get_votes(HTTP_ACCEPT="application/json")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn("Accept", response["Vary"])
+
+    def test_authenticated_reads_bypass_the_cache(self):
+        self.get_votes()
+        response = self.get_votes(HTTP_AUTHORIZATION="Bearer token")
+        self.assertNotIn("X-Cache", response)
+        self.assertIn("Authorization", response["Vary"])
+
+    def test_vote_invalidates_the_poll(self):
+        self.get_votes()
+        self.client.force_authenticate(self.voter)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("list-votes", args=[self.poll.poll_id]), {"option": "a"}, format="json")
+        self.client.force_authenticate(None)
+
+        response = self.get_votes()
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["real_time_results"]["total_votes"], 1)
+
+    def test_update_invalidates_detail_and_list(self):
+        detail_url = reverse("list-polls-detail", args=[self.poll.poll_id])
+        self.client.get(detail_url)
+        self.client.get(reverse("list-polls-list"))
+
+        self.client.force_authenticate(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(detail_url, {"title": "Renamed"}, format="json")
+        self.client.force_authenticate(None)
+
+        detail = self.client.get(detail_url)
+        self.assertEqual(detail["X-Cache"], "MISS")
+        self.assertEqual(detail.json()["title"], "Renamed")
+        self.assertEqual(self.client.get(reverse("list-polls-list"))["X-Cache"], "MISS")
+
+    def test_detail_is_cached_under_the_canonical_poll_id(self):
+        detail_url = reverse("list-polls-detail", args=[str(self.poll.poll_id).upper()])
+        self.assertEqual(self.client.get(detail_url)["X-Cache"], "MISS")
+
+        self.client.force_authenticate(self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(detail_url, {"title": "Renamed"}, format="json")
+        self.client.force_authenticate(None)
+
+        detail = self.client.get(detail_url)
+        self.assertEqual(detail["X-Cache"], "MISS")
+        self.assertEqual(detail.json()["title"], "Renamed")
+        # Not a poll id: answered, never cached
+        response = self.client.get(reverse("list-polls-detail", args=["not-a-uuid"]))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("X-Cache", response)
+
+    def test_deleting_a_user_invalidates_their_polls_and_votes(self):
+        other = Poll.objects.create(owner=self.voter, title="Other", options=["a", "b"])
+        Vote.objects.create(poll=self.poll, voter=self.voter, option="a")
+        detail_url = reverse("list-polls-detail", args=[other.poll_id])
+        self.client.get(detail_url)
+        self.get_votes()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.voter.delete()
+
+        self.assertEqual(self.client.get(detail_url).status_code, 404)
+        response = self.get_votes()
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["real_time_results"]["total_votes"], 0)
+
+
+class TimeOrderedKeyTests(APITestCase):
+    def test_new_rows_get_increasing_uuid7_keys(self):
+        owner = User.objects.create(email="owner@example.com")
+        polls = [Poll.objects.create(owner=owner, title=f"Poll {i}", options=["a", "b"]) for i in range(50)]
+        vote = Vote.objects.create(poll=polls[0], voter=owner, option="a")
+
+        keys = [poll.poll_id for poll in polls]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual({key.version for key in keys + [owner.user_id, vote.vote_id]}, {7})
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+    BREAKER_WINDOW=4,
+    BREAKER_MIN_REQUESTS=2,
+    BREAKER_OPEN_SECONDS=30,
+)
+class CircuitBreakerTests(APITestCase):
+    def setUp(self):
+        breaker.reset()
+        stale_responses.clear()
+        self.addCleanup(breaker.reset)
+        self.owner = User.objects.create(email="owner@example.com")
+        self.poll = Poll.objects.create(owner=self.owner, title="Live event", options=["a", "b"])
+        self.url = reverse("list-votes", args=[self.poll.poll_id])
+
+    def overload(self):
+        return mock.patch("polls.views.get_results", side_effect=OperationalError("canceling statement due to statement timeout"))
+
+    def test_serves_stale_results_while_open_and_recovers(self):
+        fresh = self.client.get(self.url)
+        self.assertNotIn("X-Stale", fresh)
+
+        with self.overload():
+            for _ in range(2):
+                response = self.client.get(self.url)
+                self.assertEqual(response["X-Stale"], "true")
+        self.assertEqual(breaker.state, "open")
+
+        # Open: answered from the local copy without touching the database
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.json(), fresh.json())
+        self.assertIn("Age", response)
+
+        # Once the open period is over, a successful probe closes the breaker
+        with mock.patch("polls.breaker.time.monotonic", return_value=breaker.opened_at + 31):
+            response = self.client.get(self.url)
+        self.assertNotIn("X-Stale", response)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_writes_get_503_while_open(self):
+        with self.overload():
+            for _ in range(2):
+                self.client.get(self.url)
+
+        self.client.force_authenticate(self.owner)
+        response = self.client.post(self.url, {"option": "a"}, format="json")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(int(response["Retry-After"]), 30)
+        self.assertFalse(self.poll.votes.exists())
+
+    def test_unknown_page_gets_503_while_open(self):
+        with self.overload():
+            for _ in range(2):
+                response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("Retry-After", response)
+
+
+@override_settings(THROTTLE_BUCKETS={"vote": {"user": ("1/min", 1)}})
+class VoteThrottlingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        owner = User.objects.create(email="owner@example.com")
+        self.polls = [Poll.objects.create(owner=owner, title=f"Poll {i}", options=["a", "b"]) for i in range(2)]
+        self.client.force_authenticate(User.objects.create(email="voter@example.com"))
+
+    def test_votes_are_limited_per_user(self):
+        responses = [
+            self.client.post(reverse("list-votes", args=[poll.poll_id]), {"option": "a"}, format="json")
+            for poll in self.polls
+        ]
+        self.assertEqual([response.status_code for response in responses], [201, 429])
+        self.assertEqual(responses[1]["Retry-After"], "60")
+        # Reads don't use up tokens
+        self.assertEqual(self.client.get(reverse("list-votes", args=[self.polls[1].poll_id])).status_code, 200)
+
+
+class VoteImportTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+        self.voters = [User.objects.create(email=f"voter{i}@example.com") for i in range(3)]
+        self.poll = Poll.objects.create(owner=self.owner, title="Kiosk", options=["yes", "no"])
+        Vote.objects.create(poll=self.poll, voter=self.voters[0], option="yes")
+        self.url = reverse("import-votes", args=[self.poll.poll_id])
+
+    def upload(self, content, name="ballots.csv"):
+        return self.client.post(self.url, {"file": SimpleUploadedFile(name, content.encode())}, format="multipart")
+
+    def test_owner_imports_ballots(self):
+        self.client.force_authenticate(self.owner)
+        ballots = (
+            "voter,option,timestamp\n"
+            "voter0@example.com,no,\n"       # Already voted
+            "voter1@example.com,no,\n"
+            "voter2@example.com,maybe,\n"    # Not an option
+            "stranger@example.com,yes,\n"    # Not registered
+            "voter2@example.com,yes,2001-01-01T00:00:00Z\n"  # Before the poll opened
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload(ballots)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["accepted"], 1)
+        self.assertEqual(response.data["rejected"], 4)
+        self.assertEqual(response.data["rejected_reasons"]["duplicate"], 1)
+        imported = self.poll.votes.get(voter=self.voters[1])
+        self.assertEqual(imported.option, "no")
+        self.assertEqual(imported.vote_id.version, 7)
+        self.assertEqual(totals()[SiteCounter.VOTES], 2)
+        event = VoteEvent.objects.get(poll_id=self.poll.poll_id, voter_id=self.voters[1].pk)
+        self.assertEqual((event.kind, event.option, event.at), (VoteEvent.VOTE_CAST, 1, imported.created_at))
+
+    def test_jsonl_keeps_earliest_ballot_per_voter(self):
+        self.client.force_authenticate(self.owner)
+        created = self.poll.created_at - timedelta(hours=1)
+        Poll.objects.filter(pk=self.poll.pk).update(created_at=created)
+        ballots = "\n".join([
+            f'{{"voter": "voter1@example.com", "option": "yes", "timestamp": "{(created + timedelta(minutes=2)).isoformat()}"}}',
+            f'{{"voter": "voter1@example.com", "option": "no", "timestamp": "{(created + timedelta(minutes=1)).isoformat()}"}}',
+        ])
+        response = self.upload(ballots, name="ballots.jsonl")
+        self.assertEqual(response.data["accepted"], 1)
+        self.assertEqual(self.poll.votes.get(voter=self.voters[1]).option, "no")
+
+    def test_jsonl_values_are_checked_like_votes(self):
+        self.client.force_authenticate(self.owner)
+        User.objects.create(email="voter3@example.com")
+        ballots = "\n".join([
+            '{"voter": "voter1@example.com", "option": ["yes"]}',
+            '{"voter": "voter2@example.com", "option": "yes", "timestamp": 1700000000}',
+            '{"voter": 42, "option": "yes"}',
+            '{"voter": "voter3@example.com", "option": "NO"}',
+        ])
+        response = self.upload(ballots, name="ballots.jsonl")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["accepted"], 1)
+        reasons = response.data["rejected_reasons"]
+        self.assertEqual((reasons["invalid_option"], reasons["invalid_timestamp"], reasons["invalid_voter"]), (1, 1, 1))
+        self.assertEqual(self.poll.votes.get(voter__email="voter3@example.com").option, "no")
+
+    def test_only_owner_can_import(self):
+        self.client.force_authenticate(self.voters[1])
+        response = self.upload("voter,option,timestamp\nvoter1@example.com,yes,\n")
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.poll.votes.filter(voter=self.voters[1]).exists())
+
+    def test_command_reports_unreadable_files(self):
+        for suffix, content in ((".jsonl", b'{"voter": "voter1@example.com"\n'), (".csv", b"voter,option\n\xff\n")):
+            with tempfile.NamedTemporaryFile(suffix=suffix) as source:
+                source.write(content)
+                source.flush()
+                with self.assertRaisesMessage(CommandError, "could not be read"):
+                    call_command("import_ballots", str(self.poll.poll_id), source.name, stdout=io.StringIO())
+
+    def test_import_while_archiving_is_retried_later(self):
+        self.client.force_authenticate(self.owner)
+        # What archive_votes adds to the hot partition until the poll's archive is attached
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            cursor.execute(
+                f"ALTER TABLE polls_vote_hot ADD CONSTRAINT polls_vote_archive_test_excluded "
+                f"CHECK (poll_id NOT IN ('{self.poll.poll_id}')) NOT VALID"
+            )
+        response = self.upload("voter,option,timestamp\nvoter1@example.com,yes,\n")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Retry-After"], "60")
+        self.assertFalse(self.poll.votes.filter(voter=self.voters[1]).exists())
+
+
+class VoteArchiveTests(APITestCase):
+    def setUp(self):
+        self.voters = [User.objects.create(email=f"voter{i}@example.com") for i in range(3)]
+        expired = timezone.now() - timedelta(days=90)
+        self.cold = Poll.objects.create(owner=self.voters[0], title="Cold", options=["a", "b"], expires_at=expired)
+        self.hot = Poll.objects.create(owner=self.voters[0], title="Hot", options=["a", "b"])
+        for poll in (self.cold, self.hot):
+            for voter in self.voters:
+                Vote.objects.create(poll=poll, voter=voter, option="a")
+        # Run the deferred FK checks now: the test transaction is still open when the
+        # command adds foreign keys, which Postgres refuses with pending trigger events
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+    def partitions(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tableoid::regclass::text, poll_id FROM polls_vote")
+            return {(table.startswith("polls_vote_archive_"), poll_id) for table, poll_id in cursor.fetchall()}
+
+    def test_archived_votes_are_still_served(self):
+        call_command("archive_votes", partial=True, stdout=io.StringIO())
+
+        self.assertEqual(self.partitions(), {(True, self.cold.poll_id), (False, self.hot.poll_id)})
+        response = self.client.get(reverse("list-votes", args=[self.cold.poll_id]))
+        self.assertEqual(response.data["real_time_results"]["total_votes"], 3)
+        # The unique constraint still holds inside the archive partition
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Vote.objects.create(poll=self.cold, voter=self.voters[0], option="b")
+
+    def test_attach_does_not_scan_the_hot_partition(self):
+        notices = []
+        handler = lambda notice: notices.append(notice.message_primary)  # noqa: E731
+        connection.ensure_connection()
+        connection.connection.add_notice_handler(handler)
+        self.addCleanup(connection.connection.remove_notice_handler, handler)
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL client_min_messages = debug1")
+        call_command("archive_votes", partial=True, stdout=io.StringIO())
+
+        # Both tables were checked before the attach (VALIDATE), not by it
+        self.assertIn('updated partition constraint for default partition "polls_vote_hot" is implied by '
+                      'existing constraints', notices)
+        self.assertTrue(any(notice.startswith("partition constraint for table") and "is implied" in notice
+                            for notice in notices))
+        # The CHECK constraints were only needed for the attach
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_constraint WHERE contype = 'c' AND conname LIKE '%%_excluded'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_failed_attach_puts_votes_back(self):
+        with connection.cursor() as cursor:
+            cursor_class = type(cursor)
+        execute = cursor_class.execute
+
+        def failing_attach(cursor, sql, params=None):
+            if "ATTACH PARTITION" in sql:
+                raise OperationalError("canceling statement due to lock timeout")
+            return execute(cursor, sql, params)
+
+        with mock.patch.object(cursor_class, "execute", failing_attach), \
+                self.assertRaises(OperationalError):
+            call_command("archive_votes", partial=True, stdout=io.StringIO())
+
+        self.assertEqual(self.partitions(), {(False, self.cold.poll_id), (False, self.hot.poll_id)})
+        self.assertEqual(Vote.objects.filter(poll=self.cold).count(), 3)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM pg_class WHERE relname LIKE 'polls_vote_archive_%%'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_small_batches_wait_for_later_runs(self):
+        out = io.StringIO()
+        call_command("archive_votes", stdout=out)
+        self.assertIn("Left 1 polls for a later run", out.getvalue())
+        self.assertEqual(self.partitions(), {(False, self.cold.poll_id), (False, self.hot.poll_id)})
+
+    def test_oldest_partitions_are_detached_over_the_limit(self):
+        call_command("archive_votes", partial=True, stdout=io.StringIO())
+        colder = Poll.objects.create(owner=self.voters[0], title="Colder", options=["a", "b"],
+                                     expires_at=timezone.now() - timedelta(days=60))
+        Vote.objects.create(poll=colder, voter=self.voters[0], option="a")
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        out = io.StringIO()
+        call_command("archive_votes", partial=True, max_partitions=1, stdout=out)
+
+        # The partition of the longer-expired poll made room for the new one
+        self.assertIn("over --max-partitions", out.getvalue())
+        self.assertEqual(self.partitions(), {(True, colder.poll_id), (False, self.hot.poll_id)})
+        self.assertEqual(totals()[SiteCounter.VOTES], 4)
+
+    def test_detach_removes_cold_partitions(self):
+        call_command("archive_votes", partial=True, detach_days=60, stdout=io.StringIO())
+
+        self.assertFalse(Vote.objects.filter(poll=self.cold).exists())
+        self.assertEqual(Vote.objects.filter(poll=self.hot).count(), 3)
+        self.assertEqual(totals()[SiteCounter.VOTES], 3)
+
+
+# Trends are flushed by the tests, so verify_ledger needn't wait for buffered votes
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+    TRENDING_FLUSH_INTERVAL=0,
+)
+class VoteLedgerTests(APITestCase):
+    def setUp(self):
+        hold_trend_scores(self)
+        self.owner = User.objects.create(email="owner@example.com")
+        self.voters = [User.objects.create(email=f"voter{i}@example.com") for i in range(4)]
+        self.polls = [
+            Poll.objects.create(owner=self.owner, title=f"Poll {i}", options=["a", "b", "c"]) for i in range(3)
+        ]
+        for poll in self.polls:
+            for n, voter in enumerate(self.voters):
+                Vote.objects.create(poll=poll, voter=voter, option=poll.options[n % 3])
+        trending.flush()
+
+    def verify(self):
+        out = io.StringIO()
+        call_command("verify_ledger", ranges=2, workers=1, stdout=out)
+        return out.getvalue()
+
+    def test_writes_are_recorded(self):
+        poll = self.polls[0]
+        self.client.force_authenticate(self.owner)
+        self.client.post(reverse("list-votes", args=[poll.poll_id]), {"option": "c"}, format="json")
+        trending.flush()  # Before its poll is gone
+        self.voters[0].delete()
+        self.client.delete(reverse("list-polls-detail", args=[poll.poll_id]))
+
+        kinds = list(VoteEvent.objects.filter(poll_id=poll.poll_id).order_by("event_id").values_list("kind", "option"))
+        self.assertEqual(kinds, [
+            (VoteEvent.POLL_CREATED, None),
+            *[(VoteEvent.VOTE_CAST, n % 3) for n in range(4)],
+            (VoteEvent.VOTE_CAST, 2),
+            (VoteEvent.VOTE_DELETED, None),
+            (VoteEvent.POLL_DELETED, None),
+        ])
+        # Live trends keep the deleted user's votes; everything else matches
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command("verify_ledger", ranges=1, workers=1, stdout=out)
+        [report] = out.getvalue().splitlines()
+        self.assertIn("default: 2 trend scores differ from the ledger", report)
+        self.assertIn(str(self.polls[1].poll_id), report)
+        call_command("replay_ledger", workers=1, stdout=io.StringIO())
+        self.assertIn("2 polls, 6 votes", self.verify())
+
+    def test_verify_reports_drift_and_replay_rebuilds(self):
+        Vote.objects.filter(voter=self.voters[1]).delete()  # Bypasses the ledger
+        PollTrend.objects.filter(poll=self.polls[0]).update(score=0)
+        SiteCounter.objects.filter(name=SiteCounter.POLLS).update(value=100)
+
+        with self.assertRaises(CommandError):
+            self.verify()
+
+        call_command("replay_ledger", ranges=2, workers=1, stdout=io.StringIO())
+        cast = VoteEvent.objects.filter(poll_id=self.polls[0].poll_id, kind=VoteEvent.VOTE_CAST)
+        expected = functools.reduce(trending.logaddexp, [trending.log_weight(event.at) for event in cast])
+        self.assertAlmostEqual(PollTrend.objects.get(poll=self.polls[0]).score, expected, places=6)
+        self.assertEqual(totals()[SiteCounter.POLLS], 3)
+        # The deleted votes are still cast as far as the ledger knows
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command("verify_ledger", ranges=1, workers=1, stdout=out)
+        self.assertIn("3 votes in the ledger are missing from the database", out.getvalue())
+        self.assertNotIn("trend", out.getvalue())
+
+    def vote(self, poll):
+        self.client.force_authenticate(User.objects.create(email=f"{uuid.uuid4().hex}@example.com"))
+        response = self.client.post(reverse("list-votes", args=[poll.poll_id]), {"option": "a"}, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def expected_score(self, poll):
+        cast = VoteEvent.objects.filter(poll_id=poll.poll_id, kind=VoteEvent.VOTE_CAST)
+        return functools.reduce(trending.logaddexp, [trending.log_weight(event.at) for event in cast])
+
+    def test_votes_buffered_elsewhere_are_counted_once_after_replay(self):
+        poll = self.polls[0]
+        self.vote(poll)
+        # Another worker's buffer: the replaying process only flushes its own
+        elsewhere, trending._pending = trending._pending, {}
+
+        call_command("replay_ledger", workers=1, stdout=io.StringIO())
+        self.vote(poll)
+        trending._pending[poll.poll_id][:0] = elsewhere[poll.poll_id]
+        trending.flush()
+
+        self.assertAlmostEqual(PollTrend.objects.get(poll=poll).score, self.expected_score(poll), places=6)
+        self.assertEqual(VoteEvent.objects.filter(poll_id=poll.poll_id, kind=VoteEvent.VOTE_CAST).count(), 6)
+        self.assertIn("3 polls, 14 votes", self.verify())
+
+    def test_votes_flushed_after_the_watermark_survive_replay(self):
+        poll = self.polls[0]
+        watermark = latest_event("default")
+        self.vote(poll)
+        trending.flush()
+
+        replay_range("default", None, None, watermark)
+
+        self.assertAlmostEqual(PollTrend.objects.get(poll=poll).score, self.expected_score(poll), places=6)
+
+    def test_verify_allows_for_buffered_votes(self):
+        self.vote(self.polls[0])
+        # None of the votes are flushed yet, which is fine while they are recent
+        with self.settings(TRENDING_FLUSH_INTERVAL=5):
+            self.assertIn("3 polls, 13 votes", self.verify())
+        with self.assertRaises(CommandError):
+            self.verify()
+
+    def test_votes_far_apart_are_folded(self):
+        # About 762 apart in log space, past where exp() underflows
+        later = timezone.now() + settings.TRENDING_HALF_LIFE * 1100
+        VoteEvent.objects.filter(poll_id=self.polls[2].poll_id, voter_id=self.voters[0].pk).update(at=later)
+
+        call_command("replay_ledger", ranges=1, workers=1, stdout=io.StringIO())
+        self.assertAlmostEqual(PollTrend.objects.get(poll=self.polls[2]).score, trending.log_weight(later))
+        self.assertIn("3 polls, 12 votes", self.verify())
+
+    def test_replay_resumes_after_interruption(self):
+        PollTrend.objects.all().delete()
+
+        def replay_once(*args):
+            if replayed:
+                raise OperationalError("connection lost")
+            replayed.append(args)
+            return replay_range(*args)
+
+        replayed = []
+        with mock.patch("polls.management.commands.replay_ledger.replay_range", replay_once), \
+                self.assertRaises(OperationalError):
+            call_command("replay_ledger", ranges=3, workers=1, stdout=io.StringIO())
+        replay = LedgerReplay.objects.get()
+        self.assertEqual(replay.checkpoints.filter(finished_at__isnull=False).count(), 1)
+
+        out = io.StringIO()
+        call_command("replay_ledger", resume=True, workers=1, stdout=out)
+        self.assertIn(f"Replaying 2 of {replay.checkpoints.count()} ranges.", out.getvalue())
+        replay.refresh_from_db()
+        self.assertIsNotNone(replay.finished_at)
+        self.assertEqual(totals()[SiteCounter.VOTES], 12)
+        self.assertEqual(PollTrend.objects.count(), 3)
+
+        with self.assertRaises(CommandError):
+            call_command("replay_ledger", resume=True, stdout=io.StringIO())
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class PollAdminTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.polls = seed_data(users=40, polls=30, votes_per_poll=25)
+        cls.admin = User.objects.create_superuser(email="admin@example.com", password="admin-password")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, **params):
+        return self.client.get(reverse(f"admin:polls_{model}_changelist"), params)
+
+    def test_changelists_stay_within_budget(self):
+        # Session, user, estimate, exact count below the threshold, and the page with its vote counts
+        with self.assertQueryBudget(5):
+            response = self.changelist("poll")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({poll._total_votes for poll in response.context["cl"].result_list}, {25})
+
+        with self.assertQueryBudget(5):
+            response = self.changelist("vote")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["cl"].result_list), 100)
+
+    def test_filters_by_typed_values(self):
+        response = self.changelist("poll", owner=self.users[1].email)
+        self.assertEqual(list(response.context["cl"].result_list), [self.polls[1]])
+        self.assertContains(response, f'value="{self.users[1].email}"')
+
+        response = self.changelist("vote", poll=str(self.polls[0].poll_id), option="red")
+        votes = response.context["cl"].result_list
+        self.assertEqual(len(votes), 7)
+        self.assertEqual({(vote.poll_id, vote.option) for vote in votes}, {(self.polls[0].poll_id, "red")})
+        # The other filter stays in the form
+        self.assertContains(response, '<input type="hidden" name="option" value="red">', html=True)
+
+        response = self.changelist("vote", poll="not-a-uuid")
+        self.assertRedirects(response, reverse("admin:polls_vote_changelist") + "?e=1", fetch_redirect_response=False)
+
+    def test_counts_are_estimated_above_the_threshold(self):
+        votes = Vote.objects.order_by("-created_at")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(EstimatedCountPaginator(votes, 100).count, votes.count())
+        self.assertTrue(queries[0]["sql"].startswith("EXPLAIN"))
+        self.assertIn("COUNT(", queries[1]["sql"])
+
+        with mock.patch.object(EstimatedCountPaginator, "threshold", 1), \
+                CaptureQueriesContext(connection) as queries:
+            count = EstimatedCountPaginator(votes, 100).count
+        self.assertEqual(len(queries), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(queries[0]["sql"])
+            self.assertEqual(count, cursor.fetchone()[0][0]["Plan"]["Plan Rows"])
+
+
+class ConsistentHashingTests(SimpleTestCase):
+    def test_adding_a_shard_only_moves_polls_to_it(self):
+        poll_ids = [uuid.uuid4() for _ in range(3000)]
+        before = {poll_id: db_for_poll(poll_id, ["default", "shard_1"]) for poll_id in poll_ids}
+        after = {poll_id: db_for_poll(poll_id, ["default", "shard_1", "shard_2"]) for poll_id in poll_ids}
+
+        moved = [poll_id for poll_id in poll_ids if before[poll_id] != after[poll_id]]
+        self.assertEqual({after[poll_id] for poll_id in moved}, {"shard_2"})
+        # Each shard ends up with roughly a third of the polls
+        for alias in ("default", "shard_1", "shard_2"):
+            self.assertAlmostEqual(list(after.values()).count(alias) / len(poll_ids), 1 / 3, delta=0.08)
+
+
+SHARDS = sorted(settings.DATABASES)
+
+
+@skipUnless(len(SHARDS) > 1, "Set POSTGRES_SHARD_URLS to run the sharding tests.")
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+    POLL_SHARDS=SHARDS,
+)
+class ShardingTests(APITestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        hold_trend_scores(self)
+        self.owner = User.objects.create(email="owner@example.com")
+        self.voter = User.objects.create(email="voter@example.com")
+        self.client.force_authenticate(self.owner)
+
+    def create_polls(self, count):
+        polls = []
+        for i in range(count):
+            response = self.client.post(
+                reverse("list-polls-list"), {"title": f"Poll {i}", "options": ["a", "b"]}, format="json"
+            )
+            self.assertEqual(response.status_code, 201)
+            polls.append(response.data["poll_id"])
+        return polls
+
+    def placement(self):
+        return {
+            str(poll_id): alias
+            for alias in SHARDS
+            for poll_id in Poll.objects.using(alias).values_list("pk", flat=True)
+        }
+
+    def test_polls_and_votes_live_on_their_shard(self):
+        poll_ids = self.create_polls(12)
+        placement = self.placement()
+        self.assertEqual(placement, {poll_id: db_for_poll(poll_id) for poll_id in poll_ids})
+        self.assertGreater(len(set(placement.values())), 1)
+
+        self.client.force_authenticate(self.voter)
+        for poll_id in poll_ids:
+            response = self.client.post(reverse("list-votes", args=[poll_id]), {"option": "b"}, format="json")
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data["real_time_results"]["total_votes"], 1)
+        for alias in SHARDS:
+            self.assertEqual(
+                set(Vote.objects.using(alias).values_list("poll_id", flat=True)),
+                set(Poll.objects.using(alias).values_list("pk", flat=True)),
+            )
+        self.assertEqual(self.client.get(reverse("site-stats")).data["total_votes"], 12)
+        self.assertEqual(len(self.client.get(reverse("list-polls-trending"), {"limit": 20}).data), 12)
+
+    def test_list_merges_shards_newest_first(self):
+        poll_ids = self.create_polls(12)
+
+        response = self.client.get(reverse("list-polls-list"), {"include": "results"})
+        self.assertEqual([item["poll_id"] for item in response.data], list(reversed(poll_ids)))
+        self.assertTrue(all(item["results"]["total_votes"] == 0 for item in response.data))
+
+        pages, url = [], reverse("list-polls-mine") + "?page_size=5"
+        while url:
+            page = self.client.get(url).data
+            pages.append([item["poll_id"] for item in page["results"]])
+            url = page["next"]
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual(sum(pages, []), list(reversed(poll_ids)))
+
+    def test_deleting_a_user_deletes_polls_on_every_shard(self):
+        self.create_polls(12)
+        self.owner.delete()
+        self.assertEqual(self.placement(), {})
+        call_command("verify_ledger", workers=1, stdout=io.StringIO())
+
+    def test_admin_reads_the_chosen_shard(self):
+        poll_ids = self.create_polls(12)
+        placement = self.placement()
+        self.client.force_login(User.objects.create(email="admin@example.com", is_staff=True, is_superuser=True))
+
+        for alias in SHARDS:
+            # Session and user on `default`, then the page and its owners there (joined) or from there
+            with self.assertNumQueries(5 if alias == "default" else 3):
+                response = self.client.get(reverse("admin:polls_poll_changelist"), {"shard": alias})
+            polls = response.context["cl"].result_list
+            self.assertEqual({str(poll.poll_id) for poll in polls},
+                             {poll_id for poll_id, shard in placement.items() if shard == alias})
+            self.assertEqual({poll.owner.email for poll in polls} - {"owner@example.com"}, set())
+            self.assertContains(response, f"?shard={alias}")
+            response = self.client.get(reverse("admin:polls_vote_changelist"), {"shard": alias})
+            self.assertEqual(response.status_code, 200)
+
+        # Changelist links don't say where the poll is
+        for poll_id in poll_ids:
+            response = self.client.get(reverse("admin:polls_poll_change", args=[poll_id]))
+            self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse("admin:polls_poll_changelist"), {"owner": "owner@example.com"})
+        self.assertEqual(len(response.context["cl"].result_list), list(placement.values()).count(SHARDS[0]))
+
+    def test_rebalance_moves_polls_to_a_new_shard(self):
+        with override_settings(POLL_SHARDS=SHARDS[:1]):
+            poll_ids = self.create_polls(12)
+            self.client.force_authenticate(self.voter)
+            for poll_id in poll_ids:
+                self.client.post(reverse("list-votes", args=[poll_id]), {"option": "a"}, format="json")
+        with connections[SHARDS[0]].cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        call_command("rebalance_shards", stdout=io.StringIO())
+        # Copied, not yet removed from the old shard
+        self.assertEqual(Poll.objects.using(SHARDS[0]).count(), 12)
+
+        call_command("rebalance_shards", prune=True, stdout=io.StringIO())
+        self.assertEqual(self.placement(), {poll_id: db_for_poll(poll_id) for poll_id in poll_ids})
+        self.assertGreater(len(set(self.placement().values())), 1)
+        for poll_id in poll_ids:
+            response = self.client.get(reverse("list-votes", args=[poll_id]))
+            self.assertEqual(response.data["real_time_results"]["total_votes"], 1)
+        self.assertEqual(totals()[SiteCounter.VOTES], 12)
+        # The ledger moved with the polls
+        call_command("verify_ledger", workers=1, stdout=io.StringIO())
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+    PASSWORD_HASHERS=FAST_PASSWORD_HASHERS,
+)
+class PollQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Maximum queries and serialized rows per poll endpoint, on a seeded data set.
+    Raise a budget only together with the change that needs it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.polls = seed_data(users=40, polls=30, votes_per_poll=25)
+        cls.owner = cls.users[0]
+        cls.poll = cls.polls[0]
+        cls.newcomer = cls.users[-1]  # Hasn't voted on anything
+
+    def authenticate(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_list(self):
+        with self.assertQueryBudget(1, 30):
+            response = self.client.get(reverse("list-polls-list"))
+        self.assertEqual(len(response.data), 30)
+
+    def test_list_with_results(self):
+        with self.assertQueryBudget(2, 30):
+            response = self.client.get(reverse("list-polls-list"), {"include": "results"})
+        self.assertEqual(response.data[0]["results"]["total_votes"], 25)
+
+    def test_retrieve(self):
+        with self.assertQueryBudget(1, 1):
+            self.client.get(reverse("list-polls-detail", args=[self.poll.poll_id]))
+
+    def test_retrieve_with_results(self):
+        with self.assertQueryBudget(2, 1):
+            self.client.get(reverse("list-polls-detail", args=[self.poll.poll_id]), {"include": "results"})
+
+    def test_mine(self):
+        self.authenticate(self.owner)
+        with self.assertQueryBudget(2, 20):
+            response = self.client.get(reverse("list-polls-mine"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_trending(self):
+        with self.assertQueryBudget(1, 10):
+            self.client.get(reverse("list-polls-trending"))
+
+    def test_create(self):
+        self.authenticate(self.owner)
+        with self.assertQueryBudget(6, 1):
+            response = self.client.post(
+                reverse("list-polls-list"), {"title": "New", "options": ["a", "b"]}, format="json"
+            )
+        self.assertEqual(response.status_code, 201)
+
+    def test_partial_update(self):
+        self.authenticate(self.owner)
+        with self.assertQueryBudget(5, 1):
+            response = self.client.patch(
+                reverse("list-polls-detail", args=[self.poll.poll_id]), {"title": "Renamed"}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_update(self):
+        self.authenticate(self.owner)
+        with self.assertQueryBudget(5, 1):
+            response = self.client.put(
+                reverse("list-polls-detail", args=[self.poll.poll_id]),
+                {"title": "Replaced", "options": ["red", "green"]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_destroy(self):
+        self.authenticate(self.owner)
+        with self.assertQueryBudget(8, 0):
+            response = self.client.delete(reverse("list-polls-detail", args=[self.poll.poll_id]))
+        self.assertEqual(response.status_code, 204)
+
+    def test_list_votes(self):
+        with self.assertQueryBudget(3, 25):
+            response = self.client.get(reverse("list-votes", args=[self.poll.poll_id]))
+        self.assertEqual(len(response.data["votes"]), 25)
+
+    def test_vote(self):
+        self.authenticate(self.newcomer)
+        with self.assertQueryBudget(9, 1):
+            response = self.client.post(
+                reverse("list-votes", args=[self.poll.poll_id]), {"option": "red"}, format="json"
+            )
+        self.assertEqual(response.status_code, 201)
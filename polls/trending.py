@@ -0,0 +1,177 @@
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+from .models import Poll, PollTrend
+from .sharding import across_shards, db_for_poll
+import atexit
+import functools
+import logging
+import math
+import os
+import threading
+
+# Scores are log(sum(exp(rate * (vote_time - EPOCH)))), so they only ever grow
+# and a single vote never has to touch the other polls' rows.
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+# Postgres raises on exp() underflow (below about -745) instead of returning 0;
+# exp(-700) is already far below what 1.0 + x can tell apart from 1.0
+MIN_EXPONENT = -700.0
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = {}  # poll_id -> [(buffered_at, log-space weight)] not yet written to the database
+_timer = None  # Flushes _pending TRENDING_FLUSH_INTERVAL after the first buffered vote
+
+
+def decay_rate():
+    return math.log(2) / settings.TRENDING_HALF_LIFE.total_seconds()
+
+
+def log_weight(when):
+    return decay_rate() * (when - EPOCH).total_seconds()
+
+
+def logaddexp(a, b):
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def current_score(log_score, now=None):
+    """
+    Convert a stored log-space score to the decayed score at `now`.
+    """
+    return math.exp(log_score - log_weight(now or timezone.now()))
+
+
+def record_vote(poll_id, when=None):
+    """
+    Buffer one vote for `poll_id`; buffered scores are flushed by a timer
+    within TRENDING_FLUSH_INTERVAL seconds, and when the process exits.
+    """
+    record_votes(poll_id, [when or timezone.now()])
+
+
+def record_votes(poll_id, times):
+    """
+    Buffer several votes for `poll_id`, cast at `times`.
+    """
+    if not times:
+        return
+    weight = functools.reduce(logaddexp, (log_weight(when) for when in times))
+    # Votes are buffered after they commit, so a ledger replay started later
+    # (PollTrend.replayed_at) has already counted them
+    with _lock:
+        _pending.setdefault(poll_id, []).append((timezone.now(), weight))
+    start_flush_timer()
+
+
+def start_flush_timer():
+    global _timer
+    with _lock:
+        if _timer is None:
+            _timer = threading.Timer(settings.TRENDING_FLUSH_INTERVAL, _flush_in_thread)
+            _timer.name = "flush-trends"
+            _timer.daemon = True
+            _timer.start()
+
+
+def stop_flush_timer():
+    global _timer
+    with _lock:
+        timer, _timer = _timer, None
+    if timer is not None:
+        timer.cancel()
+
+
+def _flush_in_thread():
+    global _timer
+    with _lock:
+        _timer = None
+    try:
+        flush()
+    except Exception:
+        logger.exception("Flushing trend scores failed")
+    finally:
+        connections.close_all()
+
+
+def flush_at_exit():
+    """
+    Write out what is still buffered when the process stops. Registered with
+    atexit, and called from gunicorn's worker_exit so recycled workers flush
+    while their connections and logging still work.
+    """
+    stop_flush_timer()
+    try:
+        flush()
+    except Exception:
+        logger.exception("Flushing trend scores failed")
+
+
+def _reset_after_fork():
+    # The parent flushes its own buffer, and its timer thread isn't copied
+    global _lock, _pending, _timer
+    _lock, _pending, _timer = threading.Lock(), {}, None
+
+
+atexit.register(flush_at_exit)
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def flush():
+    """
+    Add the buffered scores of this process to the persisted ones.
+    """
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+
+    for poll_id, entries in pending.items():
+        _flush_poll(poll_id, entries)
+
+
+def _flush_poll(poll_id, entries):
+    alias = db_for_poll(poll_id)
+    trends = PollTrend.objects.using(alias).filter(poll_id=poll_id)
+    while entries:
+        delta = Value(functools.reduce(logaddexp, (weight for _, weight in entries)))
+        # log(exp(score) + exp(delta)), computed atomically in the database
+        gap = Greatest(-Abs(F("score") - delta), Value(MIN_EXPONENT))
+        combined = Greatest(F("score"), delta) + Ln(Value(1.0) + Exp(gap))
+        oldest = min(buffered_at for buffered_at, _ in entries)
+        if trends.filter(Q(replayed_at__isnull=True) | Q(replayed_at__lte=oldest)).update(score=combined):
+            return
+
+        replayed = list(trends.values_list("replayed_at", flat=True))
+        if replayed:
+            # Replayed since some of these votes were buffered; only the later ones are missing
+            entries = [entry for entry in entries if replayed[0] is None or entry[0] >= replayed[0]]
+            continue
+        try:
+            with transaction.atomic(using=alias):
+                PollTrend.objects.using(alias).create(poll_id=poll_id, score=delta.value)
+            return
+        except IntegrityError:
+            # Created concurrently by another process (added to above), or the poll was deleted
+            if not Poll.objects.using(alias).filter(poll_id=poll_id).exists():
+                return
+
+
+def top_polls(limit=10):
+    """
+    Return (poll, score) pairs for the `limit` fastest-voted polls that are still open.
+    Reads walk the score index of each shard, so no votes are counted.
+    """
+    flush()
+    now = timezone.now()
+    trends = (
+        across_shards(PollTrend.objects.all()).select_related("poll")
+        .filter(Q(poll__expires_at__isnull=True) | Q(poll__expires_at__gt=now))
+        .order_by("-score")[:limit]
+    )
+    return [(trend.poll, current_score(trend.score, now)) for trend in trends]
@@ -1,5 +1,5 @@
 from django.urls import path, include
-from .views import PollModelViewSet, VoteModelViewSet
+from .views import PollModelViewSet, VoteModelViewSet, VoteImportView
 from rest_framework import routers
 
 router = routers.DefaultRouter()
@@ -8,4 +8,5 @@ router.register(r'polls', PollModelViewSet, basename="list-polls")
 urlpatterns = [
     path('', include(router.urls)),
     path('polls/<uuid:poll_id>/votes/', VoteModelViewSet.as_view(), name='list-votes'),
+    path('polls/<uuid:poll_id>/votes/import/', VoteImportView.as_view(), name='import-votes'),
 ]
\ No newline at end of file
@@ -1,10 +1,15 @@
 from django.db.models import Count
 from .models import Vote
+from .ranked import get_ballot_box, refresh_ballot_boxes
+from .sharding import group_by_shard
 
 def get_results(poll):
+    if poll.is_ranked:
+        return get_ranked_results(poll)
+
     # Count votes grouped by option
     vote_counts = (
-        Vote.objects.filter(poll=poll).values("option")
+        poll.votes.values("option")
         .annotate(count=Count("option"))
         .order_by("option")
     )
@@ -12,6 +17,38 @@ def get_results(poll):
     # Convert queryset into a dict for quick lookup
     counts_map = {vc["option"]: vc["count"] for vc in vote_counts}
 
+    return summarize_results(poll, counts_map)
+
+def get_results_for_polls(polls):
+    """
+    get_results for a whole page of polls, keyed by poll_id.
+    Single-choice polls share one grouped query and ranked polls one ballot query
+    per shard.
+    """
+    single = [poll for poll in polls if not poll.is_ranked]
+    ranked = [poll for poll in polls if poll.is_ranked]
+    results = {}
+
+    if single:
+        counts_maps = {poll.poll_id: {} for poll in single}
+        for alias, polls_on_shard in group_by_shard(single).items():
+            vote_counts = (
+                Vote.objects.using(alias).filter(poll__in=polls_on_shard).values("poll", "option")
+                .annotate(count=Count("option"))
+                .order_by()
+            )
+            for vc in vote_counts:
+                counts_maps[vc["poll"]][vc["option"]] = vc["count"]
+        for poll in single:
+            results[poll.poll_id] = summarize_results(poll, counts_maps[poll.poll_id])
+
+    boxes = refresh_ballot_boxes(ranked)
+    for poll in ranked:
+        results[poll.poll_id] = get_ranked_results(poll, boxes[poll.poll_id])
+
+    return results
+
+def summarize_results(poll, counts_map):
     # Make sure every option is included, even if it has 0 votes
     results = []
     for option in poll.options:
@@ -32,3 +69,42 @@ def get_results(poll):
         "is_expired": poll.is_expired
     }
 
+def get_ranked_results(poll, box=None):
+    # Tally the ballots incrementally kept for this poll by instant runoff;
+    # a box passed in was already refreshed
+    refresh = box is None
+    if refresh:
+        box = get_ballot_box(poll)
+    with box.lock:
+        if refresh:
+            box.refresh(poll)
+        rounds, winner = box.tally(len(poll.options))
+        total_votes = sum(box.counts.values())
+
+    round_results = []
+    for number, tally in enumerate(rounds, start=1):
+        round_results.append({
+            "round": number,
+            "results": [
+                {"option": option, "count": count}
+                for option, count in zip(poll.options, tally["counts"])
+                if count is not None
+            ],
+            "exhausted": tally["exhausted"],
+            "eliminated": poll.options[tally["eliminated"]] if tally["eliminated"] is not None else None,
+        })
+
+    # First preferences, in the same shape as single-choice results
+    first_round = rounds[0]["counts"] if rounds else [0] * len(poll.options)
+    results = [{"option": option, "count": count} for option, count in zip(poll.options, first_round)]
+
+    return {
+        "poll_id": str(poll.poll_id),
+        "title": poll.title,
+        "options": poll.options,
+        "results": results,
+        "total_votes": total_votes,
+        "is_expired": poll.is_expired,
+        "rounds": round_results,
+        "winner": poll.options[winner] if winner is not None else None,
+    }
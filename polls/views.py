@@ -1,37 +1,109 @@
 from rest_framework.generics import ListCreateAPIView
+from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.decorators import action
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.pagination import CursorPagination
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
 from .permissions import IsOwnerOrReadOnly
 from .models import Poll, Vote
-from .serializers import PollModelSerializer, VoteModelSerializer
-from .util import get_results
+from .serializers import PollModelSerializer, OwnerPollSerializer, VoteModelSerializer
+from .util import get_results, get_results_for_polls
+from . import trending
+from .ranked import forget_poll
+from .ballot_import import BallotImportError, PollArchivingError, import_ballots, read_ballots
+from .cache import LIST_SCOPE, AnonymousResponseCacheMixin, invalidate_poll, invalidate_poll_list
+from .breaker import CircuitBreakerMixin
+from .sharding import across_shards, db_for_poll
+from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
+from pathlib import Path
+import csv
+import io
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
-class PollModelViewSet(ModelViewSet):
+class OwnerPollPagination(CursorPagination):
+    # Keyset pagination walking the (owner, created_at) index
+    ordering = "-created_at"
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+include_param = openapi.Parameter(
+    "include", openapi.IN_QUERY, type=openapi.TYPE_STRING,
+    description="Set to `results` to embed each poll's real-time results."
+)
+
+class PollModelViewSet(AnonymousResponseCacheMixin, CircuitBreakerMixin, ModelViewSet):
     queryset = Poll.objects.all()
     permission_classes = [IsOwnerOrReadOnly]
     serializer_class = PollModelSerializer
 
+    def get_cache_scope(self, **kwargs):
+        if "pk" not in kwargs:
+            return LIST_SCOPE
+        # The router passes the raw URL segment; invalidation uses the canonical form
+        try:
+            return str(uuid.UUID(kwargs["pk"]))
+        except ValueError:
+            return None
+
+    def get_queryset(self):
+        if "pk" in self.kwargs:
+            # A single poll is read from its own shard
+            return Poll.objects.using(db_for_poll(self.kwargs["pk"]))
+        # Lists merge every shard's polls, newest first
+        return across_shards(Poll.objects.all())
+
     def perform_create(self, serializer):
-        poll = serializer.save(owner=self.request.user)
-        logger.info(f"Poll '{poll.title}' created by {self.request.user.email}")
+        # Site counters are updated by signals in the same transaction
+        with transaction.atomic():
+            poll = serializer.save(owner=self.request.user)
+        invalidate_poll_list()
+        logger.info("Poll '%s' created by %s", poll.title, self.request.user.email,
+                    extra={"event": "poll_created", "poll_id": poll.poll_id})
     
     def perform_update(self, serializer):
         poll = serializer.save(edited=True)
-        logger.info(f"Poll '{poll.title}' updated by {self.request.user.email}")
+        # Options may have been renamed or reordered
+        forget_poll(poll.poll_id)
+        invalidate_poll(poll.poll_id)
+        invalidate_poll_list()
+        logger.info("Poll '%s' updated by %s", poll.title, self.request.user.email,
+                    extra={"event": "poll_updated", "poll_id": poll.poll_id})
+
+    def includes_results(self):
+        return "results" in self.request.query_params.get("include", "").split(",")
+
+    def get_results_context(self, polls):
+        # Results for all polls at once instead of one get_results per poll
+        return {**self.get_serializer_context(), "results": get_results_for_polls(polls)}
 
     @swagger_auto_schema(
         operation_summary="List all polls",
         operation_description="Retrieve a list of all polls. Anyone can view polls, "
-                              "but only authenticated users can create. Polls are ordered by creation date."
+                              "but only authenticated users can create. Polls are ordered by creation date. "
+                              "Use `?include=results` to embed each poll's real-time results.",
+        manual_parameters=[include_param]
     )
     def list(self, request, *args, **kwargs):
-        return super().list(request, *args, **kwargs)
+        if not self.includes_results():
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        polls = list(page if page is not None else queryset)
+        serializer = self.get_serializer(polls, many=True, context=self.get_results_context(polls))
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
     @swagger_auto_schema(
         operation_summary="Create a new poll",
@@ -45,10 +117,17 @@ class PollModelViewSet(ModelViewSet):
         operation_summary="Retrieve a poll",
         operation_description="Retrieve the details of a specific poll by its ID. "
                               "Anyone can view poll details, including title, description, options, "
-                              "and expiry date. The response also includes owner information."
+                              "and expiry date. The response also includes owner information. "
+                              "Use `?include=results` to embed the poll's real-time results.",
+        manual_parameters=[include_param]
     )
     def retrieve(self, request, *args, **kwargs):
-        return super().retrieve(request, *args, **kwargs)
+        if not self.includes_results():
+            return super().retrieve(request, *args, **kwargs)
+
+        poll = self.get_object()
+        serializer = self.get_serializer(poll, context=self.get_results_context([poll]))
+        return Response(serializer.data)
 
     @swagger_auto_schema(
         operation_summary="Partially update a poll",
@@ -71,28 +150,87 @@ class PollModelViewSet(ModelViewSet):
         operation_description="Delete a poll by ID. Only the owner (or an admin) can delete their poll."
     )
     def destroy(self, request, *args, **kwargs):
-        poll = self.get_object()
-        logger.critical(f"Poll '{poll.title}' deleted by {request.user.email}")
         return super().destroy(request, *args, **kwargs)
 
-class VoteModelViewSet(ListCreateAPIView):
+    def perform_destroy(self, instance):
+        # Runs on the poll already fetched by destroy(), no second lookup
+        # Cached responses are dropped by polls.signals, also for cascaded deletes
+        forget_poll(instance.poll_id)
+        logger.critical("Poll '%s' deleted by %s", instance.title, self.request.user.email,
+                        extra={"event": "poll_deleted", "poll_id": instance.poll_id})
+        instance.delete()
+
+    @swagger_auto_schema(
+        operation_summary="List my polls",
+        operation_description="Retrieve the authenticated user's polls, newest first, with their total "
+                              "votes and leading option. Results are cursor paginated; follow the "
+                              "`next` link to get the following page."
+    )
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+        serializer_class=OwnerPollSerializer,
+        pagination_class=OwnerPollPagination,
+    )
+    def mine(self, request):
+        leading_option = (
+            Vote.objects.filter(poll=OuterRef("pk"))
+            .values("option")
+            .annotate(count=Count("*"))
+            .order_by("-count", "option")
+            .values("option")[:1]
+        )
+        polls = across_shards(Poll.objects.filter(owner=request.user)).annotate(
+            total_votes=Count("votes"),
+            leading_option=Subquery(leading_option),
+        )
+
+        page = self.paginate_queryset(polls)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @swagger_auto_schema(
+        operation_summary="List trending polls",
+        operation_description="Retrieve the open polls receiving the most votes recently, ranked by a "
+                              "vote velocity score that halves every few hours. Use `limit` (max 100) "
+                              "to control how many polls are returned."
+    )
+    @action(detail=False, methods=["get"])
+    def trending(self, request):
+        try:
+            limit = min(max(int(request.query_params.get("limit", 10)), 1), 100)
+        except ValueError:
+            return Response({"message": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        top = trending.top_polls(limit)
+        data = self.get_serializer([poll for poll, _ in top], many=True).data
+        for item, (_, score) in zip(data, top):
+            item["trending_score"] = round(score, 4)
+        return Response(data, status=status.HTTP_200_OK)
+
+class VoteModelViewSet(AnonymousResponseCacheMixin, CircuitBreakerMixin, ListCreateAPIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
     serializer_class = VoteModelSerializer
+    throttle_scope = "vote"  # Votes only; reads aren't throttled
+
+    def get_cache_scope(self, **kwargs):
+        return kwargs["poll_id"]
 
     def get_queryset(self):
         poll_id = self.kwargs["poll_id"]
-        return Vote.objects.filter(poll=poll_id)
+        return Vote.objects.using(db_for_poll(poll_id)).filter(poll=poll_id)
     
     def list(self, request, poll_id):
-        votes_per_poll = self.get_queryset()
-        serializer_votes = self.get_serializer(votes_per_poll, many=True)
-
         try:
-            poll = Poll.objects.get(poll_id=poll_id)
+            poll = Poll.objects.using(db_for_poll(poll_id)).get(poll_id=poll_id)
         except Poll.DoesNotExist:
-            logger.error(f"Poll with ID {poll_id} not found when listing votes.")
+            logger.error("Poll with ID %s not found when listing votes.", poll_id, extra={"poll_id": poll_id})
             return Response({"message": "Poll not found"}, status=status.HTTP_404_NOT_FOUND)
 
+        votes_per_poll = self.get_queryset()
+        serializer_votes = self.get_serializer(votes_per_poll, many=True, context={"poll": poll})
+
         real_time_results = get_results(poll)
 
         return Response(
@@ -105,26 +243,33 @@ class VoteModelViewSet(ListCreateAPIView):
     
     def create(self, request, poll_id):
         try:
-            poll = Poll.objects.get(poll_id=poll_id)
+            poll = Poll.objects.using(db_for_poll(poll_id)).get(poll_id=poll_id)
         except Poll.DoesNotExist:
-            logger.error(f"Vote attempt on non-existent poll {poll_id}")
+            logger.error("Vote attempt on non-existent poll %s", poll_id, extra={"poll_id": poll_id})
             return Response({"message": "Poll with that ID does not exist."}, status=status.HTTP_404_NOT_FOUND)
         
         if poll.is_expired:
-            logger.warning(f"User {request.user.email} tried voting on expired poll {poll_id}")
+            logger.warning("User %s tried voting on expired poll %s", request.user.email, poll_id,
+                           extra={"poll_id": poll_id})
             return Response({"message": "This poll has expired, you cannot vote."}, status=status.HTTP_400_BAD_REQUEST)
 
-        if Vote.objects.filter(poll=poll, voter=self.request.user).exists():
-            logger.warning(f"User {request.user.email} tried voting twice on poll {poll_id}")
+        if poll.votes.filter(voter=self.request.user).exists():
+            logger.warning("User %s tried voting twice on poll %s", request.user.email, poll_id,
+                           extra={"poll_id": poll_id})
             return Response({"message": "You have already voted for this poll."}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = self.get_serializer(data=request.data, context={"poll": poll})
         serializer.is_valid(raise_exception=True)
-        vote = serializer.save(poll=poll, voter=self.request.user)
+        # The vote's ledger event (polls.signals) is written in the same transaction
+        with transaction.atomic(using=poll._state.db):
+            vote = serializer.save(poll=poll, voter=self.request.user)
+        invalidate_poll(poll.poll_id)
+        trending.record_vote(poll.poll_id, vote.created_at)
 
         real_time_results = get_results(poll)
 
-        logger.info(f"User {request.user.email} voted '{vote.option}' on poll {poll_id}")
+        logger.info("User %s voted '%s' on poll %s", request.user.email, vote.option, poll_id,
+                    extra={"event": "vote_cast", "poll_id": poll_id})
  
         return Response(
             {
@@ -145,9 +290,66 @@ class VoteModelViewSet(ListCreateAPIView):
     @swagger_auto_schema(
         operation_summary="Cast a vote on a poll",
         operation_description="Cast a vote for one of the poll's options. "
+                              "On ranked-choice polls, send `ranking` (option names in order of preference) "
+                              "instead of `option`. "
                               "Only authenticated users can vote. "
                               "Users can vote once per poll, and cannot vote on expired polls."
     )
     def post(self, request, *args, **kwargs):
         return self.create(request, *args, **kwargs)
 
+
+class VoteImportView(CircuitBreakerMixin, APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    @swagger_auto_schema(
+        operation_summary="Import offline ballots",
+        operation_description="Upload ballots collected offline (e.g. at a kiosk) as a CSV file with a "
+                              "`voter,option,timestamp` header, or as JSONL (`.jsonl`). `voter` is the voter's email "
+                              "and `timestamp` (ISO 8601, optional) must fall while the poll was open. "
+                              "Only the poll owner or staff can import. Voters who already voted are rejected. "
+                              "Single-choice polls only.",
+        manual_parameters=[
+            openapi.Parameter("file", openapi.IN_FORM, type=openapi.TYPE_FILE, required=True,
+                              description="CSV or JSONL file of ballots."),
+        ],
+        responses={
+            200: openapi.Response("Accepted and rejected ballot counts"),
+            400: "Missing or unreadable file, or a ranked-choice poll",
+            403: "Not the poll owner",
+            404: "Poll not found",
+            409: "The poll's votes are being archived; retry after `Retry-After` seconds",
+        }
+    )
+    def post(self, request, poll_id):
+        try:
+            poll = Poll.objects.using(db_for_poll(poll_id)).get(poll_id=poll_id)
+        except Poll.DoesNotExist:
+            return Response({"message": "Poll with that ID does not exist."}, status=status.HTTP_404_NOT_FOUND)
+
+        if poll.owner_id != request.user.pk and not request.user.is_staff:
+            return Response({"message": "Only the poll owner can import ballots."}, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"message": "Upload the ballots as `file`."}, status=status.HTTP_400_BAD_REQUEST)
+
+        jsonl = Path(upload.name).suffix.lower() in (".jsonl", ".ndjson")
+        lines = io.TextIOWrapper(upload.file, encoding="utf-8", newline="")
+        try:
+            result = import_ballots(poll, read_ballots(lines, jsonl=jsonl))
+        except PollArchivingError as error:
+            return Response({"message": str(error)}, status=status.HTTP_409_CONFLICT,
+                            headers={"Retry-After": str(error.retry_after)})
+        except BallotImportError as error:
+            return Response({"message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        except (csv.Error, ValueError) as error:
+            # ValueError covers undecodable bytes and malformed JSON lines
+            logger.warning("Unreadable ballot file for poll %s: %s", poll_id, error, extra={"poll_id": poll_id})
+            return Response({"message": "The ballot file could not be read."}, status=status.HTTP_400_BAD_REQUEST)
+
+        logger.info("User %s imported %s ballots into poll %s (%s rejected)", request.user.email,
+                    result["accepted"], poll_id, result["rejected"],
+                    extra={"event": "ballots_imported", "poll_id": poll_id})
+        return Response(result, status=status.HTTP_200_OK)
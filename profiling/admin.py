@@ -0,0 +1,75 @@
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
+from .models import RequestProfile
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        "created_at",
+        "method",
+        "path",
+        "status_code",
+        "duration_ms",
+        "query_count",
+        "query_time_ms",
+        "user",
+    )
+    list_filter = ("method", "status_code", "created_at")
+    list_select_related = ("user",)
+    search_fields = ("path",)
+    fields = (
+        "created_at",
+        "user",
+        "method",
+        "path",
+        "status_code",
+        "duration_ms",
+        "query_count",
+        "query_time_ms",
+        "download",
+        "call_stats",
+        "queries",
+    )
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path(
+                "<path:object_id>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="profiling_requestprofile_download",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def download_view(self, request, object_id):
+        profile = self.get_object(request, object_id)
+        if profile is None or not profile.stats_path.exists():
+            raise Http404("Profile not found.")
+        return FileResponse(open(profile.stats_path, "rb"), as_attachment=True, filename=profile.stats_path.name)
+
+    def download(self, obj):
+        url = reverse("admin:profiling_requestprofile_download", args=[obj.pk])
+        return format_html('<a href="{}">{}</a> (open with snakeviz or pstats)', url, obj.stats_path.name)
+    download.short_description = "cProfile data"
+
+    def call_stats(self, obj):
+        return format_html('<pre style="white-space: pre; overflow-x: auto">{}</pre>', obj.format_stats())
+    call_stats.short_description = "Top functions (cumulative)"
+
+    def queries(self, obj):
+        rows = format_html_join(
+            "\n", '<li><b>{:.2f} ms</b> [{}] <code>{}</code></li>',
+            ((query["time"] * 1000, query["alias"], query["sql"]) for query in obj.load_queries()),
+        )
+        return format_html("<ol>{}</ol>", rows)
+    queries.short_description = "SQL queries"
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
@@ -0,0 +1,136 @@
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .models import RequestProfile
+import cProfile
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILE_PARAM = "profile"
+
+# Since Python 3.12 cProfile hooks the whole process, so a second profiler can't be
+# enabled while one runs (and each profile also sees the other threads' calls).
+# One request is profiled at a time; the others are served unprofiled.
+_profiling = threading.Lock()
+_pruning = threading.Lock()
+
+
+def wants_profile(request):
+    return request.META.get(PROFILE_HEADER) == "1" or request.GET.get(PROFILE_PARAM) == "1"
+
+
+def prune_profiles():
+    """
+    Delete all but the newest PROFILE_RETENTION profiles, with their files.
+    """
+    if not _pruning.acquire(blocking=False):
+        return
+    try:
+        for stale in RequestProfile.objects.all()[settings.PROFILE_RETENTION:]:
+            stale.delete()
+    finally:
+        _pruning.release()
+
+
+def _prune_in_thread():
+    try:
+        prune_profiles()
+    except Exception:
+        logger.exception("Pruning request profiles failed")
+    finally:
+        connections.close_all()
+
+
+def start_pruning():
+    threading.Thread(target=_prune_in_thread, name="prune-profiles", daemon=True).start()
+
+
+def staff_user(request):
+    """
+    The staff user behind the request, from the admin session or a JWT, else None.
+    """
+    if request.user.is_authenticated:
+        return request.user if request.user.is_staff else None
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    if authenticated and authenticated[0].is_staff:
+        return authenticated[0]
+    return None
+
+
+class ProfilingMiddleware:
+    """
+    Profile a request with cProfile and record its SQL when a staff user sends
+    `X-Profile: 1` or `?profile=1`. Profiles are stored in PROFILE_DIR, listed in
+    the admin, and the response carries their id in `X-Profile-Id`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not wants_profile(request):
+            return self.get_response(request)
+        user = staff_user(request)
+        if user is None:
+            return self.get_response(request)
+        if not _profiling.acquire(blocking=False):
+            logger.info("Not profiling %s %s: another request is being profiled", request.method, request.path,
+                        extra={"event": "profile_skipped"})
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            with ExitStack() as stack:
+                # Every configured database, so queries routed to other aliases are kept too
+                captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                started = time.perf_counter()
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+                duration = time.perf_counter() - started
+        finally:
+            _profiling.release()
+
+        queries = [
+            {"alias": context.connection.alias, "sql": query["sql"], "time": float(query["time"])}
+            for context in captured
+            for query in context.captured_queries
+        ]
+        profile = self.save(request, response, user, profiler, queries, duration)
+        response["X-Profile-Id"] = str(profile.profile_id)
+        return response
+
+    def save(self, request, response, user, profiler, queries, duration):
+        profile = RequestProfile(
+            user=user,
+            method=request.method,
+            path=request.get_full_path()[:2000],
+            status_code=response.status_code,
+            duration_ms=duration * 1000,
+            query_count=len(queries),
+            query_time_ms=sum(query["time"] for query in queries) * 1000,
+        )
+        settings.PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(profile.stats_path)
+        with open(profile.queries_path, "w", encoding="utf-8") as target:
+            json.dump(queries, target)
+        profile.save()
+        # Retention runs on its own thread, off the request path
+        start_pruning()
+
+        logger.info("Profiled %s %s in %.1f ms (%s queries)", request.method, profile.path, profile.duration_ms,
+                    len(queries), extra={"event": "request_profiled"})
+        return profile
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import models
+from online_poll_system_backend.uuids import uuid7
+import io
+import json
+import pstats
+
+class RequestProfile(models.Model):
+    """
+    One profiled request. The cProfile data and the SQL queries live on disk in
+    PROFILE_DIR (`<id>.prof` and `<id>.json`); the row is what the admin lists.
+    """
+    profile_id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL, related_name='+')
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=2000)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    query_time_ms = models.FloatField()
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration_ms:.0f} ms)'
+
+    @property
+    def stats_path(self):
+        return settings.PROFILE_DIR / f'{self.profile_id}.prof'
+
+    @property
+    def queries_path(self):
+        return settings.PROFILE_DIR / f'{self.profile_id}.json'
+
+    def load_queries(self):
+        try:
+            with open(self.queries_path, encoding='utf-8') as source:
+                return json.load(source)
+        except FileNotFoundError:
+            return []
+
+    def format_stats(self, sort='cumulative', limit=60):
+        if not self.stats_path.exists():
+            return ''
+        output = io.StringIO()
+        pstats.Stats(str(self.stats_path), stream=output).strip_dirs().sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    def delete_files(self):
+        self.stats_path.unlink(missing_ok=True)
+        self.queries_path.unlink(missing_ok=True)
@@ -0,0 +1,8 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import RequestProfile
+
+@receiver(post_delete, sender=RequestProfile)
+def delete_profile_files(sender, instance, **kwargs):
+    # Also covers admin bulk deletes and the retention cleanup
+    instance.delete_files()
@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from polls.models import Poll
+from .middleware import _profiling, prune_profiles
+from .models import RequestProfile
+from pathlib import Path
+from unittest import mock
+import tempfile
+
+User = get_user_model()
+
+
+class ProfilingTests(APITestCase):
+    # Queries are captured on every configured database, shards included
+    databases = "__all__"
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PROFILE_DIR=Path(directory.name), PROFILE_RETENTION=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Pruning threads would not see the test transaction
+        pruning = mock.patch("profiling.middleware.start_pruning", prune_profiles)
+        pruning.start()
+        self.addCleanup(pruning.stop)
+
+        self.staff = User.objects.create(email="staff@example.com", is_staff=True, is_superuser=True)
+        self.member = User.objects.create(email="member@example.com")
+        self.poll = Poll.objects.create(owner=self.member, title="Poll", options=["a", "b"])
+        self.url = reverse("list-polls-detail", args=[self.poll.poll_id])
+
+    def authenticate(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_staff_request_is_profiled(self):
+        self.authenticate(self.staff)
+        response = self.client.get(self.url, HTTP_X_PROFILE="1")
+
+        profile = RequestProfile.objects.get(profile_id=response["X-Profile-Id"])
+        self.assertEqual(profile.user, self.staff)
+        self.assertEqual(profile.status_code, 200)
+        self.assertTrue(profile.stats_path.exists())
+        self.assertTrue(any("polls_poll" in query["sql"] for query in profile.load_queries()))
+        self.assertIn("cumulative", profile.format_stats())
+
+    def test_flag_is_ignored_for_other_users(self):
+        self.authenticate(self.member)
+        response = self.client.get(self.url, {"profile": "1"})
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_concurrent_requests_are_served_unprofiled(self):
+        self.authenticate(self.staff)
+        with _profiling:
+            response = self.client.get(self.url, HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertIn("X-Profile-Id", self.client.get(self.url, HTTP_X_PROFILE="1"))
+
+    def test_retention_removes_old_profiles(self):
+        self.authenticate(self.staff)
+        profiles = [self.client.get(self.url, {"profile": "1"})["X-Profile-Id"] for _ in range(3)]
+
+        remaining = {str(profile_id) for profile_id in RequestProfile.objects.values_list("profile_id", flat=True)}
+        self.assertEqual(remaining, set(profiles[1:]))
+        self.assertEqual(len(list(settings.PROFILE_DIR.glob("*.prof"))), 2)
+
+    def test_admin_shows_profile(self):
+        self.authenticate(self.staff)
+        profile_id = self.client.get(self.url, {"profile": "1"})["X-Profile-Id"]
+
+        self.client.credentials()
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("admin:profiling_requestprofile_change", args=[profile_id]))
+        self.assertContains(response, "SQL queries")
+        download = self.client.get(reverse("admin:profiling_requestprofile_download", args=[profile_id]))
+        self.assertTrue(b"".join(download.streaming_content))
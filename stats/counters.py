@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+from polls.models import Poll, Vote
+from polls.sharding import shard_aliases
+from .models import SiteCounter
+import random
+
+SLOTS = 16
+
+SCHEDULED_OPEN_KEY = "stats:scheduled-open-polls"
+
+
+def increment(**deltas):
+    """
+    Add to counters in a single statement, e.g. increment(polls=1, votes=-3).
+    Call it inside the transaction that makes the change being counted.
+    """
+    rows = [(name, random.randrange(SLOTS), delta) for name, delta in deltas.items() if delta]
+    if not rows:
+        return
+
+    table = SiteCounter._meta.db_table
+    placeholders = ", ".join(["(%s, %s, %s)"] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (name, slot, value) VALUES {placeholders} "
+            f"ON CONFLICT (name, slot) DO UPDATE SET value = {table}.value + EXCLUDED.value",
+            [value for row in rows for value in row],
+        )
+
+
+def lock_totals():
+    """
+    Lock every counter slot until the end of the transaction and return the
+    counters' totals. Increments wait for the locks, so the totals hold until then.
+    """
+    SiteCounter.objects.bulk_create(
+        [SiteCounter(name=name, slot=slot) for name in SiteCounter.NAMES for slot in range(SLOTS)],
+        ignore_conflicts=True,
+    )
+    counts = dict.fromkeys(SiteCounter.NAMES, 0)
+    for counter in SiteCounter.objects.select_for_update().order_by("name", "slot"):
+        counts[counter.name] += counter.value
+    return counts
+
+
+def overwrite(values):
+    """
+    Set the counters in `values` ({name: value}) to exactly that value.
+    Call it with the slots locked by lock_totals().
+    """
+    SiteCounter.objects.filter(name__in=values, slot__gt=0).update(value=0)
+    for name, value in values.items():
+        SiteCounter.objects.filter(name=name, slot=0).update(value=value)
+
+
+def totals():
+    counts = dict.fromkeys(SiteCounter.NAMES, 0)
+    for row in SiteCounter.objects.values("name").annotate(total=Sum("value")):
+        counts[row["name"]] = row["total"]
+    return counts
+
+
+def _scheduled_open():
+    # Only polls that haven't expired yet are scanned, through the expires_at index
+    now = timezone.now()
+    return sum(Poll.objects.using(alias).filter(expires_at__gt=now).count() for alias in shard_aliases())
+
+
+def site_stats():
+    counts = totals()
+    # Polls leave this count by expiring, which no write records; rather than counting
+    # on every shard per request, the count is shared by all workers for a few seconds
+    scheduled_open = cache.get_or_set(SCHEDULED_OPEN_KEY, _scheduled_open, settings.STATS_OPEN_POLLS_TIMEOUT)
+    return {
+        "total_polls": counts[SiteCounter.POLLS],
+        "total_votes": counts[SiteCounter.VOTES],
+        "active_polls": counts[SiteCounter.OPEN_ENDED_POLLS] + scheduled_open,
+        "registered_users": counts[SiteCounter.USERS],
+    }
+
+
+def exact_counts():
+    shards = shard_aliases()
+    return {
+        SiteCounter.POLLS: sum(Poll.objects.using(alias).count() for alias in shards),
+        SiteCounter.OPEN_ENDED_POLLS: sum(
+            Poll.objects.using(alias).filter(expires_at__isnull=True).count() for alias in shards
+        ),
+        SiteCounter.VOTES: sum(Vote.objects.using(alias).count() for alias in shards),
+        SiteCounter.USERS: get_user_model().objects.count(),
+    }
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from stats.counters import exact_counts, lock_totals, overwrite
+from stats.models import SiteCounter
+
+class Command(BaseCommand):
+    help = 'Recounts polls, votes and users and fixes any drift in the site counters.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # Writers block on the locked slots until the new totals are committed,
+            # so their increments land on top of the exact counts taken below
+            current = lock_totals()
+            exact = exact_counts()
+
+            for name in SiteCounter.NAMES:
+                drift = current[name] - exact[name]
+                if drift:
+                    self.stdout.write(self.style.WARNING(f"{name}: counter {current[name]}, actual {exact[name]}"))
+                else:
+                    self.stdout.write(f"{name}: {current[name]}")
+
+            overwrite(exact)
+
+        self.stdout.write(self.style.SUCCESS('Site counters reconciled.'))
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def seed_counters(apps, schema_editor):
+    SiteCounter = apps.get_model('stats', 'SiteCounter')
+    Poll = apps.get_model('polls', 'Poll')
+    Vote = apps.get_model('polls', 'Vote')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+
+    counts = {
+        'polls': Poll.objects.count(),
+        'open_ended_polls': Poll.objects.filter(expires_at__isnull=True).count(),
+        'votes': Vote.objects.count(),
+        'users': User.objects.count(),
+    }
+    SiteCounter.objects.bulk_create(
+        [SiteCounter(name=name, slot=0, value=value) for name, value in counts.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0001_initial'),
+        ('polls', '0004_poll_type_vote_ranking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import models
+from django.db.models import UniqueConstraint
+
+class SiteCounter(models.Model):
+    """
+    One slot of a site-wide counter. Each counter is spread over several slot
+    rows so concurrent increments don't all wait on the same row lock; the
+    counter's value is the sum of its slots.
+    """
+    POLLS = 'polls'
+    OPEN_ENDED_POLLS = 'open_ended_polls'  # Polls without an expiry date
+    VOTES = 'votes'
+    USERS = 'users'
+    NAMES = [POLLS, OPEN_ENDED_POLLS, VOTES, USERS]
+
+    name = models.CharField(max_length=50)
+    slot = models.PositiveSmallIntegerField()
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=['name', 'slot'], name='uq_site_counter_slot'),
+        ]
+
+    def __str__(self):
+        return f'{self.name}[{self.slot}] = {self.value}'
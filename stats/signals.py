@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from polls.models import Poll, Vote
+from polls.sharding import shard_aliases
+from .counters import increment
+
+User = get_user_model()
+
+# Counters are only adjusted from Poll and User deletes: a receiver on Vote
+# deletion would stop Django from fast-deleting cascaded votes. Votes removed
+# some other way are picked up by `manage.py reconcile_stats`.
+
+@receiver(post_save, sender=User)
+def count_new_user(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        increment(users=1)
+
+@receiver(pre_delete, sender=User)
+def uncount_user(sender, instance, **kwargs):
+    # Votes on the user's own polls are subtracted with those polls
+    votes = sum(
+        Vote.objects.using(alias).filter(voter=instance).exclude(poll__owner=instance).count()
+        for alias in shard_aliases()
+    )
+    increment(users=-1, votes=-votes)
+
+@receiver(pre_save, sender=Poll)
+def remember_poll_expiry(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._previous_expires_at = (
+        Poll.objects.using(instance._state.db).filter(pk=instance.pk).values_list("expires_at", flat=True).first()
+    )
+
+@receiver(post_save, sender=Poll)
+def count_poll(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    open_ended = instance.expires_at is None
+    if created:
+        increment(polls=1, open_ended_polls=int(open_ended))
+    elif hasattr(instance, "_previous_expires_at"):
+        was_open_ended = instance._previous_expires_at is None
+        increment(open_ended_polls=int(open_ended) - int(was_open_ended))
+        del instance._previous_expires_at
+
+@receiver(pre_delete, sender=Poll)
+def uncount_poll(sender, instance, **kwargs):
+    increment(
+        polls=-1,
+        open_ended_polls=-int(instance.expires_at is None),
+        votes=-instance.votes.count(),
+    )
+
+@receiver(post_save, sender=Vote)
+def count_vote(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        increment(votes=1)
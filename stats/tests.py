@@ -0,0 +1,97 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from online_poll_system_backend.testing import FAST_PASSWORD_HASHERS, QueryBudgetMixin, seed_data
+from polls.models import Poll, Vote
+from .counters import exact_counts, site_stats, totals
+from .models import SiteCounter
+from datetime import timedelta
+import io
+
+User = get_user_model()
+
+
+class SiteCounterTests(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+        self.voter = User.objects.create(email="voter@example.com")
+        self.poll = Poll.objects.create(owner=self.owner, title="Poll", options=["a", "b"])
+        Vote.objects.create(poll=self.poll, voter=self.owner, option="a")
+        Vote.objects.create(poll=self.poll, voter=self.voter, option="b")
+
+    def assertCountersExact(self):
+        self.assertEqual(totals(), exact_counts())
+
+    def test_counters_follow_writes(self):
+        self.assertCountersExact()
+
+        other_poll = Poll.objects.create(owner=self.voter, title="Other", options=["a", "b"])
+        Vote.objects.create(poll=other_poll, voter=self.owner, option="a")
+        self.assertCountersExact()
+
+        self.poll.delete()
+        self.assertCountersExact()
+
+        # Removes the voter, their poll and the owner's vote on it
+        self.voter.delete()
+        self.assertCountersExact()
+
+    def test_expiry_changes_update_open_ended_polls(self):
+        self.poll.expires_at = self.poll.created_at
+        self.poll.save()
+        self.assertCountersExact()
+
+        self.poll.expires_at = None
+        self.poll.save()
+        self.assertCountersExact()
+
+    def test_stats_endpoint(self):
+        response = self.client.get(reverse("site-stats"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            "total_polls": 1,
+            "total_votes": 2,
+            "active_polls": 1,
+            "registered_users": 2,
+        })
+
+    def test_reconcile_fixes_drift(self):
+        SiteCounter.objects.filter(name=SiteCounter.VOTES).update(value=100)
+        call_command("reconcile_stats", stdout=io.StringIO())
+        self.assertCountersExact()
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class SiteStatsQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_data(users=40, polls=30, votes_per_poll=25)
+        # Seeding bulk-inserts users and votes, which bypasses the signals
+        call_command("reconcile_stats", stdout=io.StringIO())
+
+    def setUp(self):
+        cache.clear()
+
+    def test_site_stats(self):
+        with self.assertQueryBudget(2):
+            response = self.client.get(reverse("site-stats"))
+        self.assertEqual(response.data["total_votes"], 750)
+
+        # The open polls are counted once for every worker, the counters are read each time
+        with self.assertNumQueries(1):
+            self.client.get(reverse("site-stats"))
+
+    def test_expired_polls_leave_active_polls_once_recounted(self):
+        owner = User.objects.first()
+        poll = Poll.objects.create(owner=owner, title="Closing", options=["a", "b"],
+                                   expires_at=timezone.now() + timedelta(hours=1))
+        active = site_stats()["active_polls"]
+
+        Poll.objects.filter(pk=poll.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(site_stats()["active_polls"], active)
+        cache.clear()
+        self.assertEqual(site_stats()["active_polls"], active - 1)
@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import SiteStatsView
+
+urlpatterns = [
+    path("", SiteStatsView.as_view(), name="site-stats"),
+]
@@ -0,0 +1,17 @@
+from rest_framework import status, views
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from drf_yasg.utils import swagger_auto_schema
+from .counters import site_stats
+
+# Site-wide totals for the landing page
+class SiteStatsView(views.APIView):
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        operation_summary="Site statistics",
+        operation_description="Total polls, total votes, active polls and registered users. "
+                              "Read from counters kept up to date on every write, so no table is counted."
+    )
+    def get(self, request):
+        return Response(site_stats(), status=status.HTTP_200_OK)
@@ -0,0 +1,143 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from stats.counters import increment
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import csv
+import json
+import os
+import time
+import django
+
+User = get_user_model()
+
+# Columns copied from the input file onto the user rows
+USER_FIELDS = ("first_name", "last_name", "username", "phone_number")
+
+
+def _init_worker():
+    # Spawned workers (macOS/Windows) start without Django configured
+    django.setup()
+
+
+def _hash_password(password):
+    return make_password(password)
+
+
+def read_rows(path):
+    """
+    Yield one dict per user from a CSV (with a header row) or JSONL file.
+    """
+    with open(path, newline="", encoding="utf-8") as source:
+        if Path(path).suffix.lower() in (".jsonl", ".ndjson"):
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(source)
+
+
+class Command(BaseCommand):
+    help = 'Bulk creates users from a CSV or JSONL file, hashing passwords in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file with at least "email" and "password" columns.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Users inserted per bulk_create batch.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes used for password hashing.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+
+        if not os.path.exists(path):
+            raise CommandError(f"File '{path}' does not exist.")
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+
+        stats = {"created": 0, "existing": 0, "invalid": 0, "rejected": 0}
+        seen_emails = set()
+        started = time.monotonic()
+
+        self.workers = options['workers'] or 1
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as pool:
+            batch = []
+            for row in read_rows(path):
+                user, password = self._parse_row(row)
+
+                # Same requirements as CustomUserManager.create_user
+                if user is None or user.email.lower() in seen_emails:
+                    stats["invalid"] += 1
+                    continue
+                seen_emails.add(user.email.lower())
+
+                # Same checks as registration through the API
+                try:
+                    validate_password(password, user)
+                except ValidationError:
+                    stats["rejected"] += 1
+                    continue
+
+                batch.append((user, password))
+                if len(batch) >= batch_size:
+                    self._insert_batch(pool, batch, stats)
+                    batch = []
+            if batch:
+                self._insert_batch(pool, batch, stats)
+
+        elapsed = time.monotonic() - started
+        rate = stats["created"] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {stats['created']} users in {elapsed:.1f}s ({rate:.0f} users/s). "
+            f"Skipped {stats['existing']} existing and {stats['invalid']} invalid or duplicate rows, "
+            f"and rejected {stats['rejected']} rows whose password failed validation."
+        ))
+
+    def _parse_row(self, row):
+        """
+        (unsaved user, password) for a row, or (None, None) when a value is missing
+        or isn't a string: JSONL values can be numbers, lists or objects.
+        """
+        if not isinstance(row, dict):
+            return None, None
+        email, password = row.get('email'), row.get('password')
+        fields = {field: row[field] for field in USER_FIELDS if row.get(field)}
+        if not all(isinstance(value, str) for value in (email, password, *fields.values())):
+            return None, None
+        email = User.objects.normalize_email(email.strip())
+        if not email or not password:
+            return None, None
+        return User(email=email, **fields), password
+
+    def _insert_batch(self, pool, batch, stats):
+        # Skip hashing for accounts that already exist
+        existing = set(
+            User.objects.filter(email__in=[user.email for user, _ in batch]).values_list('email', flat=True)
+        )
+        batch = [item for item in batch if item[0].email not in existing]
+        stats["existing"] += len(existing)
+        if not batch:
+            return
+
+        chunksize = max(1, len(batch) // (self.workers * 4))
+        hashes = pool.map(_hash_password, [password for _, password in batch], chunksize=chunksize)
+
+        users = []
+        for (user, _), hashed in zip(batch, hashes):
+            user.password = hashed
+            users.append(user)
+
+        # Rows inserted concurrently by another process are left untouched
+        with transaction.atomic():
+            User.objects.bulk_create(users, ignore_conflicts=True)
+            # bulk_create returns every object even when conflicts skipped some
+            # of them; keys are generated here, so only inserted rows carry one
+            created = User.objects.filter(pk__in=[user.pk for user in users]).count()
+            # bulk_create sends no post_save signals
+            increment(users=created)
+        stats["existing"] += len(users) - created
+        stats["created"] += created
+        self.stdout.write(f"Inserted batch of {created} users ({stats['created']} total).")
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-19 01:44
+
+import online_poll_system_backend.uuids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='user_id',
+            field=models.UUIDField(default=online_poll_system_backend.uuids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -1,6 +1,6 @@
-import uuid
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
+from online_poll_system_backend.uuids import uuid7
 
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **other_fields):
@@ -25,7 +25,7 @@ class CustomUserManager(BaseUserManager):
         return user
 
 class CustomUser(AbstractUser):
-    user_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user_id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     username = models.CharField(unique=False, max_length=50)
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import transaction
 
 User = get_user_model()
 
@@ -13,12 +14,15 @@ class RegisterUserSerializer(serializers.ModelSerializer):
 
     # Override the creation method to handle user creation logic
     def create(self, validated_data):
-        user = User.objects.create_user(**validated_data)
+        # Site counters are updated by signals in the same transaction
+        with transaction.atomic():
+            user = User.objects.create_user(**validated_data)
         return user
 
     def validate_password(self, value):
         if len(value) < 8:
             raise serializers.ValidationError("Password must be at least 8 characters long.")
+        return value
 
 # Serializer class for updating user profile
 class UpdateUserSerializer(serializers.ModelSerializer):
@@ -44,6 +48,7 @@ class UpdateUserSerializer(serializers.ModelSerializer):
     def validate_password(self, value):
         if len(value) < 8:
             raise serializers.ValidationError("password must have at least 8 charcters")
+        return value
 
 # Serializer class for user login
 class LoginUserSerializer(serializers.Serializer):
@@ -1,3 +1,191 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from online_poll_system_backend.testing import FAST_PASSWORD_HASHERS, TEST_PASSWORD, QueryBudgetMixin, seed_data
+from online_poll_system_backend import throttling
+from online_poll_system_backend.throttling import take
+from stats.counters import totals
+from stats.models import SiteCounter
+from unittest import mock
+import io
+import tempfile
 
-# Create your tests here.
+User = get_user_model()
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class AuthQueryBudgetTests(QueryBudgetMixin, APITestCase):
+    """
+    Maximum queries and serialized rows per auth endpoint, on a seeded data set.
+    Raise a budget only together with the change that needs it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.polls = seed_data(users=40, polls=30, votes_per_poll=25)
+        cls.user = cls.users[0]
+
+    def authenticate(self, user):
+        refresh = RefreshToken.for_user(user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        return refresh
+
+    def test_register(self):
+        data = {"email": "new@example.com", "username": "newcomer", "first_name": "New", "last_name": "User", "password": TEST_PASSWORD}
+        with self.assertQueryBudget(5, 1):
+            response = self.client.post(reverse("register"), data, format="json")
+        self.assertEqual(response.status_code, 201)
+
+    def test_login(self):
+        data = {"email": self.user.email, "password": TEST_PASSWORD}
+        with self.assertQueryBudget(2, 0):
+            response = self.client.post(reverse("login"), data, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_refresh(self):
+        refresh = RefreshToken.for_user(self.user)
+        with self.assertQueryBudget(13, 0):
+            response = self.client.post(reverse("token_refresh"), {"refresh": str(refresh)}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        refresh = self.authenticate(self.user)
+        with self.assertQueryBudget(8, 0):
+            response = self.client.post(reverse("logout"), {"refresh": str(refresh)}, format="json")
+        self.assertEqual(response.status_code, 205)
+
+    def test_update(self):
+        self.authenticate(self.user)
+        with self.assertQueryBudget(4, 1):
+            response = self.client.put(reverse("update"), {"first_name": "Renamed"}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_delete(self):
+        self.authenticate(self.user)
+        with self.assertQueryBudget(18, 0):
+            response = self.client.delete(reverse("delete"))
+        self.assertEqual(response.status_code, 204)
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_PASSWORD_HASHERS,
+    THROTTLE_BUCKETS={"login": {"ip": ("60/min", 100)}, "register": {"ip": ("1/hour", 2)}},
+    LOGIN_FAILURE_BUCKET=("1/hour", 3),
+)
+class ThrottlingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(email="member@example.com", password=TEST_PASSWORD)
+
+    def login(self, password):
+        return self.client.post(reverse("login"), {"email": self.user.email, "password": password}, format="json")
+
+    def test_failed_logins_lock_the_email_before_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login("wrong-password").status_code, 400)
+
+        with self.assertNumQueries(0), mock.patch.object(User, "check_password") as check_password:
+            response = self.login(TEST_PASSWORD)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "3600")
+        check_password.assert_not_called()
+
+        # Other accounts are unaffected
+        User.objects.create_user(email="other@example.com", password=TEST_PASSWORD)
+        response = self.client.post(reverse("login"), {"email": "other@example.com", "password": TEST_PASSWORD},
+                                    format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_register_is_limited_per_ip(self):
+        statuses = [
+            self.client.post(reverse("register"), {"email": f"new{i}@example.com"}, format="json").status_code
+            for i in range(3)
+        ]
+        self.assertEqual(statuses, [400, 400, 429])
+        response = self.client.post(reverse("register"), {}, format="json", REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 400)
+
+    def test_forwarded_for_is_ignored_without_proxies(self):
+        for i in range(2):
+            self.client.post(reverse("register"), {}, format="json")
+        response = self.client.post(reverse("register"), {}, format="json", HTTP_X_FORWARDED_FOR="10.0.0.3")
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache",
+                                           "LOCATION": "redis://127.0.0.1:6379/0"}})
+    def test_redis_takes_all_buckets_in_one_script_call(self):
+        script = mock.Mock(return_value=b"2.5")
+        with mock.patch.object(throttling, "_script", None), \
+                mock.patch("redis.Redis.register_script", return_value=script) as register_script:
+            wait = take([("throttle:a", "60/min", 2), ("throttle:b", "1/s", 5)], cost=1)
+        self.assertEqual(wait, 2.5)
+        register_script.assert_called_once_with(throttling.TOKEN_BUCKET_LUA)
+        script.assert_called_once()
+        self.assertEqual(len(script.call_args.kwargs["keys"]), 2)
+        self.assertEqual(script.call_args.kwargs["args"][1:], [1, 1.0, 2, 1.0, 5])
+
+    def test_buckets_refill_over_time(self):
+        buckets = [("throttle:test", "60/min", 2)]
+        with mock.patch("online_poll_system_backend.throttling.time.time", return_value=1000.0):
+            self.assertEqual([take(buckets) for _ in range(3)], [0, 0, 1.0])
+        with mock.patch("online_poll_system_backend.throttling.time.time", return_value=1001.0):
+            self.assertEqual(take(buckets), 0)
+            self.assertEqual(take(buckets), 1.0)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS)
+class BulkCreateUsersTests(APITestCase):
+    def run_command(self, content, suffix=".csv"):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix) as source:
+            source.write(content)
+            source.flush()
+            out = io.StringIO()
+            call_command("bulk_create_users", source.name, workers=1, stdout=out)
+        return out.getvalue()
+
+    def test_rows_inserted_concurrently_are_not_counted(self):
+        bulk_create = type(User.objects).bulk_create
+
+        def racing_bulk_create(manager, objs, **kwargs):
+            # Another process registers one of the emails after the existence check
+            User.objects.create_user(email="b@example.com", password=TEST_PASSWORD)
+            return bulk_create(manager, objs, **kwargs)
+
+        with mock.patch.object(type(User.objects), "bulk_create", racing_bulk_create):
+            out = self.run_command("email,password\na@example.com,secret-1\nb@example.com,secret-2\n")
+
+        self.assertIn("Created 1 users", out)
+        self.assertIn("Skipped 1 existing", out)
+        self.assertEqual(User.objects.count(), 2)
+        # One from the command, one from the signal on the concurrent create
+        self.assertEqual(totals()[SiteCounter.USERS], 2)
+
+    def test_passwords_failing_validation_are_rejected(self):
+        out = self.run_command(
+            "email,password,first_name\n"
+            "a@example.com,secret-1,\n"
+            "b@example.com,12345678,\n"       # Numeric and common
+            "c@example.com,short,\n"
+            "d@example.com,margaretta,Margaretta\n"  # Too similar to the name
+        )
+
+        self.assertIn("Created 1 users", out)
+        self.assertIn("rejected 3 rows", out)
+        self.assertEqual(list(User.objects.values_list("email", flat=True)), ["a@example.com"])
+
+    def test_jsonl_values_that_are_not_strings_are_invalid(self):
+        out = self.run_command("\n".join([
+            '{"email": "a@example.com", "password": 1234567890123}',
+            '{"email": "b@example.com", "password": "secret-2", "first_name": ["B"]}',
+            '["c@example.com", "secret-3"]',
+            '{"email": "d@example.com", "password": "secret-4"}',
+        ]), suffix=".jsonl")
+
+        self.assertIn("Created 1 users", out)
+        self.assertIn("3 invalid or duplicate rows", out)
+        self.assertTrue(User.objects.get(email="d@example.com").check_password("secret-4"))
@@ -6,7 +6,9 @@ from .serializers import RegisterUserSerializer, UpdateUserSerializer, LoginUser
 from rest_framework_simplejwt.tokens import RefreshToken
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
+from online_poll_system_backend.throttling import login_failure_wait, record_login_failure
 import logging
+import math
 
 logger = logging.getLogger(__name__)
 
@@ -14,13 +16,16 @@ User = get_user_model()  # Custom user model
 
 # Handle user registration logic
 class RegisterUserView(views.APIView):
+    throttle_scope = "register"
+
     @swagger_auto_schema(
         operation_summary="Register a user",
         operation_description="Register a new user.",
         request_body=RegisterUserSerializer,
         responses={
             201: openapi.Response('User registered successfully'),
-            400: 'Validation error'
+            400: 'Validation error',
+            429: 'Too many registrations from this address'
         }
     )
     def post(self, request):
@@ -31,22 +36,25 @@ class RegisterUserView(views.APIView):
         if serializer.is_valid():
             # Save the new user to the database if the data is valid
             user = serializer.save()
-            logger.info(f"New user registered: {user.email}")
+            logger.info("New user registered: %s", user.email, extra={"event": "register"})
             # Return a success message with HTTP status 201 (Created)
             return Response({"message": "User registered successfully"}, status=status.HTTP_201_CREATED)
         # If the serializer data is invalid, return the validation errors with HTTP status 400 (Bad Request)
-        logger.warning(f"User registration failed: {serializer.errors}")
+        logger.warning("User registration failed: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # Handle user login logic
 class LoginUserView(views.APIView):
+    throttle_scope = "login"
+
     @swagger_auto_schema(
         operation_summary="User Login",
         operation_description="Login a user and get JWT tokens.",
         request_body=LoginUserSerializer,
         responses={
             200: openapi.Response('JWT token returned'),
-            400: 'Invalid email or password'
+            400: 'Invalid email or password',
+            429: 'Too many login attempts'
         }
     )
     def post(self, request):
@@ -60,7 +68,15 @@ class LoginUserView(views.APIView):
     
         user_email = serializer.validated_data['email']
         user_password = serializer.validated_data['password']
-    
+
+        # Checked before the user lookup and password hashing that failed attempts cost
+        wait = login_failure_wait(user_email)
+        if wait:
+            logger.warning("Login for %s refused: too many failed attempts.", user_email,
+                           extra={"event": "login_throttled"})
+            return Response({"error": "Too many failed login attempts, try again later."},
+                            status=status.HTTP_429_TOO_MANY_REQUESTS, headers={"Retry-After": str(math.ceil(wait))})
+
         # Attempt to authenticate the user
         try:
             user = User.objects.get(email=user_email)
@@ -75,15 +91,17 @@ class LoginUserView(views.APIView):
                 refresh = RefreshToken.for_user(user)
                 access_token = refresh.access_token
 
-                logger.info(f"User {user_email} logged in successfully.")
+                logger.info("User %s logged in successfully.", user_email, extra={"event": "login"})
                 # Return the tokens
                 return Response({'user_data':user_data,'access': str(access_token),'refresh': str(refresh)})
 
-            logger.warning(f"Failed login attempt for {user_email}: wrong password.")
+            record_login_failure(user_email)
+            logger.warning("Failed login attempt for %s: wrong password.", user_email)
             return Response({"error": "Invalid password!"}, status=status.HTTP_400_BAD_REQUEST)
 
         except User.DoesNotExist:
-            logger.error(f"Failed login attempt: email {user_email} not found.")
+            record_login_failure(user_email)
+            logger.error("Failed login attempt: email %s not found.", user_email)
             return Response({"error": "Invalid email!"}, status=status.HTTP_400_BAD_REQUEST)
 
 # Handle user update logic
@@ -105,9 +123,9 @@ class UpdateUserView(views.APIView):
 
         if serializer.is_valid():
             serializer.save()   # Update the user
-            logger.info(f"User {request.user.email} updated their profile.")
+            logger.info("User %s updated their profile.", request.user.email)
             return Response(serializer.data, status=status.HTTP_200_OK)
-        logger.warning(f"Profile update failed for {request.user.email}: {serializer.errors}")
+        logger.warning("Profile update failed for %s: %s", request.user.email, serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # This view uses the refresh token to blacklist it on logout
@@ -126,16 +144,16 @@ class LogoutUserView(views.APIView):
     def post(self, request):
         serializer = LogoutUserSerializer(data=request.data)
         if not serializer.is_valid():
-            logger.warning(f"Logout failed for {request.user.email}: invalid serializer data.")
+            logger.warning("Logout failed for %s: invalid serializer data.", request.user.email)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         try:
             refresh_token = request.data["refresh"]
             token = RefreshToken(refresh_token)
             token.blacklist()
-            logger.info(f"User {request.user.email} logged out successfully.")
+            logger.info("User %s logged out successfully.", request.user.email, extra={"event": "logout"})
             return Response({"message": "Successfully logged out"}, status=status.HTTP_205_RESET_CONTENT)
         except Exception as error:
-            logger.error(f"Logout error for {request.user.email}: {str(error)}")
+            logger.error("Logout error for %s: %s", request.user.email, error)
             return Response({"error": "Invalid token or already blacklisted"}, status=status.HTTP_400_BAD_REQUEST)
         
 # Handle user delete logic
@@ -153,5 +171,5 @@ class DeleteUserView(views.APIView):
     def delete(self, request):
         email = request.user.email
         request.user.delete() # Delete the user
-        logger.critical(f"User {email} deleted their account.")
+        logger.critical("User %s deleted their account.", email)
         return Response({"message": "User has been deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file